@@ -1,6 +1,10 @@
 """
 灵犀·晓伴 版本发布系统 - GUI界面
 基于Tkinter的图形用户界面，实现版本发布的可视化操作
+窗口打开后在后台预取package中的源文件（预热缓存并计算指纹），开始发布或关闭窗口时取消
+输入版本号/日期时在后台计算发布计划（输出路径、大小、与已有文件的冲突），停止输入后再刷新预览
+模拟运行在后台线程中生成完整的发布计划（大小、空间检查、预计耗时）并一次性显示，不修改磁盘
+文件夹状态检查在后台线程中进行，结果按目录缓存（目录没有变化时不再重新列出），刷新期间显示上次结果并标记为刷新中；F5 全部重新扫描
 """
 
 import os
@@ -8,12 +12,20 @@ import re
 import shutil
 import subprocess
 import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from datetime import datetime
 from pathlib import Path
 from ctypes import windll
 
+from artifacts import SourcePrefetcher
+from rename_tool import (PackageIndexCache, format_plan, matching_release_dirs, plan_conflicts, plan_details,
+                         plan_outputs, plan_release)
+
+# 输入停止变化多久后刷新发布计划预览（毫秒）
+PREVIEW_DELAY_MS = 300
+
 
 def enable_dpi_awareness():
     """启用高DPI支持，解决Windows下字体模糊问题"""
@@ -78,11 +90,29 @@ class ReleaseSystemGUI:
         self.is_running = False
         self.execution_thread = None
         
+        # 后台预取源文件
+        self.prefetcher = SourcePrefetcher(on_update=self._on_prefetch_update)
+        
+        # 文件夹状态在后台线程中检查：package索引与各目录的列表缓存在内存中，没有变化时不再重新列目录
+        self.index_cache = PackageIndexCache()
+        self._dir_cache = {}
+        self._status_lock = threading.Lock()
+        self._status_refreshing = False
+        self._status_pending = None
+        
+        # 发布计划预览：输入变化时只重新计算路径
+        self._preview_after = None
+        self._preview_gen = 0
+        
         # 创建界面
         self.create_widgets()
+        self.root.protocol('WM_DELETE_WINDOW', self.on_close)
         
         # 初始化检查
         self.check_system_status()
+        
+        # 操作人员填写版本号/日期期间在后台预取源文件，窗口显示后再启动
+        self.root.after_idle(self.start_prefetch)
     
     def create_widgets(self):
         """创建所有界面组件"""
@@ -398,7 +428,7 @@ class ReleaseSystemGUI:
             var = tk.BooleanVar(value=True)
             self.platform_vars[key] = var
             
-            checkbox = tk.Checkbutton(frame, variable=var, text=f"  {desc}",
+            checkbox = tk.Checkbutton(frame, variable=var, text=f"  {desc}", command=self.update_summary,
                                     font=('Microsoft YaHei UI', self.font_sizes['label']),
                                     bg='#ffffff', fg='#2c3e50',
                                     activebackground='#ffffff', activeforeground='#2c3e50',
@@ -510,6 +540,24 @@ class ReleaseSystemGUI:
 
             self.summary_labels[key] = value_label
 
+        # 发布计划预览（后台计算）
+        preview_header = tk.Frame(summary_frame, bg='#f8f9fa')
+        preview_header.pack(fill=tk.X, padx=int(8 * self.scale_factor), pady=(int(6 * self.scale_factor), 0))
+        tk.Label(preview_header, text="输出预览:", font=('Microsoft YaHei UI', self.font_sizes['label']),
+                bg='#f8f9fa', fg='#636e72').pack(side=tk.LEFT)
+        self.preview_status = tk.Label(preview_header, text="等待配置...", font=('Microsoft YaHei UI', self.font_sizes['label'], 'bold'),
+                                      bg='#f8f9fa', fg='#3498db')
+        self.preview_status.pack(side=tk.RIGHT)
+
+        self.preview_text = scrolledtext.ScrolledText(summary_frame, height=8, wrap=tk.NONE,
+                                                      font=('Consolas', int(9 * self.scale_factor)),
+                                                      bg='#ffffff', fg='#2c3e50', relief='flat')
+        self.preview_text.pack(fill=tk.X, padx=int(8 * self.scale_factor), pady=(int(2 * self.scale_factor), int(8 * self.scale_factor)))
+        self.preview_text.tag_config('conflict', foreground='#e74c3c')
+        self.preview_text.tag_config('warning', foreground='#f39c12')
+        self.preview_text.tag_config('total', font=('Consolas', int(9 * self.scale_factor), 'bold'))
+        self.preview_text.config(state=tk.DISABLED)
+
         # 进度条
         tk.Label(panel, text="执行进度:", font=('Microsoft YaHei UI', self.font_sizes['section'], 'bold'),
                 bg='#ffffff', fg='#2c3e50').pack(anchor=tk.W, pady=(int(12 * self.scale_factor), int(6 * self.scale_factor)))
@@ -680,13 +728,133 @@ class ReleaseSystemGUI:
                     suxiaoban_files.append(file)
         return suxiaoban_files
     
-    def check_system_status(self):
-        """检查系统状态"""
-        self.log("正在检查系统状态...", 'info')
-        self.status_bar.config(text="检查系统状态中...")
+    def list_source_files(self, path):
+        """列出发布会复制的源文件：各pkg文件夹中的灵犀·晓伴.zip与Windows安装包"""
+        sources = []
+        for d in self.get_pkg_dirs(path):
+            zip_path = os.path.join(path, d, "灵犀·晓伴.zip")
+            if os.path.isfile(zip_path):
+                sources.append(zip_path)
+        sources.extend(os.path.join(path, f) for f in self.get_suxiaoban_setup_files(path))
+        return sources
+    
+    def start_prefetch(self):
+        """在后台预热源文件缓存并计算指纹（目录扫描也在后台线程中进行）"""
+        pkgpath = self.pkgpath
+        self.prefetcher.start(pkgpath, lambda: self.list_source_files(pkgpath))
+    
+    def _on_prefetch_update(self, status):
+        """预取线程的回调，只在结束时转到主线程记录一条日志"""
+        state = status['state']
+        if state == 'done':
+            mb = status['bytes'] / 1024 / 1024
+            msg = f"源文件预取完成: {status['total']} 个文件，{mb:.0f} MB，新计算指纹 {status['hashed']} 个"
+            level = 'info'
+        elif state == 'failed':
+            msg, level = f"源文件预取失败: {status['error']}", 'warning'
+        else:
+            return
         
+        def _log():
+            try:
+                self.log(msg, level)
+            except tk.TclError:
+                pass
+        self.root.after(0, _log)
+    
+    def on_close(self):
+        """关闭窗口：取消预取与正在执行的发布"""
+        self.prefetcher.cancel()
+        self.is_running = False
+        self.root.destroy()
+    
+    def _listdir_cached(self, path, force=False):
+        """列目录并按目录mtime缓存，目录没有变化时不再重新列出；目录不存在时返回None（在后台线程中调用）"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._status_lock:
+            cached = self._dir_cache.get(path)
+        if cached is not None and cached[0] == mtime and not force:
+            return cached[1]
+        entries = os.listdir(path)
+        with self._status_lock:
+            self._dir_cache[path] = (mtime, entries)
+        return entries
+    
+    def collect_system_status(self, force=False):
+        """收集各文件夹状态（在后台线程中调用），force=True时全部重新扫描"""
+        index = self.index_cache.get(self.pkgpath, refresh=force)
+        upgrade_files = self._listdir_cached(self.uppath, force)
+        help_files = self._listdir_cached(self.helppath, force)
+        if help_files is not None:
+            help_files = [f for f in help_files if f.endswith('.docx') or f.endswith('.json')]
+        existing_folders = [f for f in (self._listdir_cached(self.path, force) or [])
+                            if re.match(r'^灵犀·晓伴.*--.*', f)]
+        return {
+            'pkg_dirs': index['pkg_dirs'],
+            'upgrade': upgrade_files,
+            'help': help_files,
+            'existing_folders': existing_folders,
+        }
+    
+    def run_in_background(self, work, done):
+        """在工作线程中执行work()，完成后在主线程中调用done(result, error)"""
+        def _run():
+            try:
+                result, error = work(), None
+            except Exception as e:
+                result, error = None, e
+            
+            def _done():
+                try:
+                    done(result, error)
+                except tk.TclError:
+                    pass
+            self.root.after(0, _done)
+        threading.Thread(target=_run, daemon=True).start()
+    
+    def check_system_status(self, force=False):
+        """检查系统状态：在后台线程中扫描，期间状态栏保留上次结果并标记为刷新中"""
+        if self._status_refreshing:
+            # 正在刷新时合并请求，本轮结束后再刷新一次
+            if force:
+                self._status_pending = 'force'
+            elif not self._status_pending:
+                self._status_pending = 'normal'
+            return
+        self._status_refreshing = True
+        self.log("正在检查系统状态..." if not force else "正在重新扫描全部文件夹...", 'info')
+        self.status_bar.config(text="检查系统状态中（后台）...")
+        for label in self.status_labels.values():
+            text = label.cget('text').replace("（已过期）", "")
+            if text == "等待检查...":
+                label.config(text="检查中...")
+            elif not text.endswith("（刷新中）"):
+                label.config(text=f"{text}（刷新中）")
+            label.config(fg='#95a5a6')
+        self.run_in_background(lambda: self.collect_system_status(force), self._apply_system_status)
+    
+    def _apply_system_status(self, status, error):
+        """把后台收集到的状态显示到界面上"""
+        self._status_refreshing = False
+        if error is not None:
+            for label in self.status_labels.values():
+                label.config(text=label.cget('text').replace("（刷新中）", "（已过期）"))
+            self.log(f"检查系统状态失败: {error}", 'error')
+            self.status_bar.config(text="系统状态检查失败，显示的是上次的结果")
+        else:
+            self._show_system_status(status)
+            self.update_summary()
+            self.status_bar.config(text=f"系统状态检查完成（{datetime.now().strftime('%H:%M:%S')}）")
+        pending, self._status_pending = self._status_pending, None
+        if pending:
+            self.check_system_status(force=pending == 'force')
+    
+    def _show_system_status(self, status):
         # 检查package文件夹
-        pkg_dirs = self.get_pkg_dirs(self.pkgpath)
+        pkg_dirs = status['pkg_dirs']
         if pkg_dirs:
             self.status_labels['package'].config(
                 text=f"已找到 {len(pkg_dirs)} 个文件夹",
@@ -701,8 +869,8 @@ class ReleaseSystemGUI:
             self.log("Package文件夹: 未找到pkg文件夹", 'error')
         
         # 检查upgrade_package文件夹
-        if os.path.exists(self.uppath):
-            files = os.listdir(self.uppath)
+        files = status['upgrade']
+        if files is not None:
             if files:
                 self.status_labels['upgrade'].config(
                     text=f"有 {len(files)} 个升级包",
@@ -723,8 +891,8 @@ class ReleaseSystemGUI:
             self.log("Upgrade文件夹: 文件夹不存在", 'warning')
         
         # 检查help_documentation文件夹
-        if os.path.exists(self.helppath):
-            files = [f for f in os.listdir(self.helppath) if f.endswith('.docx') or f.endswith('.json')]
+        files = status['help']
+        if files is not None:
             self.status_labels['help'].config(
                 text=f"有 {len(files)} 个文档",
                 fg='#27ae60'
@@ -738,11 +906,7 @@ class ReleaseSystemGUI:
             self.log("帮助文档: 文件夹不存在", 'error')
         
         # 检查是否存在已发布的版本文件夹
-        existing_folders = []
-        for file in os.listdir('./'):
-            if re.match(r'^灵犀·晓伴.*--.*', file):
-                existing_folders.append(file)
-        
+        existing_folders = status['existing_folders']
         if existing_folders:
             self.status_labels['main_folder'].config(
                 text=f"已存在 {len(existing_folders)} 个版本文件夹",
@@ -755,9 +919,6 @@ class ReleaseSystemGUI:
                 fg='#27ae60'
             )
             self.log("主版本文件夹: 未创建", 'info')
-        
-        self.update_summary()
-        self.status_bar.config(text="系统状态检查完成")
     
     def update_summary(self):
         """更新操作概要"""
@@ -786,6 +947,78 @@ class ReleaseSystemGUI:
             self.summary_labels['sub_folders'].config(text="等待配置...")
             self.summary_labels['packages'].config(text="等待配置...")
             self.summary_labels['upgrades'].config(text="等待配置...")
+        
+        self.schedule_plan_preview()
+    
+    def get_package_index(self):
+        """返回缓存的package索引，有变化时重新扫描（在后台线程中调用）"""
+        return self.index_cache.get(self.pkgpath)
+    
+    def schedule_plan_preview(self):
+        """输入停止变化PREVIEW_DELAY_MS毫秒后再刷新计划预览，连续输入时只计算最后一次"""
+        if self._preview_after is not None:
+            self.root.after_cancel(self._preview_after)
+        self._preview_after = self.root.after(PREVIEW_DELAY_MS, self._start_plan_preview)
+    
+    def _start_plan_preview(self):
+        self._preview_after = None
+        self._preview_gen += 1
+        version = self.version_entry.get().strip()
+        date = self.date_entry.get().strip()
+        platforms = [key for key, var in self.platform_vars.items() if var.get()]
+        if not version or not re.match(r'^\d{8}$', date) or not platforms:
+            self._render_plan_preview(self._preview_gen, None, [], "等待配置...")
+            return
+        self.preview_status.config(text="计算中...", fg='#7f8c8d')
+        threading.Thread(target=self._plan_preview_thread, args=(self._preview_gen, version, date, platforms),
+                         daemon=True).start()
+    
+    def _plan_preview_thread(self, gen, version, date, platforms):
+        """后台计算发布计划并检查目标是否已存在，结果交给主线程显示"""
+        try:
+            plan = plan_release(self.get_package_index(), version, date, platforms,
+                                self.helppath, self.uppath, self.path)
+            existing = plan_conflicts(plan)
+            error = None
+        except Exception as e:
+            plan, existing, error = None, [], f"计算失败: {e}"
+        
+        def _render():
+            try:
+                self._render_plan_preview(gen, plan, existing, error)
+            except tk.TclError:
+                pass
+        self.root.after(0, _render)
+    
+    def _render_plan_preview(self, gen, plan, existing, message=None):
+        """一次性刷新预览内容；较早发起的计算结果直接丢弃"""
+        if gen != self._preview_gen:
+            return
+        self.preview_text.config(state=tk.NORMAL)
+        self.preview_text.delete('1.0', tk.END)
+        if plan is None:
+            self.preview_status.config(text=message, fg='#e74c3c' if message.startswith("计算失败") else '#3498db')
+        else:
+            existing = set(existing)
+            outputs = plan_outputs(plan)
+            lines = []
+            if plan['out_dir'] in existing:
+                lines.append((f"[已存在] {os.path.normpath(plan['out_dir'])}", 'conflict'))
+            for dst, src, size in outputs:
+                mark = "[已存在] " if dst in existing else ""
+                lines.append((f"{mark}{os.path.normpath(dst)}  {size / 1024 / 1024:.1f} MB",
+                              'conflict' if dst in existing else None))
+            for warning in plan['warnings']:
+                lines.append((f"警告: {warning}", 'warning'))
+            total = f"共 {len(outputs)} 个文件，合计 {plan['total_bytes'] / 1024 / 1024:.1f} MB"
+            lines.append((total, 'total'))
+            for text, tag in lines:
+                self.preview_text.insert(tk.END, text + "\n", tag or ())
+            if existing:
+                self.preview_status.config(text=f"{len(existing)} 项已存在", fg='#e74c3c')
+            else:
+                self.preview_status.config(text=f"{plan['total_bytes'] / 1024 / 1024:.1f} MB", fg='#27ae60')
+        self.preview_text.config(state=tk.DISABLED)
     
     def select_all_platforms(self):
         """全选所有平台"""
@@ -800,22 +1033,26 @@ class ReleaseSystemGUI:
         self.update_summary()
     
     def check_folders(self):
-        """检查文件夹状态"""
+        """检查文件夹状态（在后台线程中扫描，完成后弹出结果）"""
         self.log("开始检查文件夹状态...", 'info')
+        self.status_bar.config(text="检查文件夹中（后台）...")
+        self.run_in_background(self.collect_system_status, self._show_folder_check)
+    
+    def _show_folder_check(self, status, error):
+        self.status_bar.config(text="就绪")
+        if error is not None:
+            messagebox.showerror("检查结果", f"检查文件夹失败: {error}")
+            self.log(f"检查失败: {error}", 'error')
+            return
         
         # 检查package文件夹
-        pkg_dirs = self.get_pkg_dirs(self.pkgpath)
-        if not pkg_dirs:
+        if not status['pkg_dirs']:
             messagebox.showwarning("检查结果", "未找到pkg开头的文件夹，无法执行发布操作！")
             self.log("检查失败: 未找到pkg文件夹", 'error')
             return
         
         # 检查已存在的版本文件夹
-        existing_folders = []
-        for file in os.listdir('./'):
-            if re.match(r'^灵犀·晓伴.*--.*', file):
-                existing_folders.append(file)
-        
+        existing_folders = status['existing_folders']
         if existing_folders:
             message = f"检查完成，发现 {len(existing_folders)} 个已存在的版本文件夹：\n\n"
             for folder in existing_folders:
@@ -896,6 +1133,9 @@ class ReleaseSystemGUI:
                                    f"确定要执行版本发布流程吗？\n\n{version_text}"):
             return
         
+        # 发布本身会读取源文件，停止预取以免争用磁盘（已计算的指纹已写入缓存）
+        self.prefetcher.cancel()
+        
         # 启动执行线程
         self.is_running = True
         self.execute_btn.config(state=tk.DISABLED)
@@ -1124,33 +1364,71 @@ class ReleaseSystemGUI:
             self.root.after(0, lambda: self.status_bar.config(text="就绪"))
     
     def simulate_release(self):
-        """模拟运行"""
-        self.log("开始模拟运行...", 'info')
-        
-        steps = [
-            "检查package文件夹...",
-            "检查已存在的版本文件夹...",
-            f"创建主文件夹: 灵犀·晓伴_{self.version_entry.get()} --{self.date_entry.get()}",
-            "创建平台子文件夹...",
-            "复制安装包...",
-            "生成升级包...",
-            "复制帮助文档...",
-            "复制配置文件...",
-            "模拟完成: 所有操作成功"
-        ]
+        """模拟运行：在后台线程中生成完整的发布计划（大小、空间检查、预计耗时），完成后一次性显示，不修改磁盘"""
+        version = self.version_entry.get().strip()
+        date = self.date_entry.get().strip()
+        selected_platforms = [key for key, var in self.platform_vars.items() if var.get()]
+        if not version or not re.match(r'^\d{8}$', date):
+            messagebox.showerror("输入错误", "请输入版本号和YYYYMMDD格式的日期！")
+            return
+        if not selected_platforms:
+            messagebox.showerror("错误", "请至少选择一个目标平台！")
+            return
         
-        for i, step in enumerate(steps):
-            if not self.is_running:
-                break
-            self.log(f"[模拟] {step}", 'info')
-            self.progress_var.set((i + 1) / len(steps) * 100)
-            self.root.update()
-            self.root.after(300, lambda: None)
-            self.root.update()
-        
-        self.log("模拟运行完成", 'success')
-        self.progress_var.set(0)
-        self.progress_text.config(text="准备就绪")
+        folder_option = self.main_folder_var.get()
+        upgrade_option = self.upgrade_folder_var.get()
+        self.simulate_btn.config(state=tk.DISABLED)
+        self.progress_text.config(text="正在生成发布计划...")
+        self.log("开始模拟运行（生成发布计划）...", 'info')
+        
+        def _work():
+            start = time.perf_counter()
+            plan = plan_release(self.get_package_index(), version, date, selected_platforms,
+                                self.helppath, self.uppath, self.path)
+            # 与 _execute_release_thread 一致：删除/重命名当前目录下全部已存在的版本文件夹，“清空”删除 upgrade_package 中的内容
+            existing_folders = matching_release_dirs('./', r'^灵犀·晓伴.*--.*')
+            removed = existing_folders if folder_option == 'delete' else []
+            renamed = existing_folders if folder_option == 'rename' else []
+            if upgrade_option == 'clear' and os.path.isdir(self.uppath):
+                removed = removed + [self.uppath]
+            plan_details(plan, removed=removed, renamed=renamed)
+            return plan, time.perf_counter() - start
+        
+        def _done(result, error):
+            self.simulate_btn.config(state=tk.NORMAL)
+            self.progress_text.config(text="准备就绪")
+            if error is not None:
+                self.log(f"生成发布计划失败: {error}", 'error')
+                return
+            plan, elapsed = result
+            self._show_simulation(plan, elapsed, folder_option, upgrade_option)
+        
+        self.run_in_background(_work, _done)
+    
+    def _show_simulation(self, plan, elapsed, folder_option, upgrade_option):
+        """一次性输出发布计划，并指出实际执行时会失败的原因"""
+        details = plan['details']
+        notes = []
+        if folder_option == 'delete':
+            notes.append("删除已存在的版本文件夹")
+        elif folder_option == 'rename':
+            notes.append("重命名已存在的版本文件夹（追加 _oldN）")
+        if upgrade_option == 'clear':
+            notes.append(f"清空 {self.uppath}")
+        self.log(format_plan(plan, notes), 'info')
+        
+        problems = []
+        # details['existing'] 已去掉会被删除/重命名的文件夹，主文件夹仍在其中说明选择了“跳过”
+        if plan['out_dir'] in details['existing']:
+            problems.append(f"主文件夹已存在且选择了“跳过”，发布时无法创建: {os.path.normpath(plan['out_dir'])}")
+        for where, need, free in details['short']:
+            problems.append(f"磁盘空间不足: {where} 需要 {need / 1024 / 1024:.1f} MB，可用 {free / 1024 / 1024:.1f} MB")
+        for problem in problems:
+            self.log(f"[模拟] {problem}", 'error')
+        if problems:
+            self.log(f"模拟运行完成：发现 {len(problems)} 个问题（规划耗时 {elapsed * 1000:.0f} ms）", 'warning')
+        else:
+            self.log(f"模拟运行完成：未发现问题（规划耗时 {elapsed * 1000:.0f} ms）", 'success')
     
     def stop_execution(self):
         """停止执行"""
@@ -1196,7 +1474,7 @@ def main():
     
     # 添加快捷键
     root.bind('<Control-q>', lambda e: root.quit())
-    root.bind('<F5>', lambda e: app.check_system_status())
+    root.bind('<F5>', lambda e: app.check_system_status(force=True))
     root.bind('<Control-r>', lambda e: app.execute_release())
     
     root.mainloop()
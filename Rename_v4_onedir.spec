@@ -0,0 +1,53 @@
+# -*- mode: python ; coding: utf-8 -*-
+# 快速启动版：单目录（onedir）打包，不使用 UPX，并裁剪 Rename_v4.py 用不到的标准库模块。
+# 与 Rename_v4.spec（单文件 + UPX）相比，启动时无需把整个运行时解压到临时目录。
+# 构建：pyinstaller Rename_v4_onedir.spec  ->  dist/Rename_v4_onedir/Rename_v4.exe
+# 启动耗时对比：python startup_bench.py --console dist/Rename_v4.exe dist/Rename_v4_onedir/Rename_v4.exe
+
+
+a = Analysis(
+    ['Rename_v4.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        'tkinter', 'unittest', 'doctest', 'pydoc', 'pdb', 'lib2to3', 'distutils',
+        'setuptools', 'pip', 'xmlrpc', 'sqlite3', 'asyncio', 'multiprocessing',
+        'concurrent', 'ctypes',
+    ],
+    noarchive=False,
+    optimize=1,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [('u', None, 'OPTION')],
+    exclude_binaries=True,
+    name='Rename_v4',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='Rename_v4_onedir',
+)
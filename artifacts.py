@@ -0,0 +1,561 @@
+"""
+Artifact integrity helpers for the release tools (no tkinter dependency).
+- Streaming zip verification: read every entry and let zipfile check its CRC-32
+- ZipVerifier: verify several archives in worker processes while the copies run
+- HashPool: process-pool file hashing with a (path, size, mtime_ns) cache
+- FingerprintCache: persistent SQLite cache of (device, inode, size, mtime_ns) -> SHA-256
+- SourcePrefetcher: background page-cache warm-up and fingerprinting of the detected sources while the GUI form is filled in
+
+说明（中文）:
+构建共享盘偶尔会给出被截断或损坏的 灵犀·晓伴.zip，以前只能等用户反馈才发现。
+ - verify_zip(path)：逐个条目流式解压（不落盘、不整体读入内存），zipfile 在每个条目读完时校验 CRC-32，
+   截断、中央目录损坏、CRC 不一致都会被识别为失败；
+ - ZipVerifier：在进程池中并行校验多个数 GB 的压缩包（解压是 CPU 密集型操作，线程受 GIL 限制），
+   create_release 在复制每个源文件前提交校验任务，复制与校验同时进行；
+ - create_release(verify_sources=True) 在发布 releases.json 之前收集结果，发现坏包则删除由它复制出的文件并中止发布。
+ - HashPool：无法在复制时顺带计算校验和的场景（写入升级元数据、校验现有 upgrade_package）使用的进程池哈希服务。
+   按文件拆分任务（大文件优先），大文件通过 mmap、其余通过大缓冲区 readinto 读取；
+   结果按 (路径, 大小, mtime_ns) 缓存，重复校验未变化的文件立即返回。shared_hash_pool() 返回进程内共享实例。
+ - FingerprintCache：持久化的指纹缓存（SQLite），键为 (设备号, inode, 大小, mtime_ns)，值为 SHA-256。
+   HashPool、safe_copy（把源文件已知的指纹传给复制出的文件）、scan_package_index 与 GUI 共用同一个缓存文件；
+   大小或 mtime 变化的条目在查询时即删除，长期未使用的条目与超出容量的最旧条目在打开时清理；
+   使用 WAL 模式与忙等待超时，多个工具实例可以同时读写。缓存只是加速手段，数据库不可用时自动退化为不缓存。
+ - verify_upgrade_package(uppath)：按 upgrade_manifest.json 校验升级目录中每个包与差分的大小和 SHA-256。
+ - SourcePrefetcher：GUI 打开后立即在后台线程中列出源文件，对没有指纹的文件边读边计算 SHA-256（读取本身即预热页缓存），
+   已有指纹的文件只做预读（posix_fadvise WILLNEED；Windows 上顺序读一遍）。操作人员填写版本号、勾选平台的这段时间里
+   网络共享盘上的源文件就被读到本地缓存，之后的复制与升级元数据校验和都不必冷启动。
+   start(key, list_sources) 会取消上一轮预取（例如更换了 package 路径），cancel() 在关闭窗口或开始发布时调用。
+
+命令行:
+  python artifacts.py verify-zip package/pkg-*/灵犀·晓伴.zip
+  python artifacts.py hash upgrade_package/*.zip
+  python artifacts.py check-upgrade ./upgrade_package
+注意：打包为 exe 后使用进程池需要在入口处调用 multiprocessing.freeze_support()（rename_tool 已处理）。
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterable, List, Optional
+
+from release_delta import load_manifest
+
+VERIFY_CHUNK = 1024 * 1024
+HASH_BUFFER = 8 * 1024 * 1024
+# 不小于该大小的文件通过 mmap 交给 hashlib，避免逐块复制到用户态缓冲区
+MMAP_MIN_SIZE = 64 * 1024 * 1024
+FINGERPRINT_ENV = 'GERENZHUSHOU_FINGERPRINT_CACHE'
+
+
+def verify_zip(path: str, chunk_size: int = VERIFY_CHUNK) -> dict:
+    """流式读取 zip 的每个条目并校验 CRC，返回 {path, ok, entries, bytes, error}。
+
+    该函数运行在工作进程中，因此不抛出异常，而是把错误写入结果。
+    """
+    result = {'path': path, 'ok': False, 'entries': 0, 'bytes': 0, 'error': ''}
+    try:
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                # ZipExtFile 在读到条目末尾时比较 CRC，不一致时抛出 BadZipFile
+                with zf.open(info) as f:
+                    while f.read(chunk_size):
+                        pass
+                result['entries'] += 1
+                result['bytes'] += info.file_size
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, OSError,
+            NotImplementedError, RuntimeError) as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+    result['ok'] = True
+    return result
+
+
+class ZipVerifier:
+    """在进程池中并行校验 zip。submit() 立即返回，wait() 收集全部结果。
+
+    同一路径只会被校验一次；进程池在第一次 submit 时才创建，未使用时没有额外开销。
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor = None
+        self._futures = {}
+
+    def submit(self, path: str):
+        key = os.path.abspath(path)
+        if key in self._futures:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._futures[key] = (path, self._executor.submit(verify_zip, path))
+
+    def wait(self, should_stop: Optional[Callable[[], bool]] = None, poll: float = 0.2) -> Optional[List[dict]]:
+        """等待所有已提交的校验完成，返回结果列表；should_stop() 为真时取消剩余任务并返回 None。"""
+        results = []
+        for path, fut in self._futures.values():
+            while True:
+                if should_stop is not None and should_stop():
+                    self.shutdown(wait=False)
+                    return None
+                try:
+                    results.append(fut.result(timeout=poll))
+                    break
+                except FutureTimeout:
+                    continue
+                except Exception as e:
+                    # 工作进程异常退出（BrokenProcessPool 等）也视为校验失败
+                    results.append({'path': path, 'ok': False, 'entries': 0, 'bytes': 0,
+                                    'error': f'{type(e).__name__}: {e}'})
+                    break
+        return results
+
+    def shutdown(self, wait: bool = True):
+        for _, fut in self._futures.values():
+            fut.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+def hash_file(path: str, algorithm: str = 'sha256') -> str:
+    """计算文件摘要（十六进制）。大文件使用 mmap，其余使用可复用的大缓冲区 readinto。"""
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        else:
+            buf = bytearray(min(HASH_BUFFER, max(size, 1)))
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+    return h.hexdigest()
+
+
+class FingerprintCache:
+    """(设备号, inode, 大小, mtime_ns) -> 摘要 的持久化缓存，多线程、多进程安全。
+
+    每个线程使用独立的 SQLite 连接；写入失败（数据库被锁太久、目录只读等）只会导致缓存未命中，不影响调用方。
+    """
+
+    # mtime 距今小于该值的文件可能仍在写入（或在同一时间粒度内再次被修改），不写入缓存
+    SETTLE_NS = 2 * 1000 ** 3
+    # last_used 的刷新间隔，避免每次命中都产生写事务
+    TOUCH_INTERVAL = 3600
+
+    def __init__(self, path: str, max_entries: int = 50000, max_age_days: int = 90):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                         'dev TEXT NOT NULL, ino TEXT NOT NULL, algorithm TEXT NOT NULL, '
+                         'size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL, '
+                         'path TEXT, last_used INTEGER NOT NULL, PRIMARY KEY (dev, ino, algorithm))')
+        self.prune()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            except sqlite3.Error:
+                pass
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _identity(st: os.stat_result) -> Optional[tuple]:
+        # 某些文件系统不提供 inode（st_ino 为 0），无法可靠标识文件，不缓存
+        if not st.st_ino:
+            return None
+        return str(st.st_dev), str(st.st_ino)
+
+    def get(self, path: str, st: Optional[os.stat_result] = None, algorithm: str = 'sha256') -> Optional[str]:
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        ident = self._identity(st)
+        if ident is None:
+            return None
+        try:
+            conn = self._conn()
+            row = conn.execute('SELECT size, mtime_ns, digest, last_used FROM fingerprints '
+                               'WHERE dev=? AND ino=? AND algorithm=?', ident + (algorithm,)).fetchone()
+            if row is None:
+                return None
+            size, mtime_ns, digest, last_used = row
+            now = int(time.time())
+            with conn:
+                if size != st.st_size or mtime_ns != st.st_mtime_ns:
+                    # 文件已变化（或 inode 被新文件复用），该条目失效
+                    conn.execute('DELETE FROM fingerprints WHERE dev=? AND ino=? AND algorithm=?',
+                                 ident + (algorithm,))
+                    return None
+                if now - last_used > self.TOUCH_INTERVAL:
+                    conn.execute('UPDATE fingerprints SET last_used=? WHERE dev=? AND ino=? AND algorithm=?',
+                                 (now,) + ident + (algorithm,))
+            return digest
+        except sqlite3.Error:
+            return None
+
+    def put(self, path: str, digest: str, st: Optional[os.stat_result] = None, algorithm: str = 'sha256') -> bool:
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return False
+        ident = self._identity(st)
+        if ident is None or time.time_ns() - st.st_mtime_ns < self.SETTLE_NS:
+            return False
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO fingerprints '
+                             '(dev, ino, algorithm, size, mtime_ns, digest, path, last_used) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             ident + (algorithm, st.st_size, st.st_mtime_ns, digest,
+                                      os.path.abspath(path), int(time.time())))
+            return True
+        except sqlite3.Error:
+            return False
+
+    def prune(self):
+        """删除超过 max_age_days 未使用的条目，并把条目数限制在 max_entries 以内（先删最久未使用的）。"""
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute('DELETE FROM fingerprints WHERE last_used < ?', (int(time.time()) - self.max_age,))
+                conn.execute('DELETE FROM fingerprints WHERE rowid IN (SELECT rowid FROM fingerprints '
+                             'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def default_fingerprint_cache_path() -> str:
+    """缓存文件位置：环境变量 GERENZHUSHOU_FINGERPRINT_CACHE，否则为用户缓存目录下的 gerenzhushou/fingerprints.sqlite3。"""
+    env = os.environ.get(FINGERPRINT_ENV)
+    if env:
+        return env
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gerenzhushou', 'fingerprints.sqlite3')
+
+
+_default_cache = None
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+
+def default_fingerprint_cache() -> Optional[FingerprintCache]:
+    """返回进程内共享的持久化指纹缓存；无法打开时返回 None（调用方按无缓存处理）。"""
+    global _default_cache, _default_cache_failed
+    with _default_cache_lock:
+        if _default_cache is None and not _default_cache_failed:
+            try:
+                _default_cache = FingerprintCache(default_fingerprint_cache_path())
+            except (OSError, sqlite3.Error):
+                _default_cache_failed = True
+        return _default_cache
+
+
+class HashPool:
+    """进程池哈希服务：按文件拆分任务并行计算，结果按 (路径, 大小, mtime_ns) 缓存。
+
+    只有一个文件需要计算时直接在当前进程完成，避免启动工作进程的开销。线程安全。
+    传入 fingerprints（FingerprintCache）时，内存未命中会再查询持久化缓存，计算结果也会写回。
+    """
+
+    def __init__(self, workers: Optional[int] = None, algorithm: str = 'sha256',
+                 fingerprints: Optional[FingerprintCache] = None):
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.algorithm = algorithm
+        self.fingerprints = fingerprints
+        self._executor = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path: str) -> tuple:
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns, st
+
+    def hash_files(self, paths: Iterable[str],
+                   should_stop: Optional[Callable[[], bool]] = None) -> Optional[Dict[str, str]]:
+        """返回 {path: digest}；should_stop() 为真时取消未开始的任务并返回 None。"""
+        result = {}
+        pending = []
+        for path in paths:
+            key = self._key(path)
+            with self._lock:
+                digest = self._cache.get(key[:3])
+            if digest is None and self.fingerprints is not None:
+                digest = self.fingerprints.get(path, key[3], self.algorithm)
+                if digest is not None:
+                    self._remember(key, digest)
+            if digest is not None:
+                result[path] = digest
+            else:
+                pending.append((key[1], path, key))
+        if not pending:
+            return result
+        if len(pending) == 1 or self.workers <= 1:
+            for _, path, key in pending:
+                if should_stop is not None and should_stop():
+                    return None
+                result[path] = self._store(key, hash_file(path, self.algorithm))
+            return result
+
+        # 大文件优先提交，减少最后只剩一个大文件在单核上计算的尾部时间
+        pending.sort(key=lambda item: item[0], reverse=True)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+        futures = {executor.submit(hash_file, path, self.algorithm): (path, key) for _, path, key in pending}
+        remaining = set(futures)
+        while remaining:
+            if should_stop is not None and should_stop():
+                for fut in remaining:
+                    fut.cancel()
+                return None
+            done, remaining = wait(remaining, timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in done:
+                path, key = futures[fut]
+                result[path] = self._store(key, fut.result())
+        return result
+
+    def hash_file(self, path: str) -> str:
+        return self.hash_files([path])[path]
+
+    def _remember(self, key: tuple, digest: str):
+        with self._lock:
+            self._cache[key[:3]] = digest
+
+    def _store(self, key: tuple, digest: str) -> str:
+        self._remember(key, digest)
+        if self.fingerprints is not None:
+            self.fingerprints.put(key[0], digest, key[3], self.algorithm)
+        return digest
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def shared_hash_pool() -> HashPool:
+    """返回进程内共享的 HashPool（GUI 多次发布之间复用缓存与工作进程，并使用持久化指纹缓存）。"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = HashPool(fingerprints=default_fingerprint_cache())
+        return _shared_pool
+
+
+def verify_upgrade_package(uppath: str, pool: Optional[HashPool] = None,
+                           should_stop: Optional[Callable[[], bool]] = None) -> Optional[List[dict]]:
+    """按 upgrade_manifest.json 校验升级目录，返回问题列表 [{file, error}]（空列表表示全部一致）。
+
+    清单缺失时返回一条错误；should_stop() 为真时返回 None。
+    """
+    manifest = load_manifest(uppath)
+    if manifest is None:
+        return [{'file': uppath, 'error': '未找到或无法解析 upgrade_manifest.json'}]
+    entries = list(manifest.get('packages', [])) + list(manifest.get('deltas', []))
+    problems = []
+    to_hash = {}
+    for e in entries:
+        path = os.path.join(uppath, e.get('file', ''))
+        if not e.get('file') or not os.path.isfile(path):
+            problems.append({'file': e.get('file', ''), 'error': '文件不存在'})
+        elif 'size' in e and os.path.getsize(path) != e['size']:
+            problems.append({'file': e['file'], 'error': f'大小不一致: {os.path.getsize(path)} != {e["size"]}'})
+        elif e.get('sha256'):
+            to_hash[path] = e
+    digests = (pool or shared_hash_pool()).hash_files(list(to_hash), should_stop)
+    if digests is None:
+        return None
+    for path, e in to_hash.items():
+        if digests[path] != e['sha256']:
+            problems.append({'file': e['file'], 'error': 'SHA-256 不一致'})
+    return problems
+
+
+class SourcePrefetcher:
+    """后台预取源文件：预热页缓存并把指纹写入 FingerprintCache。一次只运行一轮，start() 会取消上一轮。
+
+    fingerprints 默认为共享的持久化缓存（在后台线程中打开，不拖慢窗口启动）；
+    list_sources() 在后台线程中调用（扫描网络共享盘可能很慢），返回要预取的文件路径列表；
+    on_update(status) 在后台线程中回调，status 为 {'key', 'state', 'done', 'total', 'bytes', 'hashed', 'error'}，
+    state 为 'scanning' / 'running' / 'done' / 'cancelled' / 'failed'。
+    """
+
+    def __init__(self, fingerprints: Optional[FingerprintCache] = None,
+                 on_update: Optional[Callable[[dict], None]] = None, chunk_size: int = HASH_BUFFER):
+        self.fingerprints = fingerprints
+        self.on_update = on_update
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._cancel = None
+        self._thread = None
+
+    def start(self, key: str, list_sources: Callable[[], List[str]]):
+        """取消正在进行的预取，为 key（通常是 pkgpath）开始新一轮。"""
+        with self._lock:
+            if self._cancel is not None:
+                self._cancel.set()
+            cancel = threading.Event()
+            self._cancel = cancel
+            self._thread = threading.Thread(target=self._run, args=(key, list_sources, cancel),
+                                            name='source-prefetch', daemon=True)
+            self._thread.start()
+
+    def cancel(self):
+        with self._lock:
+            if self._cancel is not None:
+                self._cancel.set()
+                self._cancel = None
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _notify(self, status: dict):
+        if self.on_update:
+            try:
+                self.on_update(dict(status))
+            except Exception:
+                pass
+
+    def _run(self, key: str, list_sources: Callable[[], List[str]], cancel: threading.Event):
+        status = {'key': key, 'state': 'scanning', 'done': 0, 'total': 0, 'bytes': 0, 'hashed': 0, 'error': ''}
+        self._notify(status)
+        try:
+            if self.fingerprints is None:
+                self.fingerprints = default_fingerprint_cache()
+            paths = list(list_sources())
+            status.update(state='running', total=len(paths))
+            self._notify(status)
+            for path in paths:
+                if cancel.is_set():
+                    break
+                nbytes, hashed = self._prefetch(path, cancel)
+                if cancel.is_set():
+                    break
+                status['done'] += 1
+                status['bytes'] += nbytes
+                status['hashed'] += int(hashed)
+                self._notify(status)
+            status['state'] = 'cancelled' if cancel.is_set() else 'done'
+        except Exception as e:
+            status.update(state='failed', error=str(e))
+        self._notify(status)
+
+    def _prefetch(self, path: str, cancel: threading.Event):
+        """返回 (读取/预读的字节数, 是否计算了指纹)。中途取消时不写缓存。"""
+        st = os.stat(path)
+        cached = self.fingerprints.get(path, st) if self.fingerprints is not None else None
+        if cached and hasattr(os, 'posix_fadvise'):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+            return st.st_size, False
+        h = hashlib.sha256()
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        with open(path, 'rb', buffering=0) as f:
+            while not cancel.is_set():
+                n = f.readinto(buf)
+                if not n:
+                    break
+                if not cached:
+                    h.update(view[:n])
+        if cancel.is_set():
+            return 0, False
+        if not cached and self.fingerprints is not None:
+            self.fingerprints.put(path, h.hexdigest(), st)
+        return st.st_size, not cached
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='发布产物完整性工具')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_zip = sub.add_parser('verify-zip', help='并行校验 zip 中每个条目的 CRC')
+    p_zip.add_argument('paths', nargs='+')
+    p_hash = sub.add_parser('hash', help='并行计算文件 SHA-256')
+    p_hash.add_argument('paths', nargs='+')
+    p_up = sub.add_parser('check-upgrade', help='按 upgrade_manifest.json 校验升级目录')
+    p_up.add_argument('uppath')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'verify-zip':
+        with ZipVerifier(args.workers) as verifier:
+            for p in args.paths:
+                verifier.submit(p)
+            results = verifier.wait()
+        for r in results:
+            print(f'{"OK " if r["ok"] else "BAD"} {r["path"]} {r["entries"]} entries {r["error"]}')
+        return 0 if all(r['ok'] for r in results) else 1
+    with HashPool(args.workers, fingerprints=default_fingerprint_cache()) as pool:
+        if args.cmd == 'hash':
+            for path, digest in pool.hash_files(args.paths).items():
+                print(f'{digest}  {path}')
+            return 0
+        problems = verify_upgrade_package(args.uppath, pool)
+    for p in problems:
+        print(f'BAD {p["file"]}: {p["error"]}')
+    if not problems:
+        print('OK')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
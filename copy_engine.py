@@ -0,0 +1,645 @@
+"""
+Device-aware copy scheduling for the release tools (no tkinter dependency).
+- Copy operations are grouped by the st_dev of their source and destination
+- Each device has its own concurrency cap: SSD many streams, HDD / network mounts one or two
+- Device type comes from the OS (Linux sysfs / mountinfo, UNC paths on Windows) or an optional short latency probe
+- copy_file: the streaming copy loop behind safe_copy, with optional page-cache hygiene (posix_fadvise)
+- BufferPool: fixed set of preallocated copy buffers shared by all concurrent copies (hard memory cap)
+- Destination files are preallocated to the source size before writing; out-of-space fails before any data is copied
+- Durability: none / per-file fsync / batched parallel fsync at the end of a phase
+- copy_file_multi / link_file: one read of the source fanned out to several destinations, or atomic hard links
+
+说明（中文）:
+并行复制如果不区分磁盘，package/ 与 output_base 在同一块机械盘上时磁头来回寻道，反而比串行更慢。
+ - CopyScheduler.run(ops)：每个操作占用源设备与目标设备各一个名额，只有两个设备都有空余名额时才会派发，
+   因此 SSD 上可以同时跑多路复制，机械盘和网络盘上最多一两路；同一设备上的操作仍按提交顺序派发；
+ - 设备类型：Linux 读取 /sys/dev/block/<major>:<minor>/queue/rotational 与 /proc/self/mountinfo 中的文件系统类型
+   （nfs/cifs/smb/sshfs 等视为网络盘）；Windows 上 UNC 路径视为网络盘；其他情况为 unknown；
+ - probe=True 时对尚无法识别的设备做一次约 0.2 秒的随机读延迟探测（先用 posix_fadvise 丢弃页缓存），按延迟推断类型；
+ - 每类设备的默认上限见 DEFAULT_LIMITS，可通过 limits 参数覆盖（键为设备类型或具体 st_dev）。
+ - copy_file(src, dst)：按块 readinto + write 复制并保留权限与时间戳（等价于 shutil.copy2）。drop_cache=True 时
+   源文件声明 POSIX_FADV_SEQUENTIAL，每写完一块就对源文件已读区间执行 DONTNEED；目标文件先用 sync_file_range
+   发起回写，上一块落盘后再 DONTNEED（脏页无法直接丢弃）。几十 GB 的发布因此不会把同机 CI 任务的编译/制品缓存挤出页缓存。
+   不支持 posix_fadvise 的系统（Windows）上退化为普通复制。效果可用 copy_bench.py 测量。
+ - BufferPool：预先分配固定数量的复制缓冲区，copy_file 在复制期间借用一个，用 readinto + memoryview 切片读写，
+   不再为每块数据分配新的 bytes；缓冲区用完时后来的复制等待，因此不论并行多少路，缓冲区总内存都不超过上限。
+   进程内共享池的上限由环境变量 GERENZHUSHOU_COPY_BUFFER_MB 设置（默认 64 MiB，每块 8 MiB）；
+   create_release 在 summary['memory'] 中报告缓冲区峰值与进程峰值内存。
+ - 预分配：copy_file 写入前用 posix_fallocate 把目标临时文件一次性分配到源文件大小（Windows 上用 ftruncate 扩展），
+   多个大文件同时写入同一卷时不再交错产生碎片；空间不足时立即抛出 InsufficientSpaceError，而不是复制到 90% 才失败。
+   文件系统不支持预分配时跳过。create_release 在开始复制前还会用 check_free_space 按目标设备汇总所需空间，不足时直接中止；
+   dry-run 用 free_space 列出每个目标设备的需要/可用空间，并按 TYPICAL_THROUGHPUT 估算耗时。
+ - 落盘策略 Durability(mode)：os.replace 只保证原子可见，不保证落盘，断电后“原子替换”的文件可能是空的。
+   'none' 不做 fsync；'file' 每个文件替换前 fsync 临时文件、替换后 fsync 所在目录（最安全也最慢）；
+   'batch' 写完的临时文件先不替换，只登记 (临时文件, 目标)；阶段结束时 flush() 用线程池并行 fsync 这些临时文件，
+   全部落盘后才依次 os.replace 到目标，最后对每个涉及的目录各 fsync 一次。替换推迟到 flush()，因此断电后目标要么是旧文件，
+   要么是已落盘的新文件；阶段内需要读取尚未替换的目标时用 staged(dst) 取得其临时文件。
+   单个文件替换失败（目标被占用、是目录、无权限等）不影响其他文件：其临时文件被删除，flush() 返回失败列表，
+   create_release 对这些目标改用 safe_copy 重试（含权限恢复），仍失败的升级包不进入差分与升级元数据。
+   create_release 在平台复制结束、发布 releases.json 之前以及流程结束时各 flush 一次，保证 releases.json 引用的文件先落盘。
+   Windows 上不能对目录 fsync，只 fsync 文件。各模式的开销可用 copy_bench.py --copies N 测量。
+ - 一次读取多处写入：copy_file_multi(src, dsts) 每读一块就依次写入所有目标，多个版本（标准版、内测版等）共用同一份源文件时
+   源文件只读一遍；link_file(existing, dst) 以“临时硬链接 + 原子替换”的方式让同一设备上的目标共享数据。
+   CopyScheduler 的操作也可以带多个目标（dst 为路径列表），占用源设备与所有目标设备各一个名额。
+"""
+
+import ctypes
+import ctypes.util
+import contextlib
+import errno
+import os
+import random
+import shutil
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_LIMITS = {'ssd': 8, 'hdd': 1, 'network': 2, 'unknown': 2}
+# 各类设备的典型顺序读写吞吐量（字节/秒），只用于 dry-run 估算耗时
+TYPICAL_THROUGHPUT = {'ssd': 400 * 2 ** 20, 'hdd': 120 * 2 ** 20, 'network': 60 * 2 ** 20, 'unknown': 100 * 2 ** 20}
+COPY_CHUNK = 8 * 1024 * 1024
+COPY_BUFFER_ENV = 'GERENZHUSHOU_COPY_BUFFER_MB'
+DEFAULT_BUFFER_BYTES = 64 * 1024 * 1024
+NETWORK_FS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'sshfs', '9p', 'afs', 'ceph', 'glusterfs',
+              'fuse.glusterfs', 'davfs', 'fuse.davfs2'}
+
+
+def device_of(path: str) -> int:
+    """返回路径所在设备的 st_dev；路径尚不存在时使用最近的已存在上级目录。"""
+    p = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(p).st_dev
+        except OSError:
+            parent = os.path.dirname(p)
+            if parent == p:
+                return 0
+            p = parent
+
+
+def _mount_fstype(dev: int) -> Optional[str]:
+    try:
+        with open('/proc/self/mountinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                major, _, minor = fields[2].partition(':')
+                if os.makedev(int(major), int(minor)) == dev:
+                    return fields[fields.index('-') + 1]
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def classify_device(path: str) -> str:
+    """根据操作系统信息判断设备类型：'ssd' / 'hdd' / 'network' / 'unknown'。"""
+    if os.name == 'nt':
+        return 'network' if os.path.abspath(path).startswith('\\\\') else 'unknown'
+    if not sys.platform.startswith('linux'):
+        return 'unknown'
+    dev = device_of(path)
+    fstype = _mount_fstype(dev)
+    if fstype in NETWORK_FS:
+        return 'network'
+    sysdir = f'/sys/dev/block/{os.major(dev)}:{os.minor(dev)}'
+    for queue in (os.path.join(sysdir, 'queue'), os.path.join(sysdir, '..', 'queue')):
+        try:
+            with open(os.path.join(queue, 'rotational'), 'r') as f:
+                return 'hdd' if f.read().strip() == '1' else 'ssd'
+        except OSError:
+            continue
+    return 'unknown'
+
+
+def probe_latency(sample_file: str, reads: int = 32, budget: float = 0.2) -> Optional[float]:
+    """对 sample_file 做随机 4 KiB 读取，返回中位延迟（秒）；文件太小或无法丢弃缓存时返回 None。"""
+    try:
+        size = os.path.getsize(sample_file)
+    except OSError:
+        return None
+    if size < 64 * 1024 * 1024 or not hasattr(os, 'posix_fadvise'):
+        return None
+    samples = []
+    fd = os.open(sample_file, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        deadline = time.perf_counter() + budget
+        rnd = random.Random(size)
+        for _ in range(reads):
+            offset = rnd.randrange(0, size - 4096) & ~4095
+            t0 = time.perf_counter()
+            os.pread(fd, 4096, offset)
+            samples.append(time.perf_counter() - t0)
+            if time.perf_counter() > deadline:
+                break
+    finally:
+        os.close(fd)
+    return statistics.median(samples) if samples else None
+
+
+def kind_from_latency(latency: float) -> str:
+    # NVMe/SATA SSD 随机读通常在 0.1ms 量级，机械盘为数毫秒，网络盘介于两者之间且波动大
+    if latency < 0.0005:
+        return 'ssd'
+    if latency < 0.003:
+        return 'network'
+    return 'hdd'
+
+
+# sync_file_range 标志（见 <fcntl.h>）
+_SYNC_FILE_RANGE_WAIT_BEFORE = 1
+_SYNC_FILE_RANGE_WRITE = 2
+_SYNC_FILE_RANGE_WAIT_AFTER = 4
+
+
+def _load_sync_file_range():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fn = libc.sync_file_range
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+_sync_file_range = _load_sync_file_range()
+
+
+def _write_all(fd: int, view: memoryview):
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class _CacheDropper:
+    """复制过程中逐块释放源与目标文件占用的页缓存。"""
+
+    def __init__(self, rfd: int, wfds: List[int]):
+        self.rfd = rfd
+        self.wfds = wfds
+        self._pending = None  # 已发起回写、尚未丢弃的目标区间 (offset, length)
+        os.posix_fadvise(rfd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def _drop_written(self, offset: int, length: int):
+        for wfd in self.wfds:
+            if _sync_file_range is not None:
+                _sync_file_range(wfd, offset, length, _SYNC_FILE_RANGE_WAIT_BEFORE | _SYNC_FILE_RANGE_WRITE
+                                 | _SYNC_FILE_RANGE_WAIT_AFTER)
+            os.posix_fadvise(wfd, offset, length, os.POSIX_FADV_DONTNEED)
+
+    def chunk_done(self, offset: int, length: int):
+        os.posix_fadvise(self.rfd, offset, length, os.POSIX_FADV_DONTNEED)
+        if _sync_file_range is not None:
+            # 先异步发起本块回写，再等待上一块落盘并丢弃，磁盘写入与下一块读取可以重叠
+            for wfd in self.wfds:
+                _sync_file_range(wfd, offset, length, _SYNC_FILE_RANGE_WRITE)
+        if self._pending is not None:
+            self._drop_written(*self._pending)
+        self._pending = (offset, length)
+
+    def finish(self):
+        if self._pending is not None:
+            self._drop_written(*self._pending)
+            self._pending = None
+
+
+class BufferPool:
+    """预先分配的复制缓冲区池：最多 max_bytes // buffer_size 个缓冲区，借完时 acquire() 阻塞。线程安全。"""
+
+    def __init__(self, max_bytes: int = DEFAULT_BUFFER_BYTES, buffer_size: int = COPY_CHUNK):
+        self.buffer_size = buffer_size
+        self._free = [bytearray(buffer_size) for _ in range(max(1, max_bytes // buffer_size))]
+        self.capacity = len(self._free) * buffer_size
+        self._in_use = 0
+        self._peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> bytearray:
+        with self._cond:
+            while not self._free:
+                self._cond.wait()
+            self._in_use += 1
+            self._peak = max(self._peak, self._in_use)
+            return self._free.pop()
+
+    def release(self, buf: bytearray):
+        with self._cond:
+            self._free.append(buf)
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def buffer(self):
+        buf = self.acquire()
+        try:
+            yield buf
+        finally:
+            self.release(buf)
+
+    @property
+    def peak_bytes(self) -> int:
+        """同时借出的缓冲区字节数峰值（自创建起）。"""
+        return self._peak * self.buffer_size
+
+
+_shared_buffers = None
+_shared_buffers_lock = threading.Lock()
+
+
+def shared_buffer_pool() -> BufferPool:
+    """返回进程内共享的 BufferPool，上限取环境变量 GERENZHUSHOU_COPY_BUFFER_MB（默认 64 MiB）。"""
+    global _shared_buffers
+    with _shared_buffers_lock:
+        if _shared_buffers is None:
+            try:
+                max_bytes = int(os.environ[COPY_BUFFER_ENV]) * 1024 * 1024
+            except (KeyError, ValueError):
+                max_bytes = DEFAULT_BUFFER_BYTES
+            _shared_buffers = BufferPool(max_bytes)
+        return _shared_buffers
+
+
+def peak_rss() -> Optional[int]:
+    """当前进程的峰值常驻内存（字节）；不支持的系统返回 None。"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KiB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+DURABILITY_MODES = ('none', 'file', 'batch')
+
+
+def fsync_path(path: str):
+    """fsync 一个已关闭的文件（Windows 上需要可写句柄）。"""
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str):
+    """fsync 目录，使其中的新建/替换条目落盘；Windows 不支持，直接返回。"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Durability:
+    """文件落盘策略：'none' / 'file'（逐个 fsync）/ 'batch'（登记后在 flush() 时并行 fsync 再替换）。线程安全。"""
+
+    def __init__(self, mode: str = 'batch', workers: int = 8):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f'未知的落盘模式: {mode}（可选 {", ".join(DURABILITY_MODES)}）')
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._files = set()
+        self._pending = []  # [(临时文件, 目标)]，按登记顺序替换
+        self._staged = {}  # 目标 -> 尚未替换的临时文件
+        self._lock = threading.Lock()
+        self.stats = {'mode': mode, 'files': 0, 'dirs': 0, 'seconds': 0.0}
+
+    def before_close(self, fd: int):
+        """写入方在关闭（替换前的）临时文件之前调用。"""
+        if self.mode == 'file':
+            start = time.perf_counter()
+            os.fsync(fd)
+            self._count(1, 0, time.perf_counter() - start)
+
+    def commit(self, tmp: str, dst: str):
+        """把已调用 before_close 的临时文件原子替换为 dst。
+
+        none / file 模式立即替换（file 模式随后 fsync 所在目录）；batch 模式只登记，由 flush() 先 fsync 再替换。
+        """
+        if self.mode == 'batch':
+            with self._lock:
+                self._pending.append((tmp, dst))
+                self._staged[os.path.abspath(dst)] = tmp
+            return
+        os.replace(tmp, dst)
+        if self.mode == 'file':
+            start = time.perf_counter()
+            fsync_dir(os.path.dirname(os.path.abspath(dst)))
+            self._count(0, 1, time.perf_counter() - start)
+
+    def staged(self, path: str) -> str:
+        """batch 模式下 path 已登记但尚未替换时返回其临时文件（内容即将成为 path），否则返回 path。"""
+        with self._lock:
+            return self._staged.get(os.path.abspath(path), path)
+
+    def written(self, path: str):
+        """由其他代码直接写到最终位置、未经 before_close 的文件（例如工作进程生成的压缩包）。"""
+        if self.mode == 'file':
+            start = time.perf_counter()
+            fsync_path(path)
+            fsync_dir(os.path.dirname(os.path.abspath(path)))
+            self._count(1, 1, time.perf_counter() - start)
+        elif self.mode == 'batch':
+            with self._lock:
+                self._files.add(os.path.abspath(path))
+
+    def _count(self, files: int, dirs: int, seconds: float = 0.0):
+        with self._lock:
+            self.stats['files'] += files
+            self.stats['dirs'] += dirs
+            self.stats['seconds'] += seconds
+
+    def flush(self) -> Tuple[int, int, List[Tuple[str, OSError]]]:
+        """batch 模式：并行 fsync 登记的临时文件与文件，全部落盘后按登记顺序替换，再对每个涉及的目录 fsync 一次。
+
+        单个文件 fsync 或替换失败不影响其他文件：删除其临时文件，记入失败列表，由调用方决定是否重试
+        （例如 safe_copy 的权限恢复）。返回 (文件数, 目录数, [(目标, 异常)])。
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._staged.clear()
+            files = sorted(self._files)
+            self._files.clear()
+        pending = [(tmp, dst) for tmp, dst in pending if os.path.exists(tmp)]
+        files = [f for f in files if os.path.exists(f)]
+        if not pending and not files:
+            return 0, 0, []
+        start = time.perf_counter()
+        synced = [tmp for tmp, _ in pending] + files
+
+        def _sync(path: str) -> Optional[OSError]:
+            try:
+                fsync_path(path)
+            except OSError as e:
+                return e
+            return None
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(synced))) as executor:
+            errors = dict(zip(synced, executor.map(_sync, synced)))
+        failed = []
+        replaced = []
+        for tmp, dst in pending:
+            try:
+                if errors[tmp] is not None:
+                    raise errors[tmp]
+                os.replace(tmp, dst)
+                replaced.append(dst)
+            except OSError as e:
+                failed.append((dst, e))
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        failed += [(f, errors[f]) for f in files if errors[f] is not None]
+        dirs = sorted(set(os.path.dirname(os.path.abspath(dst)) for dst in replaced)
+                      | set(os.path.dirname(f) for f in files if errors[f] is None))
+        for d in dirs:
+            fsync_dir(d)
+        self._count(len(synced) - len(failed), len(dirs), time.perf_counter() - start)
+        return len(synced) - len(failed), len(dirs), failed
+
+
+def commit_file(tmp: str, dst: str, durability: Optional[Durability] = None):
+    """把写好的临时文件原子替换为 dst；传入 durability 时按其落盘策略处理（batch 模式推迟到 flush()）。"""
+    if durability is None:
+        os.replace(tmp, dst)
+    else:
+        durability.commit(tmp, dst)
+
+
+class InsufficientSpaceError(OSError):
+    """目标磁盘空间不足。"""
+
+
+def _free_bytes(path: str) -> Optional[int]:
+    p = os.path.abspath(path)
+    while not os.path.exists(p) and os.path.dirname(p) != p:
+        p = os.path.dirname(p)
+    try:
+        return shutil.disk_usage(p).free
+    except OSError:
+        return None
+
+
+def _space_error(dst: str, need: int) -> InsufficientSpaceError:
+    free = _free_bytes(os.path.dirname(os.path.abspath(dst)))
+    avail = f'，可用 {free} 字节' if free is not None else ''
+    return InsufficientSpaceError(errno.ENOSPC, f'目标磁盘空间不足：{dst} 需要 {need} 字节{avail}')
+
+
+def preallocate(fd: int, size: int, dst: str = ''):
+    """把 fd 预分配到 size 字节；空间不足抛出 InsufficientSpaceError，文件系统不支持时忽略。"""
+    if size <= 0:
+        return
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        elif os.name == 'nt':
+            # NTFS 扩展文件长度时即分配簇（非稀疏文件）
+            os.ftruncate(fd, size)
+    except OSError as e:
+        if e.errno in (errno.ENOSPC, getattr(errno, 'EDQUOT', errno.ENOSPC)):
+            raise _space_error(dst, size) from e
+        # EOPNOTSUPP / EINVAL 等：文件系统不支持预分配，直接按普通方式写入
+
+
+def free_space(writes: Iterable[Tuple[str, int]]) -> List[Tuple[str, int, Optional[int]]]:
+    """按目标设备汇总 (dst, 字节数)，返回每个设备的 [(目标目录, 需要字节, 可用字节；无法获取时为 None)]。"""
+    need = {}
+    where = {}
+    for dst, size in writes:
+        dev = device_of(dst)
+        need[dev] = need.get(dev, 0) + size
+        where.setdefault(dev, os.path.dirname(os.path.abspath(dst)))
+    return [(where[dev], total, _free_bytes(where[dev])) for dev, total in need.items()]
+
+
+def check_free_space(pairs: Iterable[Tuple[str, str]]) -> List[Tuple[str, int, int]]:
+    """按目标设备汇总 (src, dst) 复制所需空间，返回空间不足的 [(目标目录, 需要字节, 可用字节)]。"""
+    writes = []
+    for src, dst in pairs:
+        try:
+            writes.append((dst, os.path.getsize(src)))
+        except OSError:
+            continue
+    return [(where, total, free) for where, total, free in free_space(writes) if free is not None and free < total]
+
+
+def copy_file_multi(src: str, dsts: Sequence[str], drop_cache: bool = True, pool: Optional[BufferPool] = None,
+                    durability: Optional[Durability] = None) -> int:
+    """读取一次 src，把内容写入 dsts 中的每个文件（覆盖），保留权限与时间戳，返回复制的字节数。
+
+    缓冲区从 pool 借用（默认为进程内共享池）；写入前把每个目标预分配到源文件大小，空间不足时抛出 InsufficientSpaceError；
+    drop_cache=True 时逐块释放源与目标的页缓存（需要 posix_fadvise，否则忽略）；
+    关闭前调用 durability.before_close（随后由调用方用 commit_file 替换到最终位置）。
+    """
+    pool = pool or shared_buffer_pool()
+    copied = 0
+    with contextlib.ExitStack() as stack:
+        fsrc = stack.enter_context(open(src, 'rb', buffering=0))
+        outs = [stack.enter_context(open(dst, 'wb', buffering=0)) for dst in dsts]
+        buf = stack.enter_context(pool.buffer())
+        view = stack.enter_context(memoryview(buf))
+        size = os.fstat(fsrc.fileno()).st_size
+        for dst, fdst in zip(dsts, outs):
+            preallocate(fdst.fileno(), size, dst)
+        dropper = None
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            dropper = _CacheDropper(fsrc.fileno(), [f.fileno() for f in outs])
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            for dst, fdst in zip(dsts, outs):
+                try:
+                    _write_all(fdst.fileno(), view[:n])
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        raise _space_error(dst, size) from e
+                    raise
+            if dropper is not None:
+                dropper.chunk_done(copied, n)
+            copied += n
+        if copied != size:
+            # 复制期间源文件被截断或追加：去掉预分配多出的部分
+            for fdst in outs:
+                os.ftruncate(fdst.fileno(), copied)
+        if dropper is not None:
+            dropper.finish()
+        for dst, fdst in zip(dsts, outs):
+            shutil.copystat(src, dst)
+            if durability is not None:
+                durability.before_close(fdst.fileno())
+    return copied
+
+
+def copy_file(src: str, dst: str, drop_cache: bool = True, pool: Optional[BufferPool] = None,
+              durability: Optional[Durability] = None) -> int:
+    """把 src 复制到 dst（覆盖），保留权限与时间戳，返回复制的字节数（参数含义同 copy_file_multi）。"""
+    return copy_file_multi(src, [dst], drop_cache, pool, durability)
+
+
+def link_file(existing: str, dst: str, durability: Optional[Durability] = None):
+    """让 dst 成为 existing 的硬链接：先在 dst 所在目录创建临时链接，再原子替换（dst 已存在时不会出现缺失的瞬间）。
+
+    existing 可以是尚未替换的临时文件（见 Durability.staged）；替换按 durability 的落盘策略进行（见 commit_file）。
+    """
+    directory = os.path.dirname(os.path.abspath(dst))
+    while True:
+        tmp = os.path.join(directory, f'.tmp_link_{uuid.uuid4().hex}')
+        try:
+            os.link(existing, tmp)
+            break
+        except FileExistsError:
+            continue
+    try:
+        commit_file(tmp, dst, durability)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class CopyScheduler:
+    """按设备限制并发的复制调度器。
+
+    ops 为 (src, dst, func) 列表，func(src, dst) 执行实际复制并返回结果；dst 也可以是目标路径列表（一次读取写入多个目标）；
+    run() 返回与 ops 顺序一致的结果列表（被中止而未执行的操作结果为 None）。
+    """
+
+    def __init__(self, limits: Optional[Dict] = None, probe: bool = False, max_workers: int = 16,
+                 log: Optional[Callable[[str, str], None]] = None):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.probe = probe
+        self.max_workers = max(1, max_workers)
+        self.log = log
+        self._devices = {}  # st_dev -> (kind, limit)
+
+    def device_limit(self, path: str, sample_file: Optional[str] = None) -> Tuple[int, str, int]:
+        """返回 (st_dev, 设备类型, 并发上限)，结果按设备缓存。"""
+        dev = device_of(path)
+        if dev not in self._devices:
+            kind = classify_device(path)
+            if kind == 'unknown' and self.probe and sample_file:
+                latency = probe_latency(sample_file)
+                if latency is not None:
+                    kind = kind_from_latency(latency)
+                    if self.log:
+                        self.log(f'设备 {dev} 随机读延迟 {latency * 1000:.2f}ms，按 {kind} 处理', 'info')
+            limit = self.limits.get(dev, self.limits.get(kind, DEFAULT_LIMITS['unknown']))
+            self._devices[dev] = (kind, max(1, int(limit)))
+            if self.log:
+                self.log(f'设备 {dev}（{path}）: {kind}，并发上限 {self._devices[dev][1]}', 'info')
+        kind, limit = self._devices[dev]
+        return dev, kind, limit
+
+    def run(self, ops: Sequence[Tuple[str, object, Callable[[str, object], object]]],
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_done: Optional[Callable[[int, object], None]] = None) -> List[object]:
+        results = [None] * len(ops)
+        if not ops:
+            return results
+        needs = []
+        limits = {}
+        for src, dst, _ in ops:
+            s_dev, _, s_limit = self.device_limit(src, src)
+            limits[s_dev] = s_limit
+            need = {s_dev}
+            for d in ([dst] if isinstance(dst, str) else dst):
+                d_dev, _, d_limit = self.device_limit(os.path.dirname(os.path.abspath(d)) or d)
+                limits[d_dev] = d_limit
+                need.add(d_dev)
+            needs.append(need)
+
+        cond = threading.Condition()
+        active = {dev: 0 for dev in limits}
+        pending = list(range(len(ops)))
+        running = [0]
+
+        def _finish(i: int, fut):
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = e
+            with cond:
+                for dev in needs[i]:
+                    active[dev] -= 1
+                running[0] -= 1
+                cond.notify_all()
+            if on_done:
+                on_done(i, results[i])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            with cond:
+                while pending or running[0]:
+                    if should_stop is not None and should_stop():
+                        pending.clear()
+                    picked = None
+                    blocked = set()
+                    for i in pending:
+                        if running[0] >= self.max_workers:
+                            break
+                        if not (needs[i] & blocked) and all(active[d] < limits[d] for d in needs[i]):
+                            picked = i
+                            break
+                        # 同一设备上的操作保持提交顺序：等待中的操作占住其设备，后面的操作不能越过它
+                        blocked |= needs[i]
+                    if picked is None:
+                        cond.wait(0.2)
+                        continue
+                    pending.remove(picked)
+                    for dev in needs[picked]:
+                        active[dev] += 1
+                    running[0] += 1
+                    src, dst, func = ops[picked]
+                    fut = executor.submit(func, src, dst)
+                    fut.add_done_callback(lambda f, i=picked: _finish(i, f))
+        return results
@@ -0,0 +1,355 @@
+"""
+Updater load-test harness for the upgrade mirror.
+- Simulates thousands of concurrent desktop clients polling releases.json at the same time
+- Each client decides whether to upgrade from currentRelease and downloads its gerenzhushou-* package
+- Optional interrupted downloads resumed with HTTP Range
+- Reports p50/p99 latency, throughput and error rates per request kind
+
+Run:
+  python mirror_loadtest.py --serve ./upgrade_package --clients 2000
+  python mirror_loadtest.py --serve ./upgrade_package --clients 50 --in-process   # smoke test only
+  python mirror_loadtest.py --url http://127.0.0.1:39080/di-assistant --clients 5000 --ramp 10 --resume-ratio 0.2
+
+说明（中文）:
+模拟“早上 9 点所有客户端同时检查更新”的场景：
+ - 每个客户端随机持有 releases.json 中的某个版本和某个平台（--arch），先请求 releases.json（Accept-Encoding: gzip，
+   部分客户端带上次的 ETag 以模拟 304），若 currentRelease 与本地版本不同，则下载对应平台的升级包；
+ - 下载地址取 releases.json 中 updateTo.url 的路径部分，拼到被测镜像的主机上（真实配置指向内网 IP）；
+ - --resume-ratio 指定比例的下载在中途断开，然后用 Range + If-Range 续传，检验 206 响应；
+ - 出现任何错误（连接失败、超时、非预期状态码等）或无法获取 releases.json 时退出码为 1，可直接用于 CI 判断；
+ - --serve 会在子进程中启动 mirror_server.py（端口自动分配）作为被测对象，便于在一台机器上完成测试；
+   服务器与压测客户端不争用同一个 GIL，测得的是镜像本身的表现。
+   --in-process 改为在本进程内启动，只用于冒烟测试（验证流程能跑通），其延迟/吞吐数据不代表镜像性能。
+客户端使用 asyncio + 手写的 HTTP/1.1（只依赖标准库），同一客户端的请求复用一个 keep-alive 连接。
+注意：模拟大量客户端时需要提高进程可打开的文件数（例如 ulimit -n 65535）。
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+DEFAULT_ARCHES = ['linux-arm64', 'linux-x64', 'darwin-arm64', 'darwin-intel-x64', 'win32-x64']
+_READ_CHUNK = 256 * 1024
+
+
+class _Response:
+    def __init__(self, status: int, headers: dict, body: bytes, length: int):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.length = length
+
+
+class _Connection:
+    """单个 keep-alive 连接上的极简 HTTP/1.1 客户端（要求响应带 Content-Length）。"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def _ensure(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, path: str, headers: Optional[dict] = None, keep_body: bool = False,
+                      stop_after: Optional[int] = None) -> _Response:
+        """发送 GET 请求。stop_after 不为空时读取这么多字节后断开连接（模拟下载中断）。"""
+        await self._ensure()
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'User-Agent: gerenzhushou-loadtest']
+        for k, v in (headers or {}).items():
+            lines.append(f'{k}: {v}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionError('连接被服务器关闭')
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            resp_headers[k.strip().lower()] = v.strip()
+
+        remaining = int(resp_headers.get('content-length', '0'))
+        received = 0
+        body = bytearray() if keep_body else None
+        while remaining > 0:
+            want = min(_READ_CHUNK, remaining)
+            if stop_after is not None:
+                want = min(want, stop_after - received)
+                if want <= 0:
+                    self.close()
+                    break
+            chunk = await asyncio.wait_for(self.reader.read(want), self.timeout)
+            if not chunk:
+                raise ConnectionError('响应体不完整')
+            received += len(chunk)
+            remaining -= len(chunk)
+            if keep_body:
+                body += chunk
+        if resp_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return _Response(status, resp_headers, bytes(body) if keep_body else b'', received)
+
+
+class Stats:
+    """按请求类型（poll / download / resume）汇总延迟、字节数、状态码与错误。"""
+
+    def __init__(self):
+        self.latency = {}
+        self.bytes = 0
+        self.status = {}
+        self.errors = {}
+        self.clients_upgraded = 0
+        self.clients_current = 0
+
+    def record(self, kind: str, seconds: float, status: int, nbytes: int):
+        self.latency.setdefault(kind, []).append(seconds)
+        self.status.setdefault(kind, {}).setdefault(status, 0)
+        self.status[kind][status] += 1
+        self.bytes += nbytes
+
+    def error(self, kind: str, exc: BaseException):
+        key = f'{kind}: {type(exc).__name__}'
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """最近秩法百分位数（samples 为空时返回 0）。"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[idx]
+
+
+async def _client(idx: int, host: str, port: int, base_path: str, args, stats: Stats,
+                  versions: List[str], etag_cache: dict, sem: asyncio.Semaphore):
+    rnd = random.Random(args.seed + idx)
+    await asyncio.sleep(rnd.uniform(0, args.ramp))
+    local_version = rnd.choice(versions) if versions else ''
+    arch = rnd.choice(args.arch)
+    async with sem:
+        conn = _Connection(host, port, args.timeout)
+        try:
+            # 1) 轮询 releases.json
+            headers = {'Accept-Encoding': 'gzip'}
+            if etag_cache.get('etag') and rnd.random() < args.etag_ratio:
+                headers['If-None-Match'] = etag_cache['etag']
+            t0 = time.perf_counter()
+            try:
+                resp = await conn.request(base_path + '/releases.json', headers, keep_body=True)
+            except Exception as e:
+                stats.error('poll', e)
+                return
+            stats.record('poll', time.perf_counter() - t0, resp.status, resp.length)
+            if resp.status == 200:
+                body = gzip.decompress(resp.body) if resp.headers.get('content-encoding') == 'gzip' else resp.body
+                data = json.loads(body.decode('utf-8'))
+                etag_cache['etag'] = resp.headers.get('etag')
+                etag_cache['data'] = data
+            elif resp.status == 304 and etag_cache.get('data'):
+                data = etag_cache['data']
+            else:
+                stats.error('poll', RuntimeError(f'HTTP {resp.status}'))
+                return
+
+            # 2) 判断是否需要升级
+            current = data.get('currentRelease')
+            if not current or current == local_version or args.poll_only:
+                stats.clients_current += 1
+                return
+            url = ''
+            for item in data.get('releases', []):
+                if item.get('version') == current:
+                    url = (item.get('updateTo') or {}).get('url', '')
+            release_path = urlsplit(url).path.rstrip('/') if url else f'{base_path}/releases/{current}'
+            pkg_path = f'{release_path}/gerenzhushou-{current}-standard-{arch}.zip'
+            stats.clients_upgraded += 1
+
+            # 3) 下载升级包（部分客户端模拟中断后续传）
+            resume = rnd.random() < args.resume_ratio
+            t0 = time.perf_counter()
+            try:
+                if resume:
+                    head = await conn.request(pkg_path, stop_after=args.resume_at)
+                    stats.record('download', time.perf_counter() - t0, head.status, head.length)
+                    conn.close()
+                    if head.status != 200:
+                        stats.error('download', RuntimeError(f'HTTP {head.status}'))
+                        return
+                    t0 = time.perf_counter()
+                    rng = {'Range': f'bytes={head.length}-'}
+                    if head.headers.get('etag'):
+                        rng['If-Range'] = head.headers['etag']
+                    resp = await conn.request(pkg_path, rng)
+                    stats.record('resume', time.perf_counter() - t0, resp.status, resp.length)
+                    if resp.status != 206:
+                        stats.error('resume', RuntimeError(f'HTTP {resp.status}'))
+                else:
+                    resp = await conn.request(pkg_path)
+                    stats.record('download', time.perf_counter() - t0, resp.status, resp.length)
+                    if resp.status != 200:
+                        stats.error('download', RuntimeError(f'HTTP {resp.status}'))
+            except Exception as e:
+                stats.error('resume' if resume else 'download', e)
+        finally:
+            conn.close()
+
+
+async def run_load(base_url: str, args) -> Tuple[Stats, float]:
+    """对 base_url（例如 http://127.0.0.1:39080/di-assistant）执行一次压测，返回 (统计, 总耗时秒)。"""
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    base_path = parts.path.rstrip('/')
+
+    # 先取一次 releases.json，得到版本列表用于给客户端分配“本地版本”
+    conn = _Connection(host, port, args.timeout)
+    try:
+        resp = await conn.request(base_path + '/releases.json', keep_body=True)
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f'无法获取 releases.json: HTTP {resp.status}')
+    data = json.loads(resp.body.decode('utf-8'))
+    versions = [r['version'] for r in data.get('releases', []) if r.get('version')]
+
+    stats = Stats()
+    etag_cache = {}
+    sem = asyncio.Semaphore(args.concurrency or args.clients)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(i, host, port, base_path, args, stats, versions, etag_cache, sem)
+        for i in range(args.clients)
+    ])
+    return stats, time.perf_counter() - start
+
+
+def spawn_server(root: str, workers: int) -> Tuple[subprocess.Popen, str]:
+    """在子进程中启动 mirror_server.py（127.0.0.1，自动分配端口），返回 (进程, 基础地址)。"""
+    from mirror_server import DEFAULT_PREFIX
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mirror_server.py')
+    proc = subprocess.Popen([sys.executable, '-u', script, '--root', root, '--host', '127.0.0.1', '--port', '0',
+                             '--workers', str(workers), '--quiet'],
+                            stdout=subprocess.PIPE, text=True, encoding='utf-8')
+    # 启动后第一行输出为 “镜像已启动: http://127.0.0.1:<port>/... -> ...”
+    line = proc.stdout.readline()
+    m = re.search(r'http://127\.0\.0\.1:(\d+)', line)
+    if not m:
+        stop_server(proc)
+        raise RuntimeError(f'镜像子进程启动失败（退出码 {proc.returncode}）: {line.strip()}')
+    return proc, f'http://127.0.0.1:{m.group(1)}{DEFAULT_PREFIX}'
+
+
+def stop_server(proc: subprocess.Popen):
+    """结束 spawn_server 启动的镜像子进程。"""
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    if proc.stdout is not None:
+        proc.stdout.close()
+
+
+def format_report(stats: Stats, elapsed: float, clients: int) -> str:
+    lines = [f'clients: {clients}  upgraded: {stats.clients_upgraded}  up-to-date: {stats.clients_current}  '
+             f'elapsed: {elapsed:.2f}s']
+    lines.append(f'{"kind":<10} {"count":>7} {"p50 ms":>9} {"p99 ms":>9} {"max ms":>9} {"req/s":>9}  status')
+    total_requests = 0
+    for kind in ('poll', 'download', 'resume'):
+        samples = stats.latency.get(kind, [])
+        if not samples:
+            continue
+        total_requests += len(samples)
+        codes = ' '.join(f'{k}:{v}' for k, v in sorted(stats.status.get(kind, {}).items()))
+        lines.append(f'{kind:<10} {len(samples):>7} {percentile(samples, 50) * 1000:>9.1f} '
+                     f'{percentile(samples, 99) * 1000:>9.1f} {max(samples) * 1000:>9.1f} '
+                     f'{len(samples) / elapsed if elapsed else 0:>9.1f}  {codes}')
+    errors = sum(stats.errors.values())
+    attempts = total_requests + errors
+    lines.append(f'throughput: {stats.bytes / elapsed / 1024 / 1024 if elapsed else 0:.1f} MiB/s  '
+                 f'({stats.bytes} bytes)')
+    lines.append(f'errors: {errors} / {attempts} ({(errors / attempts * 100) if attempts else 0:.2f}%)')
+    for key, n in sorted(stats.errors.items()):
+        lines.append(f'  {key}: {n}')
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='升级镜像压测：模拟大量客户端同时检查并下载更新')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='被测镜像的基础地址，例如 http://127.0.0.1:39080/di-assistant')
+    target.add_argument('--serve', metavar='DIR', help='在子进程中启动 mirror_server 服务该目录并对其压测')
+    parser.add_argument('--clients', type=int, default=1000, help='模拟客户端数量')
+    parser.add_argument('--concurrency', type=int, default=0, help='同时活跃的连接上限（默认与客户端数相同）')
+    parser.add_argument('--ramp', type=float, default=5.0, help='所有客户端在多少秒内随机开始（模拟集中轮询）')
+    parser.add_argument('--arch', nargs='+', default=DEFAULT_ARCHES, help='客户端平台（升级包文件名中的 arch）')
+    parser.add_argument('--etag-ratio', type=float, default=0.5, help='携带 If-None-Match 的轮询比例')
+    parser.add_argument('--resume-ratio', type=float, default=0.0, help='中途断开并用 Range 续传的下载比例')
+    parser.add_argument('--resume-at', type=int, default=64 * 1024, help='模拟中断时已下载的字节数')
+    parser.add_argument('--poll-only', action='store_true', help='只轮询 releases.json，不下载')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单次网络操作超时秒数')
+    parser.add_argument('--workers', type=int, default=64, help='--serve 模式下镜像线程池大小')
+    parser.add_argument('--in-process', action='store_true',
+                        help='--serve 时在本进程内启动镜像（仅用于冒烟测试，结果不代表镜像性能）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（便于复现）')
+    args = parser.parse_args(argv)
+
+    if args.in_process and not args.serve:
+        parser.error('--in-process 只能与 --serve 一起使用')
+    server = proc = None
+    base_url = args.url
+    if args.serve and args.in_process:
+        from mirror_server import DEFAULT_PREFIX, start_server
+        server, _ = start_server(args.serve, workers=args.workers)
+        base_url = f'http://127.0.0.1:{server.server_address[1]}{DEFAULT_PREFIX}'
+        print(f'已在本进程启动镜像（冒烟测试，结果不代表镜像性能）: {base_url}')
+    elif args.serve:
+        proc, base_url = spawn_server(args.serve, args.workers)
+        print(f'已在子进程 {proc.pid} 中启动镜像: {base_url}')
+    try:
+        stats, elapsed = asyncio.run(run_load(base_url, args))
+    except (OSError, RuntimeError, ValueError, asyncio.TimeoutError) as e:
+        print(f'无法开始压测（获取 releases.json 失败）: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if proc is not None:
+            stop_server(proc)
+    print(format_report(stats, elapsed, args.clients))
+    errors = sum(stats.errors.values())
+    if errors:
+        print(f'压测中出现 {errors} 个错误', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
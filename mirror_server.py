@@ -0,0 +1,524 @@
+"""
+Lightweight upgrade mirror serving upgrade_package over HTTP.
+- Same URL layout as the internal mirror: /di-assistant/releases.json, /di-assistant/releases/<version>/<file>
+- Zero-copy file bodies via socket.sendfile (os.sendfile where available)
+- Single-range requests (resumed downloads), If-Range, conditional GET (ETag / Last-Modified)
+- Precompressed releases.json.gz / .br and the releases.json.etag sidecar written by the release step
+- Bounded thread pool for requests in progress; idle keep-alive connections wait in a selector, not in a worker
+- Usable as a local stand-in for load tests or as a small production mirror
+
+Run: python mirror_server.py --root ./upgrade_package --port 39080
+
+说明（中文）:
+releases.json 中的 url 指向内部镜像（/di-assistant/releases/<version>），没有镜像时无法在本地测试升级流程。
+本脚本直接把 upgrade_package 目录作为镜像对外服务：
+ - /di-assistant/releases.json：优先返回预压缩版本（按 Accept-Encoding 选择 br/gzip），并使用 .etag 旁路文件中的强 ETag；
+ - /di-assistant/releases/<version>：返回该版本可下载文件的 JSON 列表；
+ - /di-assistant/releases/<version>/<file> 或 /di-assistant/<file>：返回 upgrade_package 下的同名文件；
+ - 支持 Range（单区间）续传与 If-None-Match / If-Modified-Since 条件请求（返回 304）；
+ - Cache-Control：升级包/差分的文件名只带版本号，同一版本重新发布时内容会变，因此不标记 immutable，
+   只缓存 CACHE_MAX_AGE 秒，过期后凭 ETag 重新验证；releases.json 等元数据每次都重新验证（no-cache）。
+线程池只处理正在进行的请求：一个请求处理完后，若 keep-alive 连接上没有已到达的下一个请求，
+连接交还给 selector 线程等待，可读时再提交给线程池；空闲超过 idle_timeout（默认 5 秒）的连接被关闭。
+因此成千上万个空闲的 keep-alive 连接不会占满线程池。--workers 是同时传输的请求数上限，
+向慢速客户端发送大文件期间会一直占用一个线程，应按预期的并发下载数设置。
+前缀可以通过 --prefix 修改；不带前缀的路径同样可以访问。只服务 root 目录下的普通文件，不允许访问子目录或隐藏文件。
+
+备注：本脚本只依赖标准库，不导入 rename_tool（无需 tkinter），可单独部署。
+"""
+
+import argparse
+import email.utils
+import json
+import os
+import re
+import selectors
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+DEFAULT_PREFIX = '/di-assistant'
+ETAG_SUFFIX = '.etag'
+# 预压缩变体：(Content-Encoding, 文件后缀, ETag 后缀)，按优先级排列
+PRECOMPRESSED = [('br', '.br', '-br'), ('gzip', '.gz', '-gz')]
+CONTENT_TYPES = {
+    '.json': 'application/json; charset=utf-8',
+    '.zip': 'application/zip',
+}
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# 升级包/差分的缓存时间（秒），过期后凭 ETag 重新验证
+CACHE_MAX_AGE = 300
+
+
+def cache_control(name: str) -> str:
+    """按文件名返回 Cache-Control：带版本号的升级包/差分短暂缓存，其余每次重新验证。"""
+    if name.startswith('gerenzhushou-'):
+        return f'public, max-age={CACHE_MAX_AGE}, must-revalidate'
+    return 'no-cache'
+
+
+def _accepted_encodings(header: Optional[str]) -> set:
+    """解析 Accept-Encoding，返回 q>0 的编码集合。"""
+    result = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        m = re.search(r'q=([0-9.]+)', params)
+        if m:
+            try:
+                q = float(m.group(1))
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            result.add(token)
+    return result
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀，支持 '*' 与逗号分隔的列表。"""
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    """处理镜像的 GET/HEAD 请求。root / prefix 由 MirrorServer 提供。"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'gerenzhushou-mirror/1.0'
+    # 请求进行中（读请求头、发送响应）的套接字超时；两次请求之间的空闲等待由 MirrorServer 的 selector 负责
+    timeout = 15
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def handle(self):
+        """处理连接上已经到达的请求。
+
+        keep-alive 连接上暂时没有下一个请求时设置 self.parked 并返回，由 MirrorServer 把连接放入 selector，
+        不占用工作线程等待；连接可读后 MirrorServer 再次调用 handle()。
+        """
+        self.parked = False
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self._request_pending():
+                self.parked = True
+                return
+            self.handle_one_request()
+
+    def _request_pending(self) -> bool:
+        """rfile 缓冲区或套接字中是否已有数据（不阻塞；对端关闭时也返回 False，由 selector 报告可读）。"""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def finish(self):
+        if getattr(self, 'parked', False):
+            # 连接继续保持，只把响应刷到套接字
+            self.wfile.flush()
+            return
+        super().finish()
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    # ---------------------- 路由 ----------------------
+
+    def _resolve(self) -> Tuple[Optional[str], Optional[str]]:
+        """把请求路径映射为 (文件名, 版本号)；版本索引请求返回 (None, version)。无法识别时返回 (None, None)。"""
+        path = unquote(urlsplit(self.path).path)
+        prefix = self.server.prefix
+        if prefix and (path == prefix or path.startswith(prefix + '/')):
+            path = path[len(prefix):]
+        parts = [p for p in path.split('/') if p]
+        if len(parts) == 1:
+            return parts[0], None
+        if len(parts) == 2 and parts[0] == 'releases':
+            return None, parts[1]
+        if len(parts) == 3 and parts[0] == 'releases':
+            return parts[2], parts[1]
+        return None, None
+
+    def _file_path(self, name: str) -> Optional[str]:
+        """只允许访问 root 下的普通、非隐藏文件。"""
+        if not name or name.startswith('.') or '/' in name or '\\' in name:
+            return None
+        path = os.path.join(self.server.root, name)
+        return path if os.path.isfile(path) else None
+
+    def _serve(self, head: bool):
+        name, version = self._resolve()
+        if name is None and version is not None:
+            return self._serve_index(version, head)
+        path = self._file_path(name) if name else None
+        if path is None:
+            return self._send_error(HTTPStatus.NOT_FOUND)
+        try:
+            self._serve_file(path, head)
+        except (ConnectionError, TimeoutError):
+            # 客户端中途断开（例如暂停下载），无需记录为服务器错误
+            self.close_connection = True
+
+    def _serve_index(self, version: str, head: bool):
+        """返回某版本可下载的文件列表（升级包与以该版本为目标的差分）。"""
+        files = []
+        pattern = re.compile(r'^gerenzhushou-(?:[\w.]+-to-)?' + re.escape(version) + r'-')
+        try:
+            names = sorted(os.listdir(self.server.root))
+        except OSError:
+            names = []
+        for n in names:
+            p = os.path.join(self.server.root, n)
+            if pattern.match(n) and os.path.isfile(p):
+                files.append({'name': n, 'size': os.path.getsize(p)})
+        if not files:
+            return self._send_error(HTTPStatus.NOT_FOUND)
+        body = json.dumps({'version': version, 'files': files}, ensure_ascii=False).encode('utf-8')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', CONTENT_TYPES['.json'])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    # ---------------------- 文件响应 ----------------------
+
+    def _validators(self, path: str, st: os.stat_result) -> Tuple[str, str]:
+        """返回 (ETag, Last-Modified)。存在 .etag 旁路文件时使用其中的强 ETag，否则由大小与修改时间生成。"""
+        etag = None
+        sidecar = path + ETAG_SUFFIX
+        if os.path.isfile(sidecar):
+            try:
+                with open(sidecar, 'r', encoding='ascii') as f:
+                    etag = f.read().strip() or None
+            except (OSError, ValueError):
+                etag = None
+        if etag is None:
+            etag = '"%x-%x"' % (st.st_size, st.st_mtime_ns)
+        return etag, email.utils.formatdate(st.st_mtime, usegmt=True)
+
+    def _not_modified(self, etag: str, st: os.stat_result) -> bool:
+        inm = self.headers.get('If-None-Match')
+        if inm is not None:
+            return _etag_matches(inm, etag)
+        ims = self.headers.get('If-Modified-Since')
+        if ims:
+            try:
+                since = email.utils.parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(st.st_mtime) <= since
+        return False
+
+    def _parse_range(self, size: int, etag: str, last_modified: str) -> Optional[Tuple[int, int]]:
+        """解析单区间 Range，返回 (start, end) 闭区间；不使用 Range 时返回 None，无法满足时返回 (-1, -1)。"""
+        header = self.headers.get('Range')
+        if not header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() not in (etag, last_modified):
+            return None
+        m = _RANGE_RE.match(header.strip())
+        if not m:
+            # 多区间或格式不支持：按规范可以忽略 Range 返回完整内容
+            return None
+        first, last = m.group(1), m.group(2)
+        if first == '' and last == '':
+            return None
+        if first == '':
+            length = int(last)
+            if length == 0:
+                return (-1, -1)
+            return (max(0, size - length), size - 1)
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return (-1, -1)
+        return (start, end)
+
+    def _pick_variant(self, path: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """按 Accept-Encoding 选择预压缩文件，返回 (实际文件, Content-Encoding, ETag 后缀)。"""
+        accepted = _accepted_encodings(self.headers.get('Accept-Encoding'))
+        for encoding, ext, tag in PRECOMPRESSED:
+            if encoding in accepted and os.path.isfile(path + ext):
+                return path + ext, encoding, tag
+        return path, None, None
+
+    def _serve_file(self, path: str, head: bool):
+        has_variants = any(os.path.isfile(path + ext) for _, ext, _ in PRECOMPRESSED)
+        # Range 只作用于原始字节，带 Range 的请求不返回预压缩版本
+        if self.headers.get('Range'):
+            body_path, encoding, tag = path, None, None
+        else:
+            body_path, encoding, tag = self._pick_variant(path)
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            return self._send_error(HTTPStatus.NOT_FOUND)
+        with f:
+            st = os.fstat(f.fileno())
+            etag, last_modified = self._validators(path, os.stat(path) if encoding else st)
+            if tag:
+                etag = etag[:-1] + tag + '"'
+            ctype = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+            cache = cache_control(os.path.basename(path))
+
+            def _common_headers():
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('Accept-Ranges', 'bytes')
+                # 同一版本可能重新发布，不能标记为 immutable（见 cache_control）
+                self.send_header('Cache-Control', cache)
+                if has_variants:
+                    self.send_header('Vary', 'Accept-Encoding')
+
+            if self._not_modified(etag, st):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                _common_headers()
+                self.end_headers()
+                return
+
+            size = st.st_size
+            rng = self._parse_range(size, etag, last_modified)
+            if rng == (-1, -1):
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                _common_headers()
+                self.end_headers()
+                return
+            if rng:
+                start, end = rng
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                start, end = 0, size - 1
+                self.send_response(HTTPStatus.OK)
+            count = end - start + 1
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(count))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            _common_headers()
+            self.end_headers()
+            if head or count <= 0:
+                return
+            self.wfile.flush()
+            # socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝发送，否则退化为 send
+            self.connection.sendfile(f, start, count)
+
+    def _send_error(self, status: HTTPStatus):
+        body = f'{status.value} {status.phrase}\n'.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+class MirrorServer(HTTPServer):
+    """固定大小线程池处理请求、selector 线程托管空闲 keep-alive 连接的 HTTP 服务器。
+
+    workers 为同时处理（传输）的请求数上限；idle_timeout 为 keep-alive 连接两次请求之间允许的最长空闲秒数。
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, root: str, prefix: str = DEFAULT_PREFIX, workers: int = 64, quiet: bool = False,
+                 idle_timeout: float = 5.0):
+        self.root = os.path.abspath(root)
+        self.prefix = prefix.rstrip('/')
+        self.quiet = quiet
+        self.idle_timeout = idle_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mirror')
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_w.setblocking(False)
+        self._to_park = []
+        self._park_lock = threading.Lock()
+        self._closing = False
+        super().__init__(address, MirrorRequestHandler)
+        self._idle_thread = threading.Thread(target=self._watch_idle, name='mirror-idle', daemon=True)
+        self._idle_thread.start()
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except ConnectionError:
+            # 客户端中途断开（例如下载中断后改用 Range 续传）属于正常情况，不输出堆栈
+            pass
+        except Exception:
+            self.handle_error(request, client_address)
+        self._done(request, handler)
+
+    def _resume(self, handler):
+        """空闲连接上到达了新请求：在工作线程中继续处理。"""
+        try:
+            handler.handle()
+        except ConnectionError:
+            handler.parked = False
+        except Exception:
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            handler.finish()
+        self._done(handler.request, handler)
+
+    def _done(self, request, handler):
+        """请求处理完毕：保持的连接交给 selector 线程，其余关闭。"""
+        if handler is not None and getattr(handler, 'parked', False):
+            with self._park_lock:
+                if not self._closing:
+                    self._to_park.append(handler)
+                    self._wake()
+                    return
+            handler.parked = False
+            handler.finish()
+        self.shutdown_request(request)
+
+    def _wake(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # 唤醒缓冲区已满说明 selector 线程本来就会醒来
+            pass
+
+    def _close_parked(self, handler):
+        handler.parked = False
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def _watch_idle(self):
+        """selector 线程：等待空闲连接可读后提交给线程池，关闭空闲超时的连接。"""
+        selector = self._selector
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        deadlines = {}  # handler -> 截止时间；idle_timeout 固定，因此插入顺序即截止时间顺序
+        while True:
+            timeout = None
+            if deadlines:
+                timeout = max(0.0, next(iter(deadlines.values())) - time.monotonic())
+            for key, _ in selector.select(timeout):
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                selector.unregister(key.fileobj)
+                deadlines.pop(key.data, None)
+                try:
+                    self.executor.submit(self._resume, key.data)
+                except RuntimeError:
+                    # 线程池已关闭
+                    self._close_parked(key.data)
+            with self._park_lock:
+                parked, self._to_park = self._to_park, []
+                closing = self._closing
+            now = time.monotonic()
+            for handler in parked:
+                selector.register(handler.connection, selectors.EVENT_READ, handler)
+                deadlines[handler] = now + self.idle_timeout
+            expired = []
+            for handler, deadline in deadlines.items():
+                if deadline > now and not closing:
+                    break
+                expired.append(handler)
+            for handler in expired:
+                del deadlines[handler]
+                selector.unregister(handler.connection)
+                self._close_parked(handler)
+            if closing:
+                selector.close()
+                self._wakeup_r.close()
+                return
+
+    def server_close(self):
+        super().server_close()
+        with self._park_lock:
+            self._closing = True
+        self._wake()
+        self._idle_thread.join(timeout=5)
+        self._wakeup_w.close()
+        self.executor.shutdown(wait=False)
+
+
+def start_server(root: str, host: str = '127.0.0.1', port: int = 0, prefix: str = DEFAULT_PREFIX,
+                 workers: int = 64, quiet: bool = True, idle_timeout: float = 5.0) -> Tuple[MirrorServer, threading.Thread]:
+    """在后台线程中启动镜像（port=0 时自动分配端口），返回 (server, thread)。
+
+    用于压测或本地联调；结束时调用 server.shutdown() 与 server.server_close()。
+    """
+    server = MirrorServer((host, port), root, prefix=prefix, workers=workers, quiet=quiet, idle_timeout=idle_timeout)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='upgrade_package 本地升级镜像')
+    parser.add_argument('--root', default='./upgrade_package', help='要服务的目录（默认 ./upgrade_package）')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=39080, help='监听端口（默认 39080）')
+    parser.add_argument('--prefix', default=DEFAULT_PREFIX, help=f'URL 前缀（默认 {DEFAULT_PREFIX}）')
+    parser.add_argument('--workers', type=int, default=64,
+                        help='线程池大小，即同时传输的请求数上限（空闲的 keep-alive 连接不占用线程）')
+    parser.add_argument('--idle-timeout', type=float, default=5.0, help='keep-alive 连接的最长空闲秒数（默认 5）')
+    parser.add_argument('--quiet', action='store_true', help='不输出访问日志')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f'目录不存在: {args.root}', file=sys.stderr)
+        return 1
+    server = MirrorServer((args.host, args.port), args.root, prefix=args.prefix,
+                          workers=args.workers, quiet=args.quiet, idle_timeout=args.idle_timeout)
+    # 第一行输出包含实际端口（--port 0 时自动分配），mirror_loadtest --serve 据此连接
+    print(f'镜像已启动: http://{args.host}:{server.server_address[1]}{server.prefix}/  ->  {server.root}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
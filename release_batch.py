@@ -0,0 +1,225 @@
+"""
+Batch release mode: run create_release for many (version, date, platforms, pkgpath) jobs from one job file.
+- Each distinct pkgpath is scanned once and the index is shared by its jobs
+- Fingerprints are shared through the persistent cache and the process-wide hash pool
+- Independent jobs run in parallel; jobs writing the same output folder or upgrade directory run in file order
+- Consolidated summary at the end (optionally written as JSON)
+
+Run:
+  python release_batch.py jobs.json
+  python release_batch.py jobs.json --workers 3 --summary batch_summary.json
+
+Job file:
+  {
+    "defaults": {"helppath": "./help_documentation", "verify_sources": true},
+    "jobs": [
+      {"version": "1.3.2", "date": "20260301", "platforms": ["linux-arm64", "win-x64"]},
+      {"version": "1.3.2", "date": "20260305", "uppath": "./upgrade_package_rebuild"},
+      {"version": "1.3.3", "date": "20260310", "pkgpath": "./package_hotfix", "uppath": "./upgrade_hotfix"},
+      {"version": "1.3.4", "date": "20260315", "pkgpath": ["//build-arm/package", "//build-x64/package"]}
+    ]
+  }
+
+说明（中文）:
+经常需要一次出多个版本（热修复、改日期重打包等），以前每个版本都要单独开一次 GUI、单独扫描一次 package/。
+ - 任务字段与 create_release 的参数同名（version、date 必填，wps_version 可省略），defaults 中的字段作用于所有任务，未知字段直接报错；
+ - pkgpath 可以是多个目录的列表（各构建机的共享目录），并发扫描后合并；
+ - 相同 pkgpath 的任务共用一次 scan_package_index；若有任务需要差分（make_deltas），扫描时顺带计算源文件指纹，
+   之后复制出的升级包直接继承指纹，写升级元数据时无需再次计算；
+ - 冲突规则：输出主文件夹相同或 uppath 相同的任务不能同时运行（都会写 releases.json / upgrade_manifest.json），按文件中的顺序依次执行；
+   delete_existing 会删除当前目录下所有“灵犀·晓伴_*--*”文件夹，因此这类任务独占运行；
+ - 某个任务失败不影响其他任务，最后输出汇总表，有失败时退出码为 1。
+"""
+
+import argparse
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from rename_tool import create_release, package_roots, scan_package_index
+
+_EXCLUSIVE = '*'
+# 由批处理自身提供、不允许在任务中指定的参数
+_RESERVED = {'log_callback', 'progress_callback', 'stop_event', 'index'}
+
+
+_print_lock = threading.Lock()
+
+
+def _print_log(msg: str, level: str = 'info'):
+    # 多个任务并行输出，整行加锁避免交错
+    with _print_lock:
+        print(f'{datetime.now():%H:%M:%S} [{level}] {msg}', flush=True)
+
+
+def normalize_job(raw: dict, defaults: Optional[dict] = None, name: str = '任务') -> dict:
+    """合并 defaults 并校验字段，返回可直接传给 create_release 的关键字参数。"""
+    if not isinstance(raw, dict):
+        raise ValueError(f'{name} 必须是 JSON 对象')
+    job = dict(defaults or {}, **raw)
+    allowed = set(inspect.signature(create_release).parameters) - _RESERVED
+    unknown = set(job) - allowed
+    if unknown:
+        raise ValueError(f'{name} 包含未知字段: {sorted(unknown)}')
+    if not job.get('version') or not job.get('date'):
+        raise ValueError(f'{name} 缺少 version 或 date')
+    job.setdefault('wps_version', '')
+    return job
+
+
+def load_jobs(path: str) -> List[dict]:
+    """读取任务文件，合并 defaults，校验字段，返回 create_release 的关键字参数列表。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    defaults = data.get('defaults', {})
+    jobs = [normalize_job(raw, defaults, f'任务 {i}') for i, raw in enumerate(data.get('jobs', []), start=1)]
+    if not jobs:
+        raise ValueError(f'任务文件中没有任务: {path}')
+    return jobs
+
+
+def _pkg_key(job: dict) -> tuple:
+    return tuple(os.path.abspath(p) for p in package_roots(job.get('pkgpath', './package')))
+
+
+def _job_label(job: dict) -> str:
+    return f'{job["version"]}/{job["date"]}'
+
+
+def conflict_keys(job: dict) -> set:
+    """任务会写入的共享资源；两个任务的键有交集时不能同时运行。"""
+    if job.get('delete_existing'):
+        return {_EXCLUSIVE}
+    out_main = os.path.join(job.get('output_base', './'), f'灵犀·晓伴_{job["version"]} --{job["date"]}')
+    return {('out', os.path.abspath(out_main)), ('up', os.path.abspath(job.get('uppath', './upgrade_package')))}
+
+
+class _ConflictScheduler:
+    """按任务文件顺序分配运行权：与正在运行或排在前面的任务冲突的任务需要等待。"""
+
+    def __init__(self, jobs: List[dict]):
+        self._keys = [conflict_keys(j) for j in jobs]
+        self._done = [False] * len(jobs)
+        self._running = set()
+        self._cond = threading.Condition()
+
+    def _blocked(self, i: int) -> bool:
+        mine = self._keys[i]
+        for j in range(i):
+            if self._done[j]:
+                continue
+            theirs = self._keys[j]
+            if _EXCLUSIVE in mine or _EXCLUSIVE in theirs or mine & theirs:
+                return True
+        for j in self._running:
+            theirs = self._keys[j]
+            if _EXCLUSIVE in mine or _EXCLUSIVE in theirs or mine & theirs:
+                return True
+        return False
+
+    def acquire(self, i: int):
+        with self._cond:
+            while self._blocked(i):
+                self._cond.wait()
+            self._running.add(i)
+
+    def release(self, i: int):
+        with self._cond:
+            self._running.discard(i)
+            self._done[i] = True
+            self._cond.notify_all()
+
+
+def run_batch(jobs: List[dict], workers: int = 2, log: Callable[[str, str], None] = _print_log,
+              stop_event: Optional[threading.Event] = None) -> List[dict]:
+    """执行全部任务，返回与 jobs 顺序一致的结果列表 [{label, status, out_dir, seconds, error}]。"""
+    stop_event = stop_event or threading.Event()
+
+    # 每个 pkgpath 只扫描一次；需要差分的 pkgpath 顺带计算源文件指纹（写入持久化缓存，供所有任务复用）
+    indexes = {}
+    for job in jobs:
+        pkgpath = job.get('pkgpath', './package')
+        key = _pkg_key(job)
+        hash_sources = any(j.get('make_deltas') and _pkg_key(j) == key for j in jobs)
+        if key not in indexes:
+            log(f'扫描 {pkgpath}{"（含指纹）" if hash_sources else ""}', 'info')
+            indexes[key] = scan_package_index(pkgpath, hash_sources=hash_sources, should_stop=stop_event.is_set)
+    log(f'共 {len(jobs)} 个任务，{len(indexes)} 个 package 目录', 'info')
+
+    scheduler = _ConflictScheduler(jobs)
+    results = [None] * len(jobs)
+
+    def _run(i: int):
+        job = jobs[i]
+        label = _job_label(job)
+        scheduler.acquire(i)
+        start = time.perf_counter()
+        try:
+            if stop_event.is_set():
+                results[i] = {'label': label, 'status': 'stopped', 'out_dir': None, 'seconds': 0.0, 'error': ''}
+                return
+            log(f'[{label}] 开始', 'info')
+            summary = create_release(
+                index=indexes[_pkg_key(job)],
+                log_callback=lambda m, lvl='info': log(f'[{label}] {m}', lvl),
+                stop_event=stop_event, **job)
+            status = summary.get('status', 'ok')
+            results[i] = {'label': label, 'status': status, 'out_dir': summary.get('out_dir'),
+                          'seconds': time.perf_counter() - start, 'error': ''}
+        except Exception as e:
+            log(f'[{label}] 失败: {e}', 'error')
+            results[i] = {'label': label, 'status': 'failed', 'out_dir': None,
+                          'seconds': time.perf_counter() - start, 'error': str(e)}
+        finally:
+            scheduler.release(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(_run, range(len(jobs))))
+    return results
+
+
+def format_summary(results: List[dict], elapsed: float) -> str:
+    lines = [f'{"job":<24} {"status":<8} {"seconds":>8}  output / error']
+    for r in results:
+        detail = r['error'] or r['out_dir'] or ''
+        lines.append(f'{r["label"]:<24} {r["status"]:<8} {r["seconds"]:>8.1f}  {detail}')
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    lines.append(f'{ok}/{len(results)} 个任务成功，总耗时 {elapsed:.1f}s')
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='按任务文件批量执行发布')
+    parser.add_argument('jobfile', help='JSON 任务文件')
+    parser.add_argument('--workers', type=int, default=2, help='同时运行的任务数上限')
+    parser.add_argument('--summary', default=None, help='把汇总结果另存为 JSON 文件')
+    parser.add_argument('--dry-run', action='store_true', help='所有任务均以 dry-run 方式执行')
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.jobfile)
+    if args.dry_run:
+        for job in jobs:
+            job['dry_run'] = True
+    start = time.perf_counter()
+    try:
+        results = run_batch(jobs, args.workers)
+    except KeyboardInterrupt:
+        return 130
+    elapsed = time.perf_counter() - start
+    print(format_summary(results, elapsed))
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': elapsed, 'jobs': results}, f, ensure_ascii=False, indent=2)
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
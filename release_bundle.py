@@ -0,0 +1,164 @@
+"""
+Per-platform distribution bundles for a release folder (no tkinter dependency).
+- One zip per platform subfolder of 灵犀·晓伴_<version> --<date>
+- Bundles are built in parallel worker processes and streamed straight to disk
+- Already-compressed members (.zip, .docx, ...) are stored without recompression
+
+说明（中文）:
+每次发布后需要把 mac、win、统信+麒麟 三个子文件夹分别压缩后交付，以前靠手工完成。
+ - build_platform_bundle(src_dir, out_zip)：遍历子文件夹，按块流式写入 zip（不复制中间目录），
+   先写同目录临时文件再原子替换；zip/docx 等已压缩格式使用 ZIP_STORED，其余使用 ZIP_DEFLATED；
+   压缩包内保留顶层文件夹名，解压后与原目录结构一致；
+ - build_bundles(out_main, ...)：每个平台文件夹一个工作进程并行压缩（压缩是 CPU 密集型，线程受 GIL 限制）；
+   中止时取消尚未开始的任务，不等待进程池；正在压缩的工作进程通过共享的 multiprocessing.Event 在下一个文件前退出，
+   删除自己的临时文件，build_bundles 最后再清理残留的 .tmp_bundle_ 文件，不会留下不完整的压缩包；
+ - create_release(make_bundles=True) 在复制帮助文档之后调用，结果写入 summary['bundles']。
+"""
+
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, List, Optional
+
+# 这些格式本身已压缩，再次 deflate 只会浪费 CPU，几乎不减小体积
+STORED_EXTS = {'.zip', '.docx', '.xlsx', '.pptx', '.7z', '.gz', '.bz2', '.xz', '.dmg',
+               '.png', '.jpg', '.jpeg', '.mp4'}
+TMP_PREFIX = '.tmp_bundle_'
+# 中止后等待正在压缩的工作进程删除临时文件的最长时间（秒）
+STOP_GRACE = 5.0
+
+# 工作进程中的停止标志（由 _init_worker 设置）
+_stop_event = None
+
+
+class BundleCancelled(Exception):
+    """打包在完成前被中止。"""
+
+
+def bundle_name(folder_name: str) -> str:
+    return f'{folder_name}.zip'
+
+
+def build_platform_bundle(src_dir: str, out_zip: str, compresslevel: int = 6,
+                          should_stop: Optional[Callable[[], bool]] = None) -> dict:
+    """把 src_dir 压缩为 out_zip（压缩包内以文件夹名为顶层目录），返回 {file, size, members, stored}。
+
+    每个文件写入前检查 should_stop()，为真时删除临时文件并抛出 BundleCancelled。
+    """
+    src_dir = os.path.abspath(src_dir)
+    top = os.path.basename(src_dir)
+    out_dir = os.path.dirname(os.path.abspath(out_zip))
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=out_dir, prefix=TMP_PREFIX)
+    members = stored = 0
+    try:
+        with os.fdopen(fd, 'wb') as raw, zipfile.ZipFile(raw, 'w', zipfile.ZIP_DEFLATED,
+                                                         compresslevel=compresslevel) as zf:
+            for root, dirs, files in os.walk(src_dir):
+                dirs.sort()
+                for name in sorted(files):
+                    if should_stop is not None and should_stop():
+                        raise BundleCancelled(out_zip)
+                    path = os.path.join(root, name)
+                    arcname = os.path.join(top, os.path.relpath(path, src_dir)).replace(os.sep, '/')
+                    if os.path.splitext(name)[1].lower() in STORED_EXTS:
+                        zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+                        stored += 1
+                    else:
+                        zf.write(path, arcname)
+                    members += 1
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, out_zip)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {'file': out_zip, 'size': os.path.getsize(out_zip), 'members': members, 'stored': stored}
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _bundle_worker(src_dir: str, out_zip: str) -> dict:
+    return build_platform_bundle(src_dir, out_zip, should_stop=_stop_event.is_set)
+
+
+def _remove_partial(bundle_dir: str):
+    """删除 bundle_dir 中残留的打包临时文件。"""
+    try:
+        names = os.listdir(bundle_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(TMP_PREFIX):
+            try:
+                os.remove(os.path.join(bundle_dir, name))
+            except OSError:
+                pass
+
+
+def build_bundles(out_main: str, folders: Optional[List[str]] = None, bundle_dir: Optional[str] = None,
+                  dry_run: bool = False,
+                  log: Optional[Callable[[str, str], None]] = None,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  workers: Optional[int] = None) -> List[dict]:
+    """为 out_main 下的每个平台子文件夹（folders，默认为全部子文件夹）并行生成分发压缩包，默认放在 out_main 中。
+
+    返回成功生成的压缩包信息列表；should_stop() 为真时取消尚未开始的任务，通知正在压缩的工作进程停止，
+    并删除未完成的临时文件。
+    """
+    def _log(msg: str, level: str = 'info'):
+        if log:
+            log(msg, level)
+
+    bundle_dir = bundle_dir or out_main
+    if not dry_run and not os.path.isdir(out_main):
+        _log(f'发布文件夹不存在，跳过打包: {out_main}', 'warning')
+        return []
+    if folders is None:
+        folders = sorted(d for d in os.listdir(out_main)
+                         if os.path.isdir(os.path.join(out_main, d))) if os.path.isdir(out_main) else []
+    if dry_run:
+        for d in folders:
+            _log(f'[DRY] BUNDLE {os.path.join(out_main, d)} -> {os.path.join(bundle_dir, bundle_name(d))}', 'info')
+        return []
+    if not folders:
+        return []
+
+    results = []
+    stop_event = multiprocessing.Event()
+    executor = ProcessPoolExecutor(max_workers=workers or min(len(folders), os.cpu_count() or 1),
+                                   initializer=_init_worker, initargs=(stop_event,))
+    stopped = False
+    try:
+        futures = {executor.submit(_bundle_worker, os.path.join(out_main, d),
+                                   os.path.join(bundle_dir, bundle_name(d))): d for d in folders}
+        remaining = set(futures)
+        while remaining:
+            if should_stop is not None and should_stop():
+                stopped = True
+                stop_event.set()
+                break
+            done, remaining = wait(remaining, timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in done:
+                folder = futures[fut]
+                try:
+                    info = fut.result()
+                except Exception as e:
+                    _log(f'打包失败 {folder}: {e}', 'error')
+                    continue
+                results.append(info)
+                _log(f'BUNDLE {info["file"]}（{info["members"]} 个文件，其中 {info["stored"]} 个不再压缩，'
+                     f'{info["size"]} 字节）', 'success')
+    finally:
+        # 中止时不等待进程池：取消排队的任务，正在运行的任务在下一个文件前看到 stop_event 后退出
+        executor.shutdown(wait=not stopped, cancel_futures=stopped)
+    if stopped:
+        wait(remaining, timeout=STOP_GRACE)
+        _remove_partial(bundle_dir)
+        _log('打包被中止', 'warning')
+    return sorted(results, key=lambda r: r['file'])
@@ -0,0 +1,892 @@
+"""
+Delta upgrade packages between consecutive releases.
+- Binary delta (block matching against the previous upgrade package) with apply-and-verify
+- Zip entry-level patch (central directory + local header comparison via mmap, raw entry copy)
+- Helpers for reading releases.json and writing the upgrade manifest (upgrade_manifest.json)
+- Delta-chain planner: cheapest path (chained deltas vs. full package) from every older version
+- Serve-ready releases.json: minified copy, .gz/.br precompressed variants and a strong ETag sidecar
+
+说明（中文）:
+客户端升级时不必每次下载完整的 gerenzhushou-<version>-standard-<arch>.zip，
+可以改为下载“上一版本升级包 -> 新版本升级包”的二进制差分文件（.bdiff），在本地还原后校验 SHA-256。
+
+差分格式（仅依赖标准库）:
+  头部: MAGIC | 基准文件大小 | 基准 SHA-256 | 目标文件大小 | 目标 SHA-256 | 块大小
+  操作流: COPY(基准偏移, 长度) / DATA(原始长度, 压缩长度, zlib 数据) / END
+生成时把基准文件按固定块建立弱/强校验和索引（mmap 读取），目标文件用 rsync 式的滚动弱校验和逐字节滑动查找，
+弱校验和命中后用强校验和（BLAKE2b）确认：命中则记录 COPY，未命中的字节作为字面数据压缩写入。
+因此目标中插入或删除字节后，其后的数据仍能对上基准文件中的块，差分大小只与变化量有关。
+逐字节滑动是纯 Python 循环（每 MiB 约 0.6 秒）：未匹配的字面数据超过目标大小的一半时放弃生成（DeltaNotWorthwhile），
+客户端直接下载完整包，避免在与基准几乎无关的文件上耗费数秒却得到和完整包一样大的差分。
+还原时先核对基准文件的大小与 SHA-256，写入同目录临时文件，校验目标 SHA-256 后再替换；损坏的差分一律抛出 ValueError。
+
+升级包本身是 zip，变化的条目重新压缩后字节完全不同，二进制差分只能把它们整体作为字面数据；因此另提供条目级补丁（.zpatch）：
+只读取两个 zip 的中央目录与本地头，按 CRC/大小及头部字段（修改时间/标志/extra 等）判断条目是否变化，
+把变化条目的记录原样拷贝进补丁 zip，并附带清单（目标条目顺序、删除列表与目标 SHA-256）。
+应用补丁时未变化条目从旧包原样拷贝，得到与新包逐字节一致的 zip，并用 SHA-256 确认。
+
+落后多个版本的客户端：upgrade_manifest.json 会保留最近若干个版本之间的差分，
+并为 releases.json 中每个旧版本计算到最新版本的最省流量路径（串联差分或直接下载完整包），写入 'paths'。
+
+releases.json 被大量客户端轮询：发布时写入压缩空白后的副本、预压缩的 .gz/.br（brotli 可选）
+以及 releases.json.etag（内容 SHA-256 的强 ETag），镜像可直接返回 304 或预压缩字节。
+
+备注：本模块不依赖 tkinter，可在无界面的构建机上单独使用。
+"""
+
+import contextlib
+import gzip
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+from itertools import accumulate
+from typing import Callable, Optional, Tuple
+
+from copy_engine import Durability, commit_file
+
+try:
+    import brotli
+except ImportError:
+    # brotli 为可选依赖；未安装时只生成 .gz 预压缩文件
+    brotli = None
+
+BDIFF_MAGIC = b'GZBDIFF1'
+BDIFF_EXT = '.bdiff'
+DEFAULT_BLOCK_SIZE = 16 * 1024
+# 单个 DATA 操作的最大字面数据长度，限制生成与还原时的内存占用
+MAX_LITERAL = 4 * 1024 * 1024
+# 字面数据超过目标大小的这一比例（且超过 MIN_LITERAL_BUDGET）时放弃生成差分
+MAX_LITERAL_RATIO = 0.5
+MIN_LITERAL_BUDGET = 1024 * 1024
+MANIFEST_NAME = 'upgrade_manifest.json'
+RELEASES_NAME = 'releases.json'
+ETAG_SUFFIX = '.etag'
+
+_OP_END = 0
+_OP_COPY = 1
+_OP_DATA = 2
+_HEADER = struct.Struct('>8sQ32sQ32sI')
+_COPY = struct.Struct('>QQ')
+_DATA = struct.Struct('>II')
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """计算文件的 SHA-256（十六进制字符串）。"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def version_key(version: str) -> tuple:
+    """把 '1.2.32' 这样的版本号转换为可比较的元组。"""
+    return tuple(int(x) for x in re.findall(r'\d+', version))
+
+
+def load_release_versions(releases_json: str) -> list:
+    """读取 releases.json 中列出的所有版本号（按版本从旧到新排序，去重）。"""
+    with open(releases_json, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    versions = set()
+    for item in data.get('releases', []):
+        if item.get('version'):
+            versions.add(item['version'])
+    if data.get('currentRelease'):
+        versions.add(data['currentRelease'])
+    return sorted(versions, key=version_key)
+
+
+def previous_version(versions: list, version: str) -> Optional[str]:
+    """返回 versions 中比 version 小的最大版本号；没有则返回 None。"""
+    older = [v for v in versions if version_key(v) < version_key(version)]
+    return max(older, key=version_key) if older else None
+
+
+def upgrade_package_name(version: str, upgrade_arch: str, edition: str = 'standard') -> str:
+    """升级包文件名，例如 gerenzhushou-1.3.1-standard-linux-arm64.zip；edition 为版次 slug。"""
+    return f"gerenzhushou-{version}-{edition}-{upgrade_arch}.zip"
+
+
+def delta_name(from_version: str, to_version: str, upgrade_arch: str, ext: str = BDIFF_EXT,
+               edition: str = 'standard') -> str:
+    """差分文件名，例如 gerenzhushou-1.2.32-to-1.3.1-standard-linux-arm64.bdiff；edition 为版次 slug。"""
+    return f"gerenzhushou-{from_version}-to-{to_version}-{edition}-{upgrade_arch}{ext}"
+
+
+# ---------------------- Binary delta ----------------------
+
+
+class DeltaNotWorthwhile(ValueError):
+    """目标与基准差异过大，差分不会明显小于完整包。"""
+
+
+def _weak_checksum(block) -> Tuple[int, int]:
+    """rsync 弱校验和的两个分量 (a, b)，均取模 2^16。"""
+    return sum(block) & 0xffff, sum(accumulate(block)) & 0xffff
+
+
+def _strong_checksum(block) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def _index_blocks(base, size: int, block_size: int) -> dict:
+    """按固定块为基准文件建立 {弱校验和: {强校验和: 偏移}} 索引。"""
+    index = {}
+    for off in range(0, size - block_size + 1, block_size):
+        block = base[off:off + block_size]
+        a, b = _weak_checksum(block)
+        index.setdefault((b << 16) | a, {}).setdefault(_strong_checksum(block), off)
+    return index
+
+
+def create_binary_delta(base_path: str, target_path: str, delta_path: str,
+                        block_size: int = DEFAULT_BLOCK_SIZE,
+                        max_literal_ratio: Optional[float] = MAX_LITERAL_RATIO) -> dict:
+    """生成从 base_path 到 target_path 的二进制差分，写入 delta_path。
+
+    与 rsync 相同：基准文件按固定块建立弱/强校验和索引，目标文件用滚动弱校验和逐字节滑动查找，
+    弱校验和命中后再用强校验和确认，因此插入或删除字节之后的数据仍能匹配。
+    先写入同目录临时文件，完成后原子替换。返回 {'size', 'sha256', 'base_sha256', 'target_sha256'}。
+    字面数据超过 max(目标大小 * max_literal_ratio, MIN_LITERAL_BUDGET) 时删除临时文件并抛出 DeltaNotWorthwhile；
+    max_literal_ratio 为 None 时不设上限。
+    """
+    base_size = os.path.getsize(base_path)
+    target_size = os.path.getsize(target_path)
+    base_hash = hashlib.sha256()
+    target_hash = hashlib.sha256()
+
+    out_dir = os.path.dirname(os.path.abspath(delta_path))
+    fd, tmp = tempfile.mkstemp(dir=out_dir, prefix='.tmp_delta_')
+    try:
+        with open(base_path, 'rb') as bf, open(target_path, 'rb') as tf, os.fdopen(fd, 'wb') as out, \
+                contextlib.ExitStack() as maps:
+            base = maps.enter_context(mmap.mmap(bf.fileno(), 0, access=mmap.ACCESS_READ)) if base_size else b''
+            target = maps.enter_context(mmap.mmap(tf.fileno(), 0, access=mmap.ACCESS_READ)) if target_size else b''
+            for off in range(0, base_size, _HASH_CHUNK):
+                base_hash.update(base[off:off + _HASH_CHUNK])
+            for off in range(0, target_size, _HASH_CHUNK):
+                target_hash.update(target[off:off + _HASH_CHUNK])
+            index = _index_blocks(base, base_size, block_size)
+            lookup = index.get
+            if max_literal_ratio is None:
+                budget = target_size
+            else:
+                budget = max(int(target_size * max_literal_ratio), MIN_LITERAL_BUDGET)
+            literal_total = 0
+            out.write(_HEADER.pack(BDIFF_MAGIC, base_size, base_hash.digest(), target_size, target_hash.digest(),
+                                   block_size))
+
+            pending_copy = None   # [offset, length]
+
+            def _flush_copy():
+                nonlocal pending_copy
+                if pending_copy:
+                    out.write(bytes([_OP_COPY]) + _COPY.pack(*pending_copy))
+                    pending_copy = None
+
+            def _write_literal(start: int, end: int):
+                nonlocal literal_total
+                literal_total += end - start
+                if literal_total > budget:
+                    raise DeltaNotWorthwhile(f'未匹配数据超过 {budget} 字节（目标 {target_size} 字节）')
+                for off in range(start, end, MAX_LITERAL):
+                    raw = target[off:min(end, off + MAX_LITERAL)]
+                    comp = zlib.compress(raw, 6)
+                    out.write(bytes([_OP_DATA]) + _DATA.pack(len(raw), len(comp)))
+                    out.write(comp)
+
+            pos = 0               # 当前窗口起点
+            literal_start = 0     # 尚未输出的字面数据起点
+            last = target_size - block_size
+            # 到达 check_at 时输出字面数据（MAX_LITERAL）或超出预算，把两项检查合并为逐字节循环中的一次比较
+            check_at = min(MAX_LITERAL, budget + 1)
+            if index and pos <= last:
+                a, b = _weak_checksum(target[pos:pos + block_size])
+            while index and pos <= last:
+                candidates = lookup((b << 16) | a)
+                if candidates is not None:
+                    off = candidates.get(_strong_checksum(target[pos:pos + block_size]))
+                    if off is not None:
+                        if literal_start < pos:
+                            _flush_copy()
+                            _write_literal(literal_start, pos)
+                        if pending_copy and pending_copy[0] + pending_copy[1] == off:
+                            pending_copy[1] += block_size
+                        else:
+                            _flush_copy()
+                            pending_copy = [off, block_size]
+                        pos += block_size
+                        literal_start = pos
+                        check_at = pos + min(MAX_LITERAL, budget - literal_total + 1)
+                        if pos <= last:
+                            a, b = _weak_checksum(target[pos:pos + block_size])
+                        continue
+                # 窗口右移一个字节：移出 target[pos]，移入 target[pos + block_size]
+                if pos < last:
+                    old = target[pos]
+                    a = (a - old + target[pos + block_size]) & 0xffff
+                    b = (b - block_size * old + a) & 0xffff
+                pos += 1
+                if pos >= check_at:
+                    _flush_copy()
+                    _write_literal(literal_start, pos)
+                    literal_start = pos
+                    check_at = pos + min(MAX_LITERAL, budget - literal_total + 1)
+            if literal_start < target_size:
+                _flush_copy()
+                _write_literal(literal_start, target_size)
+            _flush_copy()
+            out.write(bytes([_OP_END]))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, delta_path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return {
+        'size': os.path.getsize(delta_path),
+        'sha256': file_sha256(delta_path),
+        'base_sha256': base_hash.hexdigest(),
+        'target_sha256': target_hash.hexdigest(),
+    }
+
+
+def apply_binary_delta(base_path: str, delta_path: str, out_path: str) -> str:
+    """把差分应用到 base_path，生成 out_path，并校验目标 SHA-256。
+
+    基准文件的大小或 SHA-256 与差分头部不一致、差分损坏（截断、zlib/struct 错误）或还原结果校验失败时抛出 ValueError。
+    先写入同目录临时文件，校验通过后才替换 out_path，失败时删除临时文件；成功返回目标 SHA-256。
+    """
+    with open(delta_path, 'rb') as df:
+        header = df.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError(f'差分文件头部不完整: {delta_path}')
+        magic, base_size, base_sha, target_size, target_sha, _ = _HEADER.unpack(header)
+        if magic != BDIFF_MAGIC:
+            raise ValueError(f'不是有效的差分文件: {delta_path}')
+        if os.path.getsize(base_path) != base_size:
+            raise ValueError(f'基准文件大小不匹配: {base_path}')
+        if file_sha256(base_path) != base_sha.hex():
+            raise ValueError(f'基准文件内容与差分不匹配: {base_path}')
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), prefix='.tmp_apply_')
+        try:
+            h = hashlib.sha256()
+            written = 0
+            with open(base_path, 'rb') as bf, os.fdopen(fd, 'wb') as out:
+                while True:
+                    op = df.read(1)
+                    if not op:
+                        raise ValueError(f'差分文件被截断: {delta_path}')
+                    if op[0] == _OP_END:
+                        break
+                    if op[0] == _OP_COPY:
+                        off, length = _COPY.unpack(df.read(_COPY.size))
+                        bf.seek(off)
+                        while length:
+                            chunk = bf.read(min(length, _HASH_CHUNK))
+                            if not chunk:
+                                raise ValueError(f'差分引用超出基准文件范围: {delta_path}')
+                            out.write(chunk)
+                            h.update(chunk)
+                            written += len(chunk)
+                            length -= len(chunk)
+                    elif op[0] == _OP_DATA:
+                        raw_len, comp_len = _DATA.unpack(df.read(_DATA.size))
+                        if raw_len > MAX_LITERAL:
+                            raise ValueError(f'差分数据块过大: {delta_path}')
+                        # 限制解压长度，损坏或恶意的数据块不会解压出超过声明长度的数据
+                        data = zlib.decompressobj().decompress(df.read(comp_len), raw_len + 1)
+                        if len(data) != raw_len:
+                            raise ValueError(f'差分数据块长度不匹配: {delta_path}')
+                        out.write(data)
+                        h.update(data)
+                        written += len(data)
+                    else:
+                        raise ValueError(f'未知的差分操作码 {op[0]}: {delta_path}')
+                    if written > target_size:
+                        raise ValueError(f'还原结果超出目标大小: {delta_path}')
+            if written != target_size or h.digest() != target_sha:
+                raise ValueError(f'还原结果校验失败: {out_path}')
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, out_path)
+        except (struct.error, zlib.error) as e:
+            raise ValueError(f'差分文件已损坏: {delta_path}: {e}') from e
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return h.hexdigest()
+
+
+def verify_binary_delta(base_path: str, delta_path: str, target_path: str) -> bool:
+    """在临时文件中还原差分并与 target_path 逐字节比较哈希，用于测试差分是否可用；差分损坏或不匹配时返回 False。"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_path)), prefix='.tmp_verify_')
+    os.close(fd)
+    try:
+        restored = apply_binary_delta(base_path, delta_path, tmp)
+        return restored == file_sha256(target_path)
+    except ValueError:
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ---------------------- Zip entry-level patch ----------------------
+
+ZPATCH_EXT = '.zpatch'
+ZPATCH_MANIFEST = '__zpatch_manifest__.json'
+
+_EOCD = struct.Struct('<4s4H2LH')
+_EOCD_SIG = b'PK\x05\x06'
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_ZIP64_LOCATOR_SIG = b'PK\x06\x07'
+_ZIP64_EOCD = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_EOCD_SIG = b'PK\x06\x06'
+_CENTRAL = struct.Struct('<4s6H3L5H2L')
+_CENTRAL_SIG = b'PK\x01\x02'
+_LOCAL = struct.Struct('<4s5H3L2H')
+_LOCAL_SIG = b'PK\x03\x04'
+_U32 = 0xFFFFFFFF
+_U16 = 0xFFFF
+# DOS 日期 1980-01-01（补丁清单条目使用固定时间，保证相同输入生成相同补丁）
+_DOS_EPOCH = 0x21
+
+
+def _split_extra(extra: bytes) -> list:
+    """把 extra 字段拆分为 [(header_id, data), ...]。"""
+    fields = []
+    i = 0
+    while i + 4 <= len(extra):
+        hid, ln = struct.unpack('<HH', extra[i:i + 4])
+        fields.append((hid, extra[i + 4:i + 4 + ln]))
+        i += 4 + ln
+    return fields
+
+
+def read_zip_entries(mm) -> tuple:
+    """只读取中央目录（不解压任何数据），返回 (entries, comment)。
+
+    entries 按中央目录顺序排列，每项为 dict：name / crc / csize / usize / offset / record_end 等，
+    record_end 为该条目本地记录（本地头 + 数据 + 数据描述符）的结束位置。支持 ZIP64。
+    """
+    size = len(mm)
+    pos = mm.rfind(_EOCD_SIG, max(0, size - _EOCD.size - 65535))
+    if pos < 0:
+        raise ValueError('未找到 ZIP 目录结尾记录（文件可能被截断或不是 zip）')
+    _, _, _, _, total, _, cd_offset, comment_len = _EOCD.unpack(mm[pos:pos + _EOCD.size])
+    comment = bytes(mm[pos + _EOCD.size:pos + _EOCD.size + comment_len])
+    loc = pos - _ZIP64_LOCATOR.size
+    if loc >= 0 and mm[loc:loc + 4] == _ZIP64_LOCATOR_SIG:
+        _, _, eocd64, _ = _ZIP64_LOCATOR.unpack(mm[loc:loc + _ZIP64_LOCATOR.size])
+        if mm[eocd64:eocd64 + 4] != _ZIP64_EOCD_SIG:
+            raise ValueError('ZIP64 目录结尾记录损坏')
+        rec = _ZIP64_EOCD.unpack(mm[eocd64:eocd64 + _ZIP64_EOCD.size])
+        total, cd_offset = rec[7], rec[9]
+
+    entries = []
+    p = cd_offset
+    for _ in range(total):
+        if mm[p:p + 4] != _CENTRAL_SIG:
+            raise ValueError(f'中央目录记录损坏（偏移 {p}）')
+        (_, ver_made, ver_need, flags, method, mtime, mdate, crc, csize, usize,
+         nlen, elen, clen, disk, iattr, eattr, offset) = _CENTRAL.unpack(mm[p:p + _CENTRAL.size])
+        q = p + _CENTRAL.size
+        raw_name = bytes(mm[q:q + nlen])
+        extra = bytes(mm[q + nlen:q + nlen + elen])
+        file_comment = bytes(mm[q + nlen + elen:q + nlen + elen + clen])
+        lho_raw = offset
+        for hid, data in _split_extra(extra):
+            if hid != 0x0001:
+                continue
+            vals = list(struct.unpack('<%dQ' % (len(data) // 8), data[:len(data) // 8 * 8]))
+            if usize == _U32 and vals:
+                usize = vals.pop(0)
+            if csize == _U32 and vals:
+                csize = vals.pop(0)
+            if offset == _U32 and vals:
+                offset = vals.pop(0)
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        entries.append({
+            'name': name, 'raw_name': raw_name, 'ver_made': ver_made, 'ver_need': ver_need,
+            'flags': flags, 'method': method, 'mtime': mtime, 'mdate': mdate, 'crc': crc,
+            'csize': csize, 'usize': usize, 'iattr': iattr, 'eattr': eattr, 'offset': offset,
+            'extra': extra, 'comment': file_comment, 'lho_raw': lho_raw,
+            'cd_pos': p, 'cd_len': _CENTRAL.size + nlen + elen + clen,
+        })
+        p += _CENTRAL.size + nlen + elen + clen
+
+    # 本地记录的结束位置 = 下一个本地记录的起点（或中央目录起点），包含可选的数据描述符
+    ends = sorted(set(e['offset'] for e in entries)) + [cd_offset]
+    nxt = {ends[i]: ends[i + 1] for i in range(len(ends) - 1)}
+    for e in entries:
+        e['record_end'] = nxt[e['offset']]
+        if e['record_end'] - e['offset'] < _LOCAL.size + e['csize']:
+            raise ValueError(f'条目数据不完整: {e["name"]}')
+    return entries, comment
+
+
+def _entry_key(mm, e: dict) -> tuple:
+    """判断条目是否变化所用的键。
+
+    除 CRC、压缩/原始大小与压缩方式外，还包含会被原样拷贝的头部字段：中央目录中的版本/标志/
+    修改时间/属性/extra（去掉随偏移变化的 ZIP64 字段）/注释，以及本地头的完整字节和本地记录长度
+    （含数据描述符）。只改了修改时间或 extra 的条目也会进入补丁，保证还原结果逐字节一致。
+    """
+    nlen, elen = struct.unpack('<HH', mm[e['offset'] + 26:e['offset'] + 30])
+    local = bytes(mm[e['offset']:e['offset'] + _LOCAL.size + nlen + elen])
+    extra = tuple(f for f in _split_extra(e['extra']) if f[0] != 0x0001)
+    return (e['crc'], e['csize'], e['usize'], e['method'], e['flags'], e['mtime'], e['mdate'],
+            e['ver_made'], e['ver_need'], e['iattr'], e['eattr'], extra, e['comment'],
+            local, e['record_end'] - e['offset'])
+
+
+class _HashingWriter:
+    """包装输出文件，写入的同时计算 SHA-256（无需写完后再读一遍）。"""
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.f.write(data)
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+
+class _RawZipWriter:
+    """按原始字节拷贝本地记录来拼装 zip，不解压也不重新压缩。"""
+
+    def __init__(self, f):
+        self.f = f
+        self.central = []
+        self.count = 0
+
+    def add_raw(self, mm, entry: dict):
+        """从 mm 原样拷贝 entry 的本地记录，并登记对应的中央目录记录。"""
+        new_off = self.f.tell()
+        start, end = entry['offset'], entry['record_end']
+        for off in range(start, end, _HASH_CHUNK):
+            self.f.write(mm[off:min(end, off + _HASH_CHUNK)])
+        if entry['lho_raw'] != _U32 and new_off < _U32:
+            # 直接复用原中央目录记录，只修改本地头偏移，尽量保证与原 zip 字节一致
+            cd = bytearray(mm[entry['cd_pos']:entry['cd_pos'] + entry['cd_len']])
+            cd[42:46] = struct.pack('<L', new_off)
+            self.central.append(bytes(cd))
+        else:
+            self.central.append(self._central_record(entry, new_off))
+        self.count += 1
+
+    def add_bytes(self, name: str, data: bytes):
+        """以不压缩（stored）方式写入一个小文件（用于补丁清单）。"""
+        raw_name = name.encode('utf-8')
+        crc = zlib.crc32(data) & _U32
+        entry = {
+            'raw_name': raw_name, 'ver_made': 20, 'ver_need': 20, 'flags': 0x800, 'method': 0,
+            'mtime': 0, 'mdate': _DOS_EPOCH, 'crc': crc, 'csize': len(data),
+            'usize': len(data), 'iattr': 0, 'eattr': 0, 'extra': b'', 'comment': b'',
+        }
+        new_off = self.f.tell()
+        self.f.write(_LOCAL.pack(_LOCAL_SIG, 20, 0x800, 0, 0, entry['mdate'], crc,
+                                 len(data), len(data), len(raw_name), 0))
+        self.f.write(raw_name)
+        self.f.write(data)
+        self.central.append(self._central_record(entry, new_off))
+        self.count += 1
+
+    @staticmethod
+    def _central_record(entry: dict, offset: int) -> bytes:
+        """重新生成中央目录记录，必要时写入 ZIP64 扩展字段。"""
+        usize, csize = entry['usize'], entry['csize']
+        zip64 = []
+        if usize >= _U32:
+            zip64.append(usize)
+            usize = _U32
+        if csize >= _U32:
+            zip64.append(csize)
+            csize = _U32
+        if offset >= _U32:
+            zip64.append(offset)
+            offset = _U32
+        extra = b''.join(struct.pack('<HH', hid, len(d)) + d
+                         for hid, d in _split_extra(entry['extra']) if hid != 0x0001)
+        ver_need = entry['ver_need']
+        if zip64:
+            extra = struct.pack('<HH', 0x0001, 8 * len(zip64)) + struct.pack('<%dQ' % len(zip64), *zip64) + extra
+            ver_need = max(ver_need, 45)
+        return _CENTRAL.pack(_CENTRAL_SIG, entry['ver_made'], ver_need, entry['flags'], entry['method'],
+                             entry['mtime'], entry['mdate'], entry['crc'], csize, usize,
+                             len(entry['raw_name']), len(extra), len(entry['comment']), 0,
+                             entry['iattr'], entry['eattr'], offset) + entry['raw_name'] + extra + entry['comment']
+
+    def close(self, comment: bytes = b''):
+        """写入中央目录与目录结尾记录（条目或偏移超限时写 ZIP64 记录）。"""
+        cd_offset = self.f.tell()
+        for rec in self.central:
+            self.f.write(rec)
+        cd_size = self.f.tell() - cd_offset
+        count = self.count
+        if count >= _U16 or cd_size >= _U32 or cd_offset >= _U32:
+            eocd64 = self.f.tell()
+            self.f.write(_ZIP64_EOCD.pack(_ZIP64_EOCD_SIG, _ZIP64_EOCD.size - 12, 45, 45, 0, 0,
+                                          count, count, cd_size, cd_offset))
+            self.f.write(_ZIP64_LOCATOR.pack(_ZIP64_LOCATOR_SIG, 0, eocd64, 1))
+            count, cd_size, cd_offset = min(count, _U16), min(cd_size, _U32), min(cd_offset, _U32)
+        self.f.write(_EOCD.pack(_EOCD_SIG, 0, 0, count, count, cd_size, cd_offset, len(comment)))
+        self.f.write(comment)
+
+
+def _open_mmap(f):
+    """以只读方式映射文件；空文件返回 b''（mmap 不支持长度为 0 的文件）。"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def create_zip_patch(base_zip: str, target_zip: str, patch_path: str) -> dict:
+    """对比两个 zip 的条目（CRC、大小与头部字段），生成“变化条目 + 删除列表”的补丁包。
+
+    补丁包本身是一个 zip：变化/新增条目从 target_zip 原样拷贝（不解压不重压），
+    另含 __zpatch_manifest__.json，记录目标 zip 的条目顺序、每个条目的 CRC/大小、删除列表
+    以及目标 zip 的 SHA-256（应用补丁后据此确认逐字节一致）。
+    两个文件都通过 mmap 访问，内存占用与 zip 大小无关。返回 {'size','sha256','changed','deleted','unchanged'}。
+    """
+    out_dir = os.path.dirname(os.path.abspath(patch_path))
+    fd, tmp = tempfile.mkstemp(dir=out_dir, prefix='.tmp_zpatch_')
+    try:
+        with open(base_zip, 'rb') as bf, open(target_zip, 'rb') as tf, os.fdopen(fd, 'wb') as out:
+            base_mm, target_mm = _open_mmap(bf), _open_mmap(tf)
+            try:
+                base_entries, _ = read_zip_entries(base_mm)
+                target_entries, comment = read_zip_entries(target_mm)
+                base_keys = {e['name']: _entry_key(base_mm, e) for e in base_entries}
+                target_names = set(e['name'] for e in target_entries)
+                changed = [e for e in target_entries
+                           if base_keys.get(e['name']) != _entry_key(target_mm, e)]
+                deleted = [n for n in base_keys if n not in target_names]
+
+                writer = _RawZipWriter(out)
+                for e in changed:
+                    writer.add_raw(target_mm, e)
+                manifest = {
+                    'format': 'zpatch',
+                    'entries': [[e['name'], e['crc'], e['csize'], e['usize']] for e in target_entries],
+                    'changed': [e['name'] for e in changed],
+                    'deleted': deleted,
+                    'comment': comment.hex(),
+                    'sha256': file_sha256(target_zip),
+                }
+                writer.add_bytes(ZPATCH_MANIFEST, json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+                writer.close()
+            finally:
+                for m in (base_mm, target_mm):
+                    if isinstance(m, mmap.mmap):
+                        m.close()
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, patch_path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {
+        'size': os.path.getsize(patch_path),
+        'sha256': file_sha256(patch_path),
+        'changed': len(changed),
+        'deleted': len(deleted),
+        'unchanged': len(target_entries) - len(changed),
+    }
+
+
+def apply_zip_patch(base_zip: str, patch_path: str, out_zip: str) -> dict:
+    """用补丁包把 base_zip 还原为目标 zip，写入 out_zip，并按清单校验每个条目的 CRC 与大小。
+
+    未变化的条目从 base_zip 原样拷贝，变化条目从补丁包拷贝，顺序与目标 zip 一致。
+    清单带有目标 SHA-256 时，写入过程中同步计算输出的 SHA-256 并与之比对。
+    校验失败时删除输出并抛出 ValueError；成功返回补丁清单。
+    """
+    with open(base_zip, 'rb') as bf, open(patch_path, 'rb') as pf:
+        base_mm, patch_mm = _open_mmap(bf), _open_mmap(pf)
+        try:
+            patch_entries, _ = read_zip_entries(patch_mm)
+            by_name = {e['name']: e for e in patch_entries}
+            meta = by_name.pop(ZPATCH_MANIFEST, None)
+            if meta is None or meta['method'] != 0:
+                raise ValueError(f'补丁包缺少清单: {patch_path}')
+            data_start = meta['record_end'] - meta['csize']
+            manifest = json.loads(bytes(patch_mm[data_start:meta['record_end']]).decode('utf-8'))
+            base_by_name = {e['name']: e for e in read_zip_entries(base_mm)[0]}
+
+            try:
+                with open(out_zip, 'wb') as f:
+                    out = _HashingWriter(f)
+                    writer = _RawZipWriter(out)
+                    for name, crc, csize, usize in manifest['entries']:
+                        if name in by_name:
+                            src_mm, e = patch_mm, by_name[name]
+                        elif name in base_by_name:
+                            src_mm, e = base_mm, base_by_name[name]
+                        else:
+                            raise ValueError(f'补丁与基准包都不包含条目: {name}')
+                        if (e['crc'], e['csize'], e['usize']) != (crc, csize, usize):
+                            raise ValueError(f'条目校验失败（基准包版本不匹配?）: {name}')
+                        writer.add_raw(src_mm, e)
+                    writer.close(bytes.fromhex(manifest.get('comment', '')))
+                expected = manifest.get('sha256')
+                if expected and out.hash.hexdigest() != expected:
+                    raise ValueError(f'还原结果与目标包 SHA-256 不一致（头部字段不同?）: {out_zip}')
+            except Exception:
+                if os.path.exists(out_zip):
+                    os.remove(out_zip)
+                raise
+        finally:
+            for m in (base_mm, patch_mm):
+                if isinstance(m, mmap.mmap):
+                    m.close()
+    return manifest
+
+
+def verify_zip_patch(base_zip: str, patch_path: str, target_zip: str) -> bool:
+    """在临时文件中应用补丁，并确认还原结果与 target_zip 逐字节一致（比较 SHA-256）。"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_zip)), prefix='.tmp_verify_')
+    os.close(fd)
+    try:
+        manifest = apply_zip_patch(base_zip, patch_path, tmp)
+        # 清单中的 SHA-256 已在应用时与输出比对过；旧补丁没有该字段时直接对输出取哈希
+        rebuilt = manifest.get('sha256') or file_sha256(tmp)
+        return rebuilt == file_sha256(target_zip)
+    except ValueError:
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ---------------------- Upgrade manifest ----------------------
+
+
+def write_manifest(uppath: str, manifest: dict, durability: Optional[Durability] = None) -> str:
+    """把升级元数据写入 uppath/upgrade_manifest.json（临时文件 + 原子替换，落盘策略见 copy_engine.Durability）。"""
+    dst = os.path.join(uppath, MANIFEST_NAME)
+    fd, tmp = tempfile.mkstemp(dir=uppath, prefix='.tmp_manifest_')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        if durability is not None:
+            f.flush()
+            durability.before_close(f.fileno())
+    # mkstemp 创建的文件权限为 0600，镜像服务器需要可读
+    os.chmod(tmp, 0o644)
+    commit_file(tmp, dst, durability)
+    return dst
+
+
+def _write_atomic(path: str, data: bytes, durability: Optional[Durability] = None):
+    """写入同目录临时文件后原子替换，保证轮询方不会读到写了一半的文件。"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp_publish_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if durability is not None:
+                f.flush()
+                durability.before_close(f.fileno())
+        os.chmod(tmp, 0o644)
+        commit_file(tmp, path, durability)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def publish_releases_json(src: str, uppath: str, dry_run: bool,
+                          log: Optional[Callable[[str, str], None]] = None,
+                          durability: Optional[Durability] = None) -> list:
+    """把 releases.json 以可直接服务的形式发布到 uppath。
+
+    - releases.json：去掉空白的紧凑 JSON（内容不变；源文件不是合法 JSON 时抛出 ValueError，避免发布坏文件）
+    - releases.json.gz / releases.json.br：预压缩版本（gzip 的 mtime 固定为 0，相同内容得到相同字节）
+    - releases.json.etag：强 ETag（"<sha256>"），最后写入；镜像读到旧 ETag + 新内容时客户端下次轮询会自动纠正
+    durability 为落盘策略（见 copy_engine.Durability），默认不 fsync。
+    返回写入的文件路径列表（dry_run 时为计划写入的路径）。
+    """
+    with open(src, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f'releases.json 不是合法的 JSON: {src}: {e}')
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()
+
+    dst = os.path.join(uppath, RELEASES_NAME)
+    variants = [(dst, body), (dst + '.gz', gzip.compress(body, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((dst + '.br', brotli.compress(body, quality=11)))
+    variants.append((dst + ETAG_SUFFIX, etag.encode('ascii')))
+
+    written = []
+    for path, payload in variants:
+        if dry_run:
+            if log:
+                log(f'[DRY] WRITE: {path} ({len(payload)} 字节)', 'info')
+        else:
+            _write_atomic(path, payload, durability)
+            if log:
+                log(f'WRITE {path} ({len(payload)} 字节)', 'success')
+        written.append(path)
+    if log and brotli is None:
+        log('未安装 brotli，跳过 releases.json.br', 'info')
+    return written
+
+
+def load_manifest(directory: str) -> Optional[dict]:
+    """读取 directory/upgrade_manifest.json；不存在或格式错误时返回 None。"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def retained_deltas(manifest: Optional[dict], versions: list, keep: int, base_dir: str) -> list:
+    """从上一份清单中挑出需要继续保留的差分。
+
+    只保留目标版本属于 releases.json 最近 keep 个版本、且差分文件仍在 base_dir 中的条目。
+    """
+    if not manifest or keep <= 0:
+        return []
+    recent = set(versions[-keep:])
+    return [d for d in manifest.get('deltas', [])
+            if d.get('to') in recent and os.path.exists(os.path.join(base_dir, d.get('file', '')))]
+
+
+def plan_upgrade_paths(versions: list, packages: list, deltas: list) -> dict:
+    """为每个平台、每个旧版本选择升级到最新版本的最省流量路径。
+
+    versions: releases.json 中的版本列表
+    packages: 本次生成的完整升级包 [{'platform','version','file','size'}, ...]（version 即该平台的目标版本）
+    deltas: 可用差分 [{'platform','from','to','file','size'}, ...]
+    在差分构成的有向图上求最短路径（按字节数），与直接下载完整包比较，取总字节数更少者（相等时选完整包）。
+    返回 {platform: {'target', 'full': {'file','size'}, 'from': {version: {'method','steps','bytes'}}}}。
+    """
+    plans = {}
+    for pkg in packages:
+        platform, target = pkg['platform'], pkg['version']
+        edges = {}
+        for d in deltas:
+            if d['platform'] == platform:
+                edges.setdefault(d['to'], []).append((d['from'], d['size'], d['file']))
+
+        # 从目标版本反向做 Dijkstra，得到每个旧版本到目标版本的最短差分链
+        best = {target: (0, [])}
+        heap = [(0, target)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > best[node][0]:
+                continue
+            for src, size, name in edges.get(node, []):
+                new_cost = cost + size
+                if src not in best or new_cost < best[src][0]:
+                    best[src] = (new_cost, [name] + best[node][1])
+                    heapq.heappush(heap, (new_cost, src))
+
+        routes = {}
+        for v in versions:
+            if version_key(v) >= version_key(target):
+                continue
+            chain = best.get(v)
+            if chain and chain[0] < pkg['size']:
+                routes[v] = {'method': 'delta', 'steps': chain[1], 'bytes': chain[0]}
+            else:
+                routes[v] = {'method': 'full', 'steps': [pkg['file']], 'bytes': pkg['size']}
+        plans[platform] = {'target': target, 'full': {'file': pkg['file'], 'size': pkg['size']}, 'from': routes}
+    return plans
+
+
+def build_deltas(upgrades: list, versions: list, base_dir: str, uppath: str, dry_run: bool,
+                 log: Optional[Callable[[str, str], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 fmt: str = 'bdiff', edition: str = 'standard') -> list:
+    """为本次生成的每个升级包生成“上一版本 -> 本版本”的差分。
+
+    upgrades: [(upgrade_arch, version, package_path), ...]
+    versions: releases.json 中的版本列表（由 load_release_versions 得到）
+    base_dir: 存放上一版本升级包的目录
+    fmt: 'bdiff'（二进制差分）或 'zpatch'（zip 条目级补丁；包不是有效 zip 时回退为 bdiff）
+    edition: upgrades 所属版次的 slug，决定上一版本升级包与差分的文件名
+    返回差分条目列表（写入 upgrade_manifest.json 的 'deltas'）。
+    """
+    if fmt not in ('bdiff', 'zpatch'):
+        raise ValueError(f'未知的差分格式: {fmt}')
+    entries = []
+    for upgrade_arch, ver, pkg in upgrades:
+        if should_stop and should_stop():
+            break
+        prev = previous_version(versions, ver)
+        if not prev:
+            if log:
+                log(f'releases.json 中没有早于 {ver} 的版本，跳过差分: {upgrade_arch}', 'warning')
+            continue
+        base = os.path.join(base_dir, upgrade_package_name(prev, upgrade_arch, edition))
+        name = delta_name(prev, ver, upgrade_arch, ZPATCH_EXT if fmt == 'zpatch' else BDIFF_EXT, edition)
+        if dry_run:
+            if log:
+                log(f'[DRY] DELTA: {base} -> {pkg} => {os.path.join(uppath, name)}', 'info')
+            continue
+        if not os.path.exists(base):
+            if log:
+                log(f'未找到上一版本升级包，跳过差分: {base}', 'warning')
+            continue
+        entry_fmt = fmt
+        try:
+            if fmt == 'zpatch':
+                try:
+                    info = create_zip_patch(base, pkg, os.path.join(uppath, name))
+                except ValueError as e:
+                    if log:
+                        log(f'无法按 zip 条目生成补丁（{e}），改用二进制差分: {upgrade_arch}', 'warning')
+                    entry_fmt = 'bdiff'
+                    name = delta_name(prev, ver, upgrade_arch, BDIFF_EXT, edition)
+                    info = create_binary_delta(base, pkg, os.path.join(uppath, name))
+            else:
+                info = create_binary_delta(base, pkg, os.path.join(uppath, name))
+        except DeltaNotWorthwhile as e:
+            # 客户端改为下载完整包，不算失败
+            if log:
+                log(f'差分收益过低，跳过 {name}: {e}', 'warning')
+            continue
+        except Exception as e:
+            if log:
+                log(f'生成差分失败 {name}: {e}', 'error')
+            continue
+        entry = {
+            'platform': upgrade_arch,
+            'from': prev,
+            'to': ver,
+            'file': name,
+            'format': entry_fmt,
+            'size': info['size'],
+            'sha256': info['sha256'],
+        }
+        if entry_fmt == 'bdiff':
+            entry['base_sha256'] = info['base_sha256']
+            entry['target_sha256'] = info['target_sha256']
+        else:
+            entry['changed'] = info['changed']
+            entry['deleted'] = info['deleted']
+        entries.append(entry)
+        if log:
+            full = os.path.getsize(pkg)
+            log(f'DELTA {name}: {info["size"]} 字节（完整包 {full} 字节）', 'success')
+    return entries
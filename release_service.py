@@ -0,0 +1,498 @@
+"""
+Local release job service.
+- Accepts create_release jobs over HTTP (TCP) or a Unix domain socket
+- Jobs are kept in a durable SQLite queue and survive service restarts
+- A worker pool executes them; jobs touching the same output folder / upgrade directory are serialized
+- Each job's log and progress events are stored and streamed to clients as Server-Sent Events
+
+Run:
+  python release_service.py serve --port 39100 --workers 2
+  python release_service.py serve --unix /tmp/release.sock
+  python release_service.py submit job.json --follow
+  python release_service.py submit job.json --unix /tmp/release.sock --follow
+
+API:
+  POST /jobs                   提交任务（JSON，字段同 create_release 参数，version/date 必填）-> {"id": 1}
+  GET  /jobs                   任务列表（最近 100 个）
+  GET  /jobs/<id>              任务详情（状态、参数、汇总、错误）
+  POST /jobs/<id>/cancel       取消排队中的任务，或向运行中的任务发送停止信号
+  GET  /jobs/<id>/events       SSE 事件流（支持 Last-Event-ID 续接），任务结束后关闭
+
+说明（中文）:
+多名操作人员在不同机器上触发发布，经常在同一个 output_base 下互相覆盖。本服务在发布机本地运行：
+ - 任务写入 SQLite（WAL 模式），服务重启后排队中的任务继续执行；重启时处于运行中的任务标记为失败（可能只完成了一半，需人工确认后重新提交）；
+ - 调度规则与 release_batch 相同（conflict_keys）：输出主文件夹或 uppath 相同的任务按提交顺序串行，其余任务并行；
+ - 日志与进度（create_release 的 log_callback / progress_callback）逐条写入 events 表，客户端通过 SSE 实时接收，断线后可用 Last-Event-ID 续接；
+ - 默认只监听 127.0.0.1；需要给其他机器使用时请放在有认证的反向代理之后，或改用 Unix socket 并通过文件权限控制访问。
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List, Optional
+
+from release_batch import conflict_keys, normalize_job
+from rename_tool import create_release
+
+DEFAULT_PORT = 39100
+DEFAULT_DB = 'release_jobs.sqlite3'
+FINISHED = ('done', 'failed', 'stopped', 'cancelled')
+
+
+class JobStore:
+    """SQLite 任务队列与事件日志；每个线程使用独立连接。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, params TEXT NOT NULL, status TEXT NOT NULL, '
+                         'submitted_by TEXT, created REAL NOT NULL, started REAL, finished REAL, '
+                         'summary TEXT, error TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS events ('
+                         'job_id INTEGER NOT NULL, seq INTEGER NOT NULL, ts REAL NOT NULL, kind TEXT NOT NULL, '
+                         'level TEXT, percent INTEGER, message TEXT, PRIMARY KEY (job_id, seq))')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, params: dict, submitted_by: str = '') -> int:
+        with self._conn() as conn:
+            cur = conn.execute('INSERT INTO jobs (params, status, submitted_by, created) VALUES (?, ?, ?, ?)',
+                               (json.dumps(params, ensure_ascii=False), 'queued', submitted_by, time.time()))
+            return cur.lastrowid
+
+    def get(self, job_id: int) -> Optional[dict]:
+        row = self._conn().execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, limit: int = 100) -> List[dict]:
+        rows = self._conn().execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def queued(self) -> List[dict]:
+        rows = self._conn().execute("SELECT * FROM jobs WHERE status='queued' ORDER BY id").fetchall()
+        return [self._row(r) for r in rows]
+
+    def claim(self, job_id: int) -> bool:
+        """把排队中的任务标记为运行中；被其他线程抢先或已取消时返回 False。"""
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE jobs SET status='running', started=? WHERE id=? AND status='queued'",
+                               (time.time(), job_id))
+            return cur.rowcount == 1
+
+    def finish(self, job_id: int, status: str, summary: Optional[dict] = None, error: str = ''):
+        with self._conn() as conn:
+            conn.execute('UPDATE jobs SET status=?, finished=?, summary=?, error=? WHERE id=?',
+                         (status, time.time(), json.dumps(summary, ensure_ascii=False) if summary else None,
+                          error, job_id))
+
+    def cancel_queued(self, job_id: int) -> bool:
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE jobs SET status='cancelled', finished=? WHERE id=? AND status='queued'",
+                               (time.time(), job_id))
+            return cur.rowcount == 1
+
+    def recover(self) -> int:
+        """服务启动时把上次遗留的运行中任务标记为失败，返回数量。"""
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE jobs SET status='failed', finished=?, error=? WHERE status='running'",
+                               (time.time(), '服务重启时任务被中断'))
+            return cur.rowcount
+
+    def add_event(self, job_id: int, kind: str, message: str = '', level: str = None,
+                  percent: Optional[int] = None) -> int:
+        """追加一条事件并返回其序号。
+
+        create_release 的日志回调会在多个复制线程中同时调用，每个线程有自己的连接：
+        用 BEGIN IMMEDIATE 先取得写锁再读取 MAX(seq)，避免两个线程拿到相同的序号。
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id=?', (job_id,)).fetchone()[0]
+            conn.execute('INSERT INTO events (job_id, seq, ts, kind, level, percent, message) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (job_id, seq, time.time(), kind, level, percent, message))
+            return seq
+
+    def events(self, job_id: int, after: int = 0) -> List[dict]:
+        rows = self._conn().execute('SELECT * FROM events WHERE job_id=? AND seq>? ORDER BY seq',
+                                    (job_id, after)).fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        d = dict(row)
+        d['params'] = json.loads(d['params'])
+        if d.get('summary'):
+            d['summary'] = json.loads(d['summary'])
+        return d
+
+
+class ReleaseService:
+    """调度器 + 工作线程池：按提交顺序挑选不与运行中任务冲突的任务执行。"""
+
+    def __init__(self, store: JobStore, workers: int = 2):
+        self.store = store
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._running = {}  # job_id -> (conflict keys, stop_event)
+        self._shutdown = False
+        self._threads = []
+
+    def start(self):
+        recovered = self.store.recover()
+        if recovered:
+            print(f'{recovered} 个上次未完成的任务已标记为失败', flush=True)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f'release-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 60.0) -> bool:
+        """通知运行中的任务停止，并等待工作线程退出（最多 timeout 秒），避免进程退出时任务写到一半被杀掉。
+
+        返回是否所有工作线程都已退出。
+        """
+        with self._cond:
+            self._shutdown = True
+            running = len(self._running)
+            for _, ev in self._running.values():
+                ev.set()
+            self._cond.notify_all()
+        if running:
+            print(f'等待 {running} 个运行中的任务停止...', flush=True)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        alive = [t for t in self._threads if t.is_alive()]
+        if alive:
+            print(f'{len(alive)} 个任务在 {timeout:.0f} 秒内未能停止', file=sys.stderr, flush=True)
+        return not alive
+
+    def submit(self, raw: dict, submitted_by: str = '') -> int:
+        job = normalize_job(raw, name='请求')
+        job_id = self.store.add(job, submitted_by)
+        self.store.add_event(job_id, 'status', 'queued')
+        self.notify()
+        return job_id
+
+    def cancel(self, job_id: int) -> str:
+        with self._cond:
+            if job_id in self._running:
+                self._running[job_id][1].set()
+                return 'stopping'
+        if self.store.cancel_queued(job_id):
+            self.store.add_event(job_id, 'status', 'cancelled')
+            self.notify()
+            return 'cancelled'
+        return 'unchanged'
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_for_event(self, timeout: float):
+        with self._cond:
+            self._cond.wait(timeout)
+
+    @staticmethod
+    def _conflict(a: set, b: set) -> bool:
+        return '*' in a or '*' in b or bool(a & b)
+
+    def _pick(self) -> Optional[dict]:
+        """在持有 _cond 时调用：返回第一个可运行的排队任务（不与运行中或更早排队的任务冲突）。"""
+        running = [keys for keys, _ in self._running.values()]
+        earlier = []
+        for job in self.store.queued():
+            keys = conflict_keys(job['params'])
+            if not any(self._conflict(keys, k) for k in running + earlier):
+                return dict(job, keys=keys)
+            earlier.append(keys)
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    job = self._pick()
+                    if job is None:
+                        self._cond.wait(5)
+                    elif self.store.claim(job['id']):
+                        break
+                if self._shutdown:
+                    return
+                stop_event = threading.Event()
+                self._running[job['id']] = (job['keys'], stop_event)
+            try:
+                self._execute(job, stop_event)
+            finally:
+                with self._cond:
+                    self._running.pop(job['id'], None)
+                    self._cond.notify_all()
+
+    def _execute(self, job: dict, stop_event: threading.Event):
+        job_id = job['id']
+
+        def _log(msg: str, level: str = 'info'):
+            self.store.add_event(job_id, 'log', msg, level=level)
+            self.notify()
+
+        def _progress(pct: int, msg: str = ''):
+            self.store.add_event(job_id, 'progress', msg, percent=pct)
+            self.notify()
+
+        self.store.add_event(job_id, 'status', 'running')
+        try:
+            summary = create_release(log_callback=_log, progress_callback=_progress, stop_event=stop_event,
+                                     **job['params'])
+            status = 'stopped' if summary.get('status') == 'stopped' else 'done'
+            self.store.finish(job_id, status, summary)
+        except Exception as e:
+            status = 'failed'
+            self.store.add_event(job_id, 'log', f'执行失败: {e}', level='error')
+            self.store.finish(job_id, status, error=str(e))
+        self.store.add_event(job_id, 'status', status)
+        self.notify()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'gerenzhushou-release-service/1.0'
+
+    @property
+    def service(self) -> ReleaseService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        # Unix socket 的 client_address 是空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, obj, status: int = 200):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self, part: str) -> Optional[int]:
+        try:
+            return int(part)
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        if parts == ['jobs']:
+            return self._send_json(self.service.store.list())
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            job_id = self._job_id(parts[1])
+            job = self.service.store.get(job_id) if job_id is not None else None
+            if job is None:
+                return self._send_json({'error': 'not found'}, 404)
+            if len(parts) == 2:
+                return self._send_json(job)
+            if parts[2:] == ['events']:
+                return self._stream_events(job_id)
+        self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if parts == ['jobs']:
+            try:
+                raw = json.loads(body.decode('utf-8') or '{}')
+                job_id = self.service.submit(raw, self.address_string())
+            except ValueError as e:
+                return self._send_json({'error': str(e)}, 400)
+            return self._send_json({'id': job_id, 'status': 'queued'}, 201)
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job_id = self._job_id(parts[1])
+            if job_id is None or self.service.store.get(job_id) is None:
+                return self._send_json({'error': 'not found'}, 404)
+            return self._send_json({'id': job_id, 'result': self.service.cancel(job_id)})
+        self._send_json({'error': 'not found'}, 404)
+
+    def _stream_events(self, job_id: int):
+        """SSE：先补发 Last-Event-ID 之后的历史事件，再实时推送，任务结束后关闭连接。"""
+        try:
+            last = int(self.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            last = 0
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        idle = 0.0
+        try:
+            while True:
+                events = self.service.store.events(job_id, last)
+                for ev in events:
+                    data = json.dumps({k: ev[k] for k in ('ts', 'kind', 'level', 'percent', 'message')},
+                                      ensure_ascii=False)
+                    self.wfile.write(f'id: {ev["seq"]}\nevent: {ev["kind"]}\ndata: {data}\n\n'.encode('utf-8'))
+                    last = ev['seq']
+                if events:
+                    self.wfile.flush()
+                    idle = 0.0
+                job = self.service.store.get(job_id)
+                if job['status'] in FINISHED and not self.service.store.events(job_id, last):
+                    break
+                self.service.wait_for_event(1.0)
+                idle += 1.0
+                if idle >= 15:
+                    # 心跳注释行，防止代理因空闲断开
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    idle = 0.0
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ServiceHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: ReleaseService, quiet: bool = False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__(address, ServiceHandler)
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class ServiceUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path: str, service: ReleaseService, quiet: bool = False):
+            self.service = service
+            self.quiet = quiet
+            if os.path.exists(path):
+                os.remove(path)
+            super().__init__(path, ServiceHandler)
+            os.chmod(path, 0o660)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 30):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def _connect(url: str, unix: Optional[str], timeout: float = 30) -> http.client.HTTPConnection:
+    if unix:
+        return _UnixHTTPConnection(unix, timeout)
+    host, _, port = url.replace('http://', '').rstrip('/').partition(':')
+    return http.client.HTTPConnection(host, int(port or 80), timeout=timeout)
+
+
+def follow_events(url: str, unix: Optional[str], job_id: int) -> Optional[str]:
+    """打印任务的 SSE 事件直到任务结束，返回最终状态。"""
+    conn = _connect(url, unix, timeout=3600)
+    conn.request('GET', f'/jobs/{job_id}/events')
+    resp = conn.getresponse()
+    final = None
+    kind = None
+    for raw in resp:
+        line = raw.decode('utf-8').rstrip('\n')
+        if line.startswith('event: '):
+            kind = line[7:]
+        elif line.startswith('data: '):
+            ev = json.loads(line[6:])
+            if kind == 'progress':
+                print(f'[{ev["percent"]:>3}%] {ev["message"]}', flush=True)
+            elif kind == 'status':
+                final = ev['message']
+                print(f'== {final}', flush=True)
+            else:
+                print(f'[{ev["level"]}] {ev["message"]}', flush=True)
+    conn.close()
+    return final
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='本地发布任务服务')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_serve = sub.add_parser('serve', help='启动服务')
+    p_serve.add_argument('--host', default='127.0.0.1')
+    p_serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    p_serve.add_argument('--unix', default=None, help='改为监听 Unix socket 路径')
+    p_serve.add_argument('--db', default=DEFAULT_DB, help='任务队列数据库文件')
+    p_serve.add_argument('--workers', type=int, default=2, help='同时执行的任务数上限')
+    p_serve.add_argument('--quiet', action='store_true', help='不输出访问日志')
+    p_submit = sub.add_parser('submit', help='提交任务文件（单个任务的 JSON 对象）')
+    p_submit.add_argument('jobfile')
+    p_submit.add_argument('--url', default=f'http://127.0.0.1:{DEFAULT_PORT}')
+    p_submit.add_argument('--unix', default=None)
+    p_submit.add_argument('--follow', action='store_true', help='提交后实时显示日志直到任务结束')
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'submit':
+        with open(args.jobfile, 'r', encoding='utf-8') as f:
+            body = f.read().encode('utf-8')
+        conn = _connect(args.url, args.unix)
+        conn.request('POST', '/jobs', body, {'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        result = json.loads(resp.read().decode('utf-8'))
+        conn.close()
+        print(json.dumps(result, ensure_ascii=False))
+        if resp.status != 201:
+            return 1
+        if args.follow:
+            return 0 if follow_events(args.url, args.unix, result['id']) == 'done' else 1
+        return 0
+
+    service = ReleaseService(JobStore(args.db), args.workers)
+    service.start()
+    if args.unix:
+        if not hasattr(socket, 'AF_UNIX'):
+            print('当前系统不支持 Unix socket', file=sys.stderr)
+            return 2
+        server = ServiceUnixServer(args.unix, service, args.quiet)
+        where = args.unix
+    else:
+        server = ServiceHTTPServer((args.host, args.port), service, args.quiet)
+        where = f'http://{args.host}:{server.server_address[1]}'
+    print(f'发布任务服务已启动: {where}（数据库 {args.db}，{args.workers} 个工作线程）', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
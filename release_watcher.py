@@ -0,0 +1,305 @@
+"""
+Watcher daemon that starts create_release as soon as every selected platform build has landed.
+- Built on rename_tool.scan_package_index (same index the GUI and create_release use)
+- Linux: inotify through ctypes; other systems (or --polling): periodic rescans
+- Each artifact must keep the same size and mtime for --settle seconds before it counts as landed
+
+Run:
+  python release_watcher.py --pkgpath ./package --settle 60
+  python release_watcher.py --version 1.3.2 --platforms linux-arm64 mac-arm64 win-x64 --once
+  python release_watcher.py --pkgpath //build-arm/package //build-x64/package
+
+说明（中文）:
+构建机会在不确定的时间把 pkg-linux-arm64、pkg-mac-arm64 等文件夹放进 package/，以前需要有人打开 GUI 手动点击“开始执行发布”。
+ - --pkgpath 可以给出多个目录（各构建机的共享目录），全部监听，索引合并方式同 create_release；
+ - 监听 package/ 及其中的 pkg-* 子目录（inotify 事件到达时立即重新扫描；不支持 inotify 时每 --poll 秒扫描一次）；
+ - 每个平台的源文件在 --settle 秒内大小和 mtime 都不再变化才视为“已落地”，避免拿到正在写入的文件；
+ - 所有选中平台都已落地后调用 create_release（默认开启 verify_sources，半截文件会被 CRC 校验拦下）；
+ - 版本号默认取 help_documentation/releases.json 的 currentRelease，日期取触发当天；
+ - 同一组源文件（各平台的大小 + mtime）只在发布成功后记为已发布，之后有新的构建落地才会再次触发；
+   无法确定版本号或发布失败时不记为已发布，同一组源文件在 --retry 秒后重试（期间有新构建落地则按新文件重新等待）；
+ - --once 则成功发布一次后退出。
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Union
+
+from copy_engine import DURABILITY_MODES
+from rename_tool import create_release, package_roots, scan_package_index
+
+DEFAULT_PLATFORMS = ['linux-arm64', 'linux-x64', 'mac-arm64', 'mac-x64', 'win-x64']
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+_EVENT = struct.Struct('iIII')
+
+
+class _Inotify:
+    """极简 inotify 封装：只关心“有没有事件”，具体变化由重新扫描索引得出。"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watched = set()
+
+    def add(self, path: str):
+        key = os.path.abspath(path)
+        if key in self._watched:
+            return
+        if self._add_watch(self.fd, os.fsencode(key), _WATCH_MASK) >= 0:
+            self._watched.add(key)
+
+    def wait(self, timeout: float) -> bool:
+        """等待事件，返回是否收到事件（事件内容被读出丢弃）。"""
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            # 被删除/移走的目录需要在重新出现时再次添加监听
+            offset = 0
+            while offset + _EVENT.size <= len(buf):
+                _, mask, _, name_len = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size + name_len
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._watched.clear()
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _make_inotify() -> Optional[_Inotify]:
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError):
+        return None
+
+
+def _print_log(msg: str, level: str = 'info'):
+    print(f'{datetime.now():%Y-%m-%d %H:%M:%S} [{level}] {msg}', flush=True)
+
+
+class ReleaseWatcher:
+    """监视 pkgpath，所有选中平台的源文件落地并稳定后调用 create_release。"""
+
+    def __init__(self, pkgpath: Union[str, List[str]] = './package', helppath: str = './help_documentation',
+                 platforms: Optional[List[str]] = None, version: Optional[str] = None,
+                 settle: float = 30.0, poll: float = 5.0, once: bool = False, use_inotify: bool = True,
+                 log: Callable[[str, str], None] = _print_log, release_options: Optional[dict] = None,
+                 retry: float = 300.0):
+        self.pkgpath = pkgpath
+        self.helppath = helppath
+        self.platforms = list(platforms or DEFAULT_PLATFORMS)
+        self.version = version
+        self.settle = settle
+        self.poll = poll
+        self.once = once
+        self.retry = retry
+        self.use_inotify = use_inotify
+        self.log = log
+        self.release_options = dict(release_options or {})
+        self.release_options.setdefault('verify_sources', True)
+        # path -> (size, mtime_ns, 该状态首次观察到的时间)
+        self._states = {}
+        self._released = set()
+        # 发布失败的 signature -> 失败时间（time.monotonic()），retry 秒后才重试
+        self._failed = {}
+
+    def check(self, now: Optional[float] = None) -> dict:
+        """扫描一次索引，返回 {'ready', 'missing', 'settling', 'conflicts', 'signature', 'next_check', 'watch_dirs'}。"""
+        now = time.monotonic() if now is None else now
+        index = scan_package_index(self.pkgpath)
+        missing, settling, signature = [], [], []
+        next_check = None
+        conflicts = [p for p in self.platforms if p in index.get('conflicts', {})]
+        for platform in self.platforms:
+            entry = index['sources'].get(platform)
+            if entry is None or not entry['exists']:
+                missing.append(platform)
+                continue
+            state = (entry['size'], entry['mtime_ns'])
+            prev = self._states.get(entry['path'])
+            if prev is None or prev[:2] != state:
+                self._states[entry['path']] = state + (now,)
+                since = now
+            else:
+                since = prev[2]
+            remaining = self.settle - (now - since)
+            if remaining > 0:
+                settling.append(platform)
+                next_check = remaining if next_check is None else min(next_check, remaining)
+            signature.append((platform, entry['path']) + state)
+        return {
+            'ready': not missing and not settling and not conflicts,
+            'missing': missing,
+            'settling': settling,
+            'conflicts': conflicts,
+            'signature': tuple(signature),
+            'next_check': next_check,
+            # 多个目录时 pkg_dirs 已带目录前缀
+            'watch_dirs': index['roots'] + (index['pkg_dirs'] if len(index['roots']) > 1 else
+                                            [os.path.join(index['roots'][0], d) for d in index['pkg_dirs']]),
+        }
+
+    def _release_version(self) -> Optional[str]:
+        if self.version:
+            return self.version
+        path = os.path.join(self.helppath, 'releases.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('currentRelease')
+        except (OSError, ValueError):
+            return None
+
+    def _retry_in(self, signature: tuple, now: float) -> float:
+        """距离可以再次尝试发布 signature 还有多少秒（0 表示现在即可）。"""
+        failed_at = self._failed.get(signature)
+        return 0.0 if failed_at is None else max(0.0, failed_at + self.retry - now)
+
+    def _trigger(self, signature: tuple, stop_event: threading.Event) -> bool:
+        """发布一次；只有 create_release 成功完成后才把 signature 记为已发布。"""
+        version = self._release_version()
+        if not version:
+            self._failed[signature] = time.monotonic()
+            self.log(f'无法确定版本号（请使用 --version 或检查 releases.json 的 currentRelease），'
+                     f'{self.retry:g} 秒后重试', 'error')
+            return False
+        date = datetime.now().strftime('%Y%m%d')
+        self.log(f'所有平台已就绪，开始发布 {version} ({date}): {self.platforms}', 'success')
+        try:
+            summary = create_release(version, '', date, platforms=self.platforms, pkgpath=self.pkgpath,
+                                     helppath=self.helppath, log_callback=self.log, stop_event=stop_event,
+                                     **self.release_options)
+        except Exception as e:
+            self._failed[signature] = time.monotonic()
+            self.log(f'发布失败: {e}（{self.retry:g} 秒后重试）', 'error')
+            return False
+        if summary.get('status') == 'stopped':
+            self.log('发布被中止', 'warning')
+            return False
+        self._released.add(signature)
+        self._failed.pop(signature, None)
+        self.log(f'发布完成: {summary.get("out_dir", summary)}', 'success')
+        return True
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> int:
+        """阻塞运行直到 stop_event 被设置（或 --once 模式下完成一次发布）。返回成功发布的次数。"""
+        stop_event = stop_event or threading.Event()
+        notifier = _make_inotify() if self.use_inotify else None
+        self.log(f'开始监视 {self.pkgpath}（{"inotify" if notifier else "轮询"}），平台: {self.platforms}', 'info')
+        released = 0
+        last_status = None
+        try:
+            while not stop_event.is_set():
+                if notifier is not None:
+                    for root in package_roots(self.pkgpath):
+                        notifier.add(root)
+                status = self.check()
+                if notifier is not None:
+                    for d in status['watch_dirs']:
+                        notifier.add(d)
+                brief = (tuple(status['missing']), tuple(status['settling']), tuple(status['conflicts']))
+                if brief != last_status:
+                    last_status = brief
+                    if status['conflicts']:
+                        self.log(f'以下平台在多个 package 目录中都有安装包，暂不发布: {status["conflicts"]}', 'warning')
+                    elif status['missing'] or status['settling']:
+                        self.log(f'等待中：缺少 {status["missing"] or "无"}，未稳定 {status["settling"] or "无"}', 'info')
+                timeout = self.poll
+                if status['ready'] and status['signature'] not in self._released:
+                    wait_retry = self._retry_in(status['signature'], time.monotonic())
+                    if wait_retry > 0:
+                        timeout = min(timeout, wait_retry + 0.05)
+                    elif self._trigger(status['signature'], stop_event):
+                        released += 1
+                        if self.once:
+                            break
+                    elif stop_event.is_set():
+                        break
+                    else:
+                        timeout = min(timeout, self.retry + 0.05)
+                if status['next_check'] is not None:
+                    timeout = min(timeout, status['next_check'] + 0.05)
+                if notifier is not None:
+                    # 有事件时立即重扫；稳定期倒计时结束时也要醒来，否则最多等待 poll 秒做兜底扫描
+                    notifier.wait(timeout)
+                else:
+                    stop_event.wait(timeout)
+        finally:
+            if notifier is not None:
+                notifier.close()
+        return released
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='监视 package 目录，各平台构建全部落地后自动发布')
+    parser.add_argument('--pkgpath', nargs='+', default=['./package'], help='package 目录（可以给出多个）')
+    parser.add_argument('--helppath', default='./help_documentation')
+    parser.add_argument('--uppath', default='./upgrade_package')
+    parser.add_argument('--output-base', default='./')
+    parser.add_argument('--platforms', nargs='+', default=DEFAULT_PLATFORMS, help='需要等待的平台')
+    parser.add_argument('--version', default=None, help='发布版本号（默认取 releases.json 的 currentRelease）')
+    parser.add_argument('--settle', type=float, default=30.0, help='源文件大小/mtime 保持不变多少秒后视为落地')
+    parser.add_argument('--poll', type=float, default=5.0, help='轮询间隔秒数（inotify 模式下为兜底扫描间隔）')
+    parser.add_argument('--polling', action='store_true', help='不使用 inotify，仅轮询')
+    parser.add_argument('--retry', type=float, default=300.0, help='发布失败后，同一组源文件隔多少秒再重试')
+    parser.add_argument('--once', action='store_true', help='成功完成一次发布后退出')
+    parser.add_argument('--delete-existing', action='store_true', help='删除已存在的“灵犀·晓伴_*--*”发布文件夹（同 GUI 选项）')
+    parser.add_argument('--make-deltas', action='store_true', help='同时生成差分升级包')
+    parser.add_argument('--no-verify', action='store_true', help='不校验源 zip 完整性')
+    parser.add_argument('--durability', choices=DURABILITY_MODES, default='batch',
+                        help='落盘策略：none 不 fsync，file 逐个 fsync，batch 各阶段结束时并行 fsync（默认）')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    pkgpath = args.pkgpath[0] if len(args.pkgpath) == 1 else args.pkgpath
+    watcher = ReleaseWatcher(pkgpath, args.helppath, args.platforms, args.version, args.settle, args.poll,
+                             once=args.once, use_inotify=not args.polling, retry=args.retry, release_options={
+                                 'uppath': args.uppath,
+                                 'output_base': args.output_base,
+                                 'delete_existing': args.delete_existing,
+                                 'make_deltas': args.make_deltas,
+                                 'verify_sources': not args.no_verify,
+                                 'dry_run': args.dry_run,
+                                 'durability': args.durability,
+                             })
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,34 +8,67 @@ Run: python rename_tool.py
 说明（中文）:
 本文件包含两个主要部分：
  1) 发布核心函数 create_release(...)：负责扫描 package 目录、创建输出目录、按平台复制并重命名安装包、生成升级包、复制帮助文档等。
-    - 提供 dry_run 模式（只记录动作，不写磁盘）。
+    - 提供 dry_run 模式（不写磁盘）：plan_release / plan_details 只用 stat 算出完整的操作计划，format_plan 一次性输出。
     - 提供 log_callback(progress_callback) 回调用于把日志/进度发送给上层（例如 GUI）。
     - 支持 stop_event（threading.Event），用于在长操作中优雅中止。
     - 在 Windows 上，当清空 upgrade_package 遇到权限问题，会尝试清除只读并使用 takeown/icacls 进行权限恢复并重试删除一次。
+    - scan_package_index(...)：一次遍历 package 目录建立各平台源文件索引（含持久化缓存中的指纹），create_release 与 GUI 共用。
+      pkgpath 也可以是多个目录（例如 arm64 与 x64 构建机各自的共享目录），并发扫描后合并为一个索引，
+      同一平台在多个目录中都有安装包时视为冲突；复制直接从各目录读取，无需先汇总到 ./package。
+    - 可选 verify_sources：复制的同时在进程池中流式校验每个源 zip 的 CRC，发现损坏则删除已复制的文件并在发布 releases.json 前中止（见 artifacts.py）。
+    - 可选 make_bundles：为发布文件夹下每个平台子文件夹并行生成分发压缩包（见 release_bundle.py）。
+    - editions：同一批二进制同时发布多个版次（标准版、内测版等），每个源文件只读取一次写入全部版次的目标（可选硬链接）。
+    - 可选 make_deltas：为每个平台生成“上一版本升级包 -> 新升级包”的差分（二进制或 zip 条目级），并写入 upgrade_manifest.json（见 release_delta.py）。
  2) GUI（ReleaseGUI）：基于 Tkinter 的桌面界面，包含左侧参数面板和右侧日志/进度区，能够启动后台线程运行 create_release，并以线程安全的方式更新 UI。
+    - 窗口打开后即在后台预取 package 目录中的源文件（预热缓存并计算指纹，见 artifacts.SourcePrefetcher），
+      更换 package 路径时重新开始，开始发布或关闭窗口时取消。
+    - “检查pkg”在后台线程中扫描，索引由 PackageIndexCache 缓存：用少量 stat 校验无变化时不再重新列目录。
 
 备注：本文件独立于原 `Rename_v4.py`，不会导入或调用原脚本，便于在不修改历史文件的情况下提供更友好的交互界面。
 """
 
+import multiprocessing
 import os
 import re
 import shutil
 import subprocess
 import threading
 import tempfile
+import time
 from datetime import datetime
-from typing import Callable, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Union
 import stat
 
 try:
     import tkinter as tk
     from tkinter import ttk, messagebox, scrolledtext, filedialog
 except Exception:
-    # 如果 tkinter 不可用，GUI 将无法运行
-    raise
+    # 如果 tkinter 不可用，GUI 将无法运行；核心函数仍可被无界面工具（如 release_watcher.py）导入使用
+    tk = None
+
+from copy_engine import (TYPICAL_THROUGHPUT, CopyScheduler, Durability, check_free_space, classify_device, copy_file,
+                         commit_file, copy_file_multi, device_of, free_space, link_file, peak_rss,
+                         shared_buffer_pool)
+from artifacts import FingerprintCache, SourcePrefetcher, ZipVerifier, default_fingerprint_cache, shared_hash_pool
+from release_bundle import build_bundles
+from release_delta import (build_deltas, load_manifest, load_release_versions,
+                           plan_upgrade_paths, publish_releases_json, retained_deltas, upgrade_package_name,
+                           write_manifest)
 
 # ---------------------- Core functions (no dependency on Rename_v4.py) ----------------------
 
+# 非 Windows 平台 -> pkg-<arch> 目录中的 arch
+PLATFORM_ARCHES = {
+    'linux-arm64': 'linux-arm64',
+    'linux-x64': 'linux-x64',
+    'mac-arm64': 'mac-arm64',
+    'mac-x64': 'mac-intel-x64',
+}
+SOURCE_ZIP_NAME = '灵犀·晓伴.zip'
+# 发布版本（版次）：label 用于发布文件名，slug 用于升级包文件名；第一个为主版本（差分与升级元数据只针对主版本）
+DEFAULT_EDITIONS = [{'label': '标准版', 'slug': 'standard'}]
+
 
 def get_pkg_dirs(path: str) -> list:
     """返回指定路径下名称以 'pkg' 开头的子目录列表。
@@ -57,11 +90,145 @@ def get_suxiaoban_setup_files(path: str) -> list:
     return [f for f in os.listdir(path) if re.match(r'^suxiaoban-.*-setup.exe.zip', f)]
 
 
-def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, str], None]] = None) -> bool:
+def package_roots(pkgpath: Union[str, List[str]]) -> List[str]:
+    """pkgpath 可以是单个目录或目录列表，统一返回目录列表。"""
+    if isinstance(pkgpath, (list, tuple)):
+        return [str(p) for p in pkgpath]
+    return [pkgpath]
+
+
+def scan_package_index(pkgpath: Union[str, List[str]], hash_sources: bool = False,
+                       should_stop: Optional[Callable[[], bool]] = None) -> dict:
+    """遍历 package 目录（可以是多个目录，并发扫描），建立各平台源文件的索引。
+
+    返回 {'pkgpath', 'roots', 'pkg_dirs', 'sources', 'conflicts'}，其中 sources 为 {platform: entry 或 None}，entry 包含：
+    path、exists、size、mtime_ns、version（仅 Windows 安装包，从文件名解析）以及 sha256。
+    多个目录时 pkg_dirs 为带目录前缀的路径；同一平台在多个目录中都存在安装包时记入 conflicts {platform: [path, ...]}，
+    sources 中保留第一个目录中的那个。
+    sha256 来自持久化指纹缓存（见 artifacts.FingerprintCache）；hash_sources=True 时对缺失项并行计算并写回缓存。
+    """
+    roots = package_roots(pkgpath)
+    if len(roots) == 1:
+        index = _scan_root(roots[0])
+    else:
+        # 各目录通常位于不同的构建机共享目录上，扫描以网络往返为主，用线程并发
+        with ThreadPoolExecutor(max_workers=len(roots)) as executor:
+            parts = list(executor.map(_scan_root, roots))
+        index = {'pkg_dirs': [os.path.join(part['pkgpath'], d) for part in parts for d in part['pkg_dirs']],
+                 'sources': {}, 'conflicts': {}}
+        for platform in ['win-x64'] + list(PLATFORM_ARCHES):
+            entries = [part['sources'][platform] for part in parts if part['sources'].get(platform)]
+            found = [e for e in entries if e['exists']]
+            if len(found) > 1:
+                index['conflicts'][platform] = [e['path'] for e in found]
+            index['sources'][platform] = (found or entries or [None])[0]
+    index['pkgpath'] = pkgpath
+    index['roots'] = roots
+
+    if hash_sources:
+        missing = [e['path'] for e in index['sources'].values() if e and e['exists'] and not e['sha256']]
+        digests = shared_hash_pool().hash_files(missing, should_stop) if missing else {}
+        for e in index['sources'].values():
+            if e and digests and e['path'] in digests:
+                e['sha256'] = digests[e['path']]
+    return index
+
+
+class PackageIndexCache:
+    """scan_package_index 结果的内存缓存，线程安全，供 GUI 在后台线程中反复查询。
+
+    get() 先用少量 stat 校验缓存是否仍然有效（各 package 目录与各源文件的 mtime/大小），
+    没有变化时直接返回上次的索引，否则重新扫描；package 位于慢速共享盘时可避免每次都列目录。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    @staticmethod
+    def _stat(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _stamp(self, roots: List[str], index: dict) -> tuple:
+        sources = [e['path'] for e in index['sources'].values() if e]
+        return tuple(self._stat(r) for r in roots), tuple((p, self._stat(p)) for p in sources)
+
+    def get(self, pkgpath: Union[str, List[str]], refresh: bool = False) -> dict:
+        """返回 pkgpath 的索引；refresh=True 时无条件重新扫描。"""
+        roots = package_roots(pkgpath)
+        key = tuple(os.path.abspath(r) for r in roots)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and not refresh:
+            stamp, index = cached
+            if self._stamp(roots, index) == stamp:
+                return index
+        # 目录的 stat 在扫描前取得：扫描期间有变化时下次校验会失败并重新扫描
+        root_stats = tuple(self._stat(r) for r in roots)
+        index = scan_package_index(pkgpath)
+        sources = tuple((e['path'], (e['size'], e['mtime_ns']) if e['exists'] else None)
+                        for e in index['sources'].values() if e)
+        with self._lock:
+            self._cache[key] = ((root_stats, sources), index)
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _scan_root(pkgpath: str) -> dict:
+    index = {'pkgpath': pkgpath, 'pkg_dirs': [], 'sources': {}, 'conflicts': {}}
+    if not os.path.exists(pkgpath):
+        return index
+    wins = []
+    with os.scandir(pkgpath) as it:
+        for e in it:
+            if e.is_dir() and re.match(r'^pkg', e.name):
+                index['pkg_dirs'].append(e.name)
+            elif re.match(r'^suxiaoban-.*-setup.exe.zip', e.name):
+                wins.append(e.name)
+
+    def _entry(path: str, **extra) -> dict:
+        entry = dict(path=path, exists=False, size=None, mtime_ns=None, sha256=None, **extra)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return entry
+        entry.update(exists=True, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        cache = default_fingerprint_cache()
+        if cache is not None:
+            entry['sha256'] = cache.get(path, st)
+        return entry
+
+    if wins:
+        m = re.findall(r'\d+\.\d+\.\d+', wins[0])
+        index['sources']['win-x64'] = _entry(os.path.join(pkgpath, wins[0]), version=m[0] if m else None)
+    else:
+        index['sources']['win-x64'] = None
+    for platform, arch in PLATFORM_ARCHES.items():
+        index['sources'][platform] = None
+        for d in index['pkg_dirs']:
+            if re.match(fr'^pkg-{arch}.*', d):
+                index['sources'][platform] = _entry(os.path.join(pkgpath, d, SOURCE_ZIP_NAME), version=None)
+                break
+    return index
+
+
+def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, str], None]] = None,
+              fingerprints: Optional[FingerprintCache] = None, drop_cache: bool = True,
+              durability: Optional[Durability] = None) -> bool:
     """安全复制文件并记录日志。
 
     - 如果 dry_run 为 True，则不实际写盘，只记录计划动作到日志回调。
     - 若目标目录不存在则自动创建。
+    - 传入 fingerprints 时，把源文件已缓存的指纹登记到目标文件，后续计算目标校验和可直接命中缓存。
+    - drop_cache 为 True 时边复制边释放源/目标文件的页缓存（见 copy_engine.copy_file）。
+    - durability 为落盘策略（见 copy_engine.Durability），默认不 fsync。
     - 返回 True 表示成功或模拟成功，False 表示复制失败。
     """
     if dry_run:
@@ -85,12 +252,18 @@ def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, st
             tmp_fd, tmp_path = tempfile.mkstemp(dir=dst_dir, prefix='.tmp_copy_')
             os.close(tmp_fd)
             tmp_name = tmp_path
-            shutil.copy2(src, tmp_name)
-            # Attempt atomic replace
+            copy_file(src, tmp_name, drop_cache=drop_cache, durability=durability)
+            # Attempt atomic replace (batch durability defers it until the phase is flushed)
             try:
-                os.replace(tmp_name, dst)
+                st = os.stat(tmp_name)
+                commit_file(tmp_name, dst, durability)
                 if log:
                     log(f"COPY (via tmp) {src} -> {dst}", 'success')
+                if fingerprints is not None:
+                    # copy_file 保留了 mtime，目标内容与源一致，可以直接沿用源文件的指纹（替换不改变 inode）
+                    digest = fingerprints.get(src)
+                    if digest:
+                        fingerprints.put(dst, digest, st)
                 return True
             except Exception as e_replace:
                 # if replace fails, remove tmp and fall through to fallback logic
@@ -130,6 +303,8 @@ def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, st
         # Retry copy after removal attempt
         try:
             shutil.copy(src, dst)
+            if durability is not None:
+                durability.written(dst)
             if log:
                 log(f"COPY after remove: {src} -> {dst}", 'success')
             return True
@@ -163,6 +338,8 @@ def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, st
                             log(f'二次尝试删除目标失败: {e_rem2}', 'warning')
                     try:
                         shutil.copy(src, dst)
+                        if durability is not None:
+                            durability.written(dst)
                         if log:
                             log(f"COPY after takeown/icacls: {src} -> {dst}", 'success')
                         return True
@@ -185,17 +362,363 @@ def safe_copy(src: str, dst: str, dry_run: bool, log: Optional[Callable[[str, st
         return False
 
 
+def safe_copy_many(src: str, dsts: list, dry_run: bool, log: Optional[Callable[[str, str], None]] = None,
+                   fingerprints: Optional[FingerprintCache] = None, drop_cache: bool = True,
+                   durability: Optional[Durability] = None, link: bool = False) -> list:
+    """读取一次 src，复制到 dsts 中的每个目标，返回与 dsts 顺序一致的成功标志列表。
+
+    - 每个目标仍是“同目录临时文件 + 原子替换”；link 为 True 时同一设备上只写一份，其余目标硬链接到它。
+    - 一次读取写入多个目标失败（或无法创建硬链接）时，逐个回退到 safe_copy（包含权限恢复逻辑）。
+    """
+    if len(dsts) == 1 or dry_run:
+        if dry_run and link and len(dsts) > 1:
+            primary = {}
+            for dst in dsts:
+                dev = device_of(dst)
+                if dev in primary and log:
+                    log(f"[DRY] LINK: {primary[dev]} -> {dst}", 'info')
+                else:
+                    primary[dev] = dst
+                    if log:
+                        log(f"[DRY] COPY: {src} -> {dst}", 'info')
+            return [True] * len(dsts)
+        return [safe_copy(src, dst, dry_run, log, fingerprints, drop_cache, durability) for dst in dsts]
+
+    # 需要实际写入的目标；link 时每个设备只写第一个，其余记为 (目标, 被链接的目标)
+    written, linked, primary = [], [], {}
+    for dst in dsts:
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        dev = device_of(dst) if link else None
+        if link and dev in primary:
+            linked.append((dst, primary[dev]))
+            continue
+        primary[dev] = dst
+        written.append(dst)
+
+    ok = {}
+    tmps = {}
+    try:
+        for dst in written:
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst) or '.', prefix='.tmp_copy_')
+            os.close(tmp_fd)
+            tmps[dst] = tmp_path
+        copy_file_multi(src, [tmps[dst] for dst in written], drop_cache=drop_cache, durability=durability)
+        for dst in written:
+            commit_file(tmps[dst], dst, durability)
+            # 提交成功后临时文件已改名（或交给 durability 管理），此后不再由这里删除
+            del tmps[dst]
+            ok[dst] = True
+            if log:
+                log(f"COPY (via tmp) {src} -> {dst}", 'success')
+    except Exception as e:
+        if log:
+            log(f"一次读取写入多个目标失败，改为逐个复制: {src}: {e}", 'warning')
+        for tmp in tmps.values():
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    for dst in written:
+        if dst not in ok:
+            ok[dst] = safe_copy(src, dst, False, log, fingerprints, drop_cache, durability)
+
+    for dst, target in linked:
+        if ok[target]:
+            try:
+                # batch 落盘时 target 可能还是临时文件，直接链接到它
+                link_file(durability.staged(target) if durability is not None else target, dst, durability)
+                ok[dst] = True
+                if log:
+                    log(f"LINK {target} -> {dst}", 'success')
+                continue
+            except OSError as e:
+                if log:
+                    log(f"无法创建硬链接 {dst}（{e}），改为复制", 'warning')
+        ok[dst] = safe_copy(src, dst, False, log, fingerprints, drop_cache, durability)
+
+    if fingerprints is not None:
+        # 目标内容与源一致（mtime 也已保留），直接沿用源文件的指纹
+        digest = fingerprints.get(src)
+        if digest:
+            for dst in dsts:
+                if ok[dst]:
+                    path = durability.staged(dst) if durability is not None else dst
+                    try:
+                        fingerprints.put(dst, digest, os.stat(path))
+                    except OSError:
+                        pass
+    return [ok[dst] for dst in dsts]
+
+
+HELP_DOCS = [
+    # (文件名, 放入的平台子文件夹: mac / win / linux)
+    ("苏晓伴桌面版帮助说明.docx", ['mac', 'win', 'linux']),
+    ("苏晓伴 mac 版安装说明.docx", ['mac']),
+    ("国产电脑使用苏晓伴说明.docx", ['linux']),
+]
+
+
+def plan_release(index: dict, version: str, date: str, platforms: Optional[Iterable[str]] = None,
+                 helppath: str = './help_documentation', uppath: str = './upgrade_package',
+                 output_base: str = './', editions: Optional[list] = None) -> dict:
+    """根据 package 索引计算发布会写出的全部文件，不访问输出目录。
+
+    返回 {'out_dir', 'subdirs', 'platforms', 'help', 'missing_help', 'releases', 'warnings', 'total_bytes'}：
+      - subdirs: {'mac'/'win'/'linux': 平台子文件夹路径}
+      - platforms: 按 platforms 顺序的 [{'platform', 'src', 'size', 'dsts', 'records', 'warning'}]，src 为 None 表示该平台不复制；
+        records 与 dsts 一一对应，主版次升级包为 (upgrade_arch, version, path)，其余为 None
+      - help: [{'src', 'size', 'dsts'}]（只包含存在的帮助文档），missing_help 为缺失的帮助文档文件名
+      - releases: helppath 中的 releases.json（存在时为 {'src', 'size', 'dst'}，否则为 None）
+      - warnings: 找不到源文件、未知平台、缺失的帮助文档等提示
+      - total_bytes: 需要写入的总字节数（每个目标各算一份）
+    只对帮助文档做 stat，可在后台线程中反复调用（例如 GUI 的实时预览）。
+    """
+    if platforms is None:
+        platforms = ['linux-arm64', 'linux-x64', 'mac-arm64', 'mac-x64', 'win-x64']
+    editions = list(editions or DEFAULT_EDITIONS)
+    out_main = os.path.join(output_base, f"灵犀·晓伴_{version} --{date}")
+    subdirs = {
+        'mac': os.path.join(out_main, f"灵犀·晓伴 {version} mac"),
+        'win': os.path.join(out_main, f"灵犀·晓伴 {version} win"),
+        'linux': os.path.join(out_main, f"灵犀·晓伴 {version} 统信+麒麟"),
+    }
+    plan = {'out_dir': out_main, 'subdirs': subdirs, 'platforms': [], 'help': [], 'missing_help': [],
+            'releases': None, 'warnings': [], 'total_bytes': 0}
+
+    def _item(platform: str, entry: Optional[dict], target: str, file_version: str, arch: str, upgrade_arch: str):
+        dsts, records = [], []
+        for n, ed in enumerate(editions):
+            dsts.append(os.path.join(subdirs[target], f"灵犀·晓伴-{file_version}-{ed['label']}-{date[-4:]}-{arch}.zip"))
+            records.append(None)
+            # 同时生成升级包放到 uppath
+            upgrade_path = os.path.join(uppath, upgrade_package_name(file_version, upgrade_arch, ed['slug']))
+            dsts.append(upgrade_path)
+            records.append((upgrade_arch, file_version, upgrade_path) if n == 0 else None)
+        plan['total_bytes'] += (entry['size'] or 0) * len(dsts)
+        return {'platform': platform, 'src': entry['path'], 'size': entry['size'], 'dsts': dsts, 'records': records,
+                'warning': None}
+
+    for platform in platforms:
+        entry = index['sources'].get(platform)
+        if platform == 'win-x64':
+            # Windows 特殊处理：使用 suxiaoban 的安装包，文件名中的版本号取自安装包
+            if entry:
+                item = _item(platform, entry, 'win', entry['version'] or version, 'win-x64', 'win32-x64')
+            else:
+                item = {'platform': platform, 'src': None, 'warning': '未找到 Windows 安装包'}
+        elif platform not in PLATFORM_ARCHES:
+            item = {'platform': platform, 'src': None, 'warning': f'未知平台: {platform}'}
+        elif entry is None:
+            item = {'platform': platform, 'src': None, 'warning': None}
+        elif not entry['exists']:
+            item = {'platform': platform, 'src': None, 'warning': f'源文件不存在: {entry["path"]}'}
+        else:
+            # 非 Windows 平台：pkg-<arch> 目录下的 "灵犀·晓伴.zip"；升级包文件名中 mac 写作 darwin
+            arch = PLATFORM_ARCHES[platform]
+            upgrade_arch = arch.replace('mac-', 'darwin-') if arch.startswith('mac') else arch
+            item = _item(platform, entry, 'mac' if arch.startswith('mac') else 'linux', version, arch, upgrade_arch)
+        if item['warning']:
+            plan['warnings'].append(item['warning'])
+        plan['platforms'].append(item)
+
+    for name, targets in HELP_DOCS:
+        src = os.path.join(helppath, name)
+        try:
+            size = os.stat(src).st_size
+        except OSError:
+            plan['missing_help'].append(name)
+            plan['warnings'].append(f'帮助文档不存在: {name}')
+            continue
+        dsts = [os.path.join(subdirs[t], name) for t in targets]
+        plan['help'].append({'src': src, 'size': size, 'dsts': dsts})
+        plan['total_bytes'] += size * len(dsts)
+
+    releases_src = os.path.join(helppath, 'releases.json')
+    try:
+        plan['releases'] = {'src': releases_src, 'size': os.stat(releases_src).st_size,
+                            'dst': os.path.join(uppath, 'releases.json')}
+    except OSError:
+        pass
+    return plan
+
+
+def plan_outputs(plan: dict) -> list:
+    """按写出顺序列出计划中的全部输出文件 [(dst, src, size)]。"""
+    outputs = [(dst, item['src'], item['size']) for item in plan['platforms'] if item['src'] for dst in item['dsts']]
+    outputs += [(dst, h['src'], h['size']) for h in plan['help'] for dst in h['dsts']]
+    if plan['releases']:
+        outputs.append((plan['releases']['dst'], plan['releases']['src'], plan['releases']['size']))
+    return outputs
+
+
+def plan_conflicts(plan: dict) -> list:
+    """返回计划中已经存在的输出（发布主文件夹或目标文件）路径列表，会逐个 stat。
+
+    releases.json 每次发布都会更新，不算冲突。
+    """
+    dsts = [dst for dst, _, _ in plan_outputs(plan) if not plan['releases'] or dst != plan['releases']['dst']]
+    if os.path.exists(plan['out_dir']):
+        return [plan['out_dir']] + [dst for dst in dsts if os.path.exists(dst)]
+    # 主文件夹不存在时其中的文件也不存在，只需检查 upgrade_package 中的目标
+    return [dst for dst in dsts if not dst.startswith(plan['out_dir'] + os.sep) and os.path.exists(dst)]
+
+
+def _dir_usage(directory: str) -> Dict[int, int]:
+    """统计目录删除后各设备能释放的字节数（{st_dev: 字节}）；仍有其他硬链接的文件删除后不释放空间。"""
+    usage = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if st.st_nlink <= 1:
+                usage[st.st_dev] = usage.get(st.st_dev, 0) + st.st_size
+    return usage
+
+
+def plan_details(plan: dict, link_copies: bool = False, removed: Iterable[str] = (),
+                 renamed: Iterable[str] = ()) -> dict:
+    """为 plan_release 的结果补充 dry-run 所需的执行细节，只做 stat / statvfs，不读写任何文件。
+
+    removed / renamed 为发布开始前会被删除（或清空）/ 重命名的目录：其中的文件不算已存在，
+    删除的目录所占空间计入对应设备的可用空间。
+
+    返回（同时存入 plan['details']）：
+      - steps: 按执行顺序的 [{'action': 'copy' 或 'link', 'src', 'dst', 'size'}]，link 的 src 为同一设备上先写出的目标
+      - write_bytes / linked: 实际写入的字节数与硬链接个数
+      - space: 每个目标设备的 [(目录, 需要字节, 可用字节或 None)]，short 为其中空间不足的项
+      - devices: {st_dev: {'kind', 'bytes', 'seconds'}}，bytes 为该设备上的读写总量，seconds 按 TYPICAL_THROUGHPUT 估算
+      - seconds: 预计复制耗时（各设备并行，取最忙的设备）
+      - existing: plan_conflicts(plan) 中不在 removed / renamed 目录下的路径
+    """
+    kinds = {}
+    devices = {}
+
+    def _touch(path: str, nbytes: int):
+        dev = device_of(path)
+        if dev not in kinds:
+            kinds[dev] = classify_device(path)
+        devices[dev] = devices.get(dev, 0) + nbytes
+        return dev
+
+    steps = []
+    for item in plan['platforms']:
+        if not item['src']:
+            continue
+        # 一次读取写入该源的全部目标；link_copies 时同一设备上只写第一个目标
+        _touch(item['src'], item['size'])
+        primary = {}
+        for dst in item['dsts']:
+            dev = device_of(dst)
+            if link_copies and dev in primary:
+                steps.append({'action': 'link', 'src': primary[dev], 'dst': dst, 'size': item['size']})
+                continue
+            primary[dev] = dst
+            _touch(dst, item['size'])
+            steps.append({'action': 'copy', 'src': item['src'], 'dst': dst, 'size': item['size']})
+    extra = [(h['src'], dst, h['size']) for h in plan['help'] for dst in h['dsts']]
+    if plan['releases']:
+        extra.append((plan['releases']['src'], plan['releases']['dst'], plan['releases']['size']))
+    for src, dst, size in extra:
+        _touch(src, size)
+        _touch(dst, size)
+        steps.append({'action': 'copy', 'src': src, 'dst': dst, 'size': size})
+
+    removed = list(dict.fromkeys(os.path.abspath(d) for d in removed))
+    gone = removed + [os.path.abspath(d) for d in renamed]
+
+    def _kept(path: str) -> bool:
+        path = os.path.abspath(path)
+        return not any(path == d or path.startswith(d + os.sep) for d in gone)
+
+    freed = {}
+    for directory in removed:
+        for dev, nbytes in _dir_usage(directory).items():
+            freed[dev] = freed.get(dev, 0) + nbytes
+    space = [(where, need, free if free is None else free + freed.get(device_of(where), 0))
+             for where, need, free in free_space((st['dst'], st['size']) for st in steps if st['action'] == 'copy')]
+    busy = {dev: {'kind': kinds[dev], 'bytes': nbytes, 'seconds': nbytes / TYPICAL_THROUGHPUT[kinds[dev]]}
+            for dev, nbytes in devices.items()}
+    details = {
+        'steps': steps,
+        'write_bytes': sum(st['size'] for st in steps if st['action'] == 'copy'),
+        'linked': sum(1 for st in steps if st['action'] == 'link'),
+        'space': space,
+        'short': [(d, need, free) for d, need, free in space if free is not None and free < need],
+        'devices': busy,
+        'seconds': max((d['seconds'] for d in busy.values()), default=0.0),
+        'existing': [path for path in plan_conflicts(plan) if _kept(path)],
+    }
+    plan['details'] = details
+    return details
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 60:
+        return f'{seconds:.0f} 秒' if seconds >= 1 else '不到 1 秒'
+    return f'{seconds / 60:.1f} 分钟'
+
+
+def format_plan(plan: dict, notes: Iterable[str] = ()) -> str:
+    """把带 details（见 plan_details）的计划渲染为一段文本，dry-run 时一次性输出。notes 为附加步骤的说明。"""
+    details = plan['details']
+    existing = set(details['existing'])
+    mib = 2 ** 20
+    lines = [f'[DRY] 发布计划: {plan["out_dir"]}{"（已存在）" if plan["out_dir"] in existing else ""}']
+    for key in ('mac', 'win', 'linux'):
+        lines.append(f'[DRY] MKDIR {plan["subdirs"][key]}')
+    for st in details['steps']:
+        mark = '  [覆盖已有文件]' if st['dst'] in existing else ''
+        if st['action'] == 'link':
+            lines.append(f'[DRY] LINK {st["src"]} -> {st["dst"]}{mark}')
+        else:
+            lines.append(f'[DRY] COPY {st["src"]} -> {st["dst"]}  {st["size"] / mib:.1f} MiB{mark}')
+    for warning in plan['warnings']:
+        lines.append(f'[DRY] 警告: {warning}')
+    for note in notes:
+        lines.append(f'[DRY] 附加步骤: {note}')
+    for where, need, free in details['space']:
+        if free is None:
+            lines.append(f'[DRY] 空间: {where} 需要 {need / mib:.1f} MiB，无法获取可用空间')
+        else:
+            status = '不足' if free < need else '足够'
+            lines.append(f'[DRY] 空间: {where} 需要 {need / mib:.1f} MiB，可用 {free / mib:.1f} MiB（{status}）')
+    kinds = sorted(set(d['kind'] for d in details['devices'].values()))
+    rates = '，'.join(f'{k} {TYPICAL_THROUGHPUT[k] / mib:.0f} MiB/s' for k in kinds)
+    copies = len(details['steps']) - details['linked']
+    lines.append(f'[DRY] 合计: {len(details["steps"])} 个文件（复制 {copies} 个，硬链接 {details["linked"]} 个），'
+                 f'写入 {details["write_bytes"] / mib:.1f} MiB，预计耗时 {_format_seconds(details["seconds"])}'
+                 + (f'（按设备类型典型吞吐量估算：{rates}）' if rates else ''))
+    return '\n'.join(lines)
+
+
 def create_release(version: str,
                    wps_version: str,
                    date: str,
                    platforms: Optional[Iterable[str]] = None,
-                   pkgpath: str = './package',
+                   pkgpath: Union[str, List[str]] = './package',
                    helppath: str = './help_documentation',
                    uppath: str = './upgrade_package',
                    output_base: str = './',
                    delete_existing: bool = False,
                    clear_upgrade: bool = False,
                    dry_run: bool = False,
+                   make_deltas: bool = False,
+                   delta_base_path: Optional[str] = None,
+                   delta_format: str = 'bdiff',
+                   delta_keep: int = 3,
+                   verify_sources: bool = False,
+                   make_bundles: bool = False,
+                   bundle_dir: Optional[str] = None,
+                   index: Optional[dict] = None,
+                   copy_workers: int = 8,
+                   io_limits: Optional[dict] = None,
+                   io_probe: bool = False,
+                   drop_cache: bool = True,
+                   durability: str = 'batch',
+                   editions: Optional[list] = None,
+                   link_copies: bool = False,
                    log_callback: Optional[Callable[[str, str], None]] = None,
                    progress_callback: Optional[Callable[[int, str], None]] = None,
                    stop_event: Optional[threading.Event] = None) -> dict:
@@ -205,15 +728,34 @@ def create_release(version: str,
     参数说明（简要）:
       - version, wps_version, date: 用户输入的版本与日期（date 格式 YYYYMMDD）
       - platforms: 要处理的平台列表（例如 'linux-arm64','win-x64' 等）
-      - pkgpath / helppath / uppath / output_base: 各类路径（可使用默认）
+      - pkgpath / helppath / uppath / output_base: 各类路径（可使用默认）；pkgpath 可以是多个目录的列表，并发扫描后合并，
+        同一选中平台出现在多个目录中时报错
       - delete_existing: 若输出目录已存在，是否删除
       - clear_upgrade: 是否清空 upgrade_package 目录
-      - dry_run: 是否为模拟运行（不改磁盘）
+      - dry_run: 是否为模拟运行（不改磁盘）：一次算出完整的操作计划（大小、复制/硬链接、空间检查、预计耗时）并一次性输出，
+        不逐项执行；结果在 summary['plan'] 中（见 plan_release / plan_details）
+      - make_deltas: 是否为每个升级包生成相对 releases.json 中上一版本的二进制差分，并写入 upgrade_manifest.json
+      - delta_base_path: 存放上一版本升级包的目录（默认与 uppath 相同；若同时清空 uppath，需要单独指定）
+      - delta_format: 'bdiff'（二进制差分）或 'zpatch'（zip 条目级补丁，只包含变化的条目）
+      - delta_keep: 保留目标版本属于 releases.json 最近几个版本的历史差分，用于为落后多个版本的客户端规划串联升级路径
+      - verify_sources: 复制的同时并行校验源 zip 的完整性（逐条目 CRC），任一损坏则中止发布
+      - make_bundles: 为每个平台子文件夹生成一个分发压缩包（多进程并行，zip/docx 等不再压缩）
+      - bundle_dir: 分发压缩包的存放目录（默认为发布主文件夹本身）
+      - copy_workers: 并行复制的最大线程数（1 表示逐个复制）；实际并发还受每个设备的上限约束（见 copy_engine.py）
+      - io_limits: 覆盖设备并发上限，例如 {'hdd': 1, 'ssd': 8} 或 {st_dev: n}
+      - io_probe: 对无法识别类型的设备做一次短暂的随机读延迟探测，用于推断并发上限
+      - drop_cache: 复制时逐块释放页缓存，避免挤掉同机其他任务的缓存（False 为普通复制）
+      - durability: 落盘策略 'none' / 'file' / 'batch'（默认，在各阶段结束时并行 fsync 临时文件后再替换，见 copy_engine.Durability）
+      - editions: 版次列表，例如 [{'label': '标准版', 'slug': 'standard'}, {'label': '内测版', 'slug': 'beta'}]，
+        label 用于发布文件名，slug 用于升级包文件名；默认只有标准版。每个源文件只读取一次，写入所有版次的目标。
+        差分与升级元数据只针对第一个（主）版次生成
+      - link_copies: 同一源文件在同一设备上的多个目标只写一份，其余使用硬链接（默认每个目标各写一份）
+      - index: 预先扫描好的 scan_package_index(pkgpath) 结果（批量发布时多个任务共用一次扫描），默认在函数内扫描
       - log_callback: 回调 (msg, level)，用于把日志送到 UI 或其他消费端
       - progress_callback: 回调 (percent, message)，用于更新进度条
       - stop_event: threading.Event，用于中途停止操作
 
-    返回：summary dict（包含 out_dir、platforms、dry_run 等信息）或抛出异常
+    返回：summary dict（包含 out_dir、platforms、dry_run、memory（复制缓冲区与进程峰值内存）等信息）或抛出异常
     """
 
     # 内部回调包装：避免在回调中抛异常影响主流程
@@ -235,9 +777,31 @@ def create_release(version: str,
         # 检查是否收到了停止信号
         return stop_event is not None and stop_event.is_set()
 
+    # 落盘策略（未知模式直接抛出 ValueError）；batch 模式在各阶段结束时统一 fsync
+    sync = Durability(durability)
+
+    # 目标 -> 源文件，batch 落盘在 flush 时替换失败的文件据此重新走 safe_copy（含权限恢复）
+    sources = {}
+
+    def _flush(phase: str) -> set:
+        """落盘本阶段登记的文件，返回替换失败且重试也失败的目标集合。"""
+        files, dirs, failed = sync.flush()
+        if files:
+            _log(f'{phase}：已落盘 {files} 个文件、{dirs} 个目录', 'info')
+        lost = set()
+        for dst, err in failed:
+            src = sources.get(os.path.abspath(dst))
+            _log(f'{phase}：替换 {dst} 失败: {err}' + ('，改为直接复制重试' if src else ''),
+                 'warning' if src else 'error')
+            if not src or not safe_copy(src, dst, False, log_callback, drop_cache=drop_cache,
+                                        durability=Durability('none' if sync.mode == 'none' else 'file')):
+                lost.add(os.path.abspath(dst))
+        return lost
+
     # 默认平台
     if platforms is None:
         platforms = ['linux-arm64', 'linux-x64', 'mac-arm64', 'mac-x64', 'win-x64']
+    platforms = list(platforms)
 
     _log('开始执行发布流程', 'info')
     _progress(0, '开始')
@@ -247,16 +811,87 @@ def create_release(version: str,
         raise ValueError('版本号不能为空')
     if not re.match(r'^\d{8}$', date):
         raise ValueError('日期格式应为 YYYYMMDD')
+    editions = list(editions or DEFAULT_EDITIONS)
+    for ed in editions:
+        if not isinstance(ed, dict) or not ed.get('label') or not ed.get('slug'):
+            raise ValueError(f'版次必须包含 label 与 slug: {ed}')
+    if len(set(ed['slug'] for ed in editions)) != len(editions) or \
+            len(set(ed['label'] for ed in editions)) != len(editions):
+        raise ValueError('版次的 label 与 slug 不能重复')
 
     # ========== 扫描 pkg 目录 ==========
     _log(f'扫描 pkg 目录: {pkgpath}', 'info')
-    pkg_dirs = get_pkg_dirs(pkgpath)
+    roots = [os.path.abspath(p) for p in package_roots(pkgpath)]
+    if index is None or [os.path.abspath(p) for p in index.get('roots', [])] != roots:
+        index = scan_package_index(pkgpath)
+    for root in package_roots(pkgpath):
+        if not os.path.isdir(root):
+            _log(f'package 目录不存在: {root}', 'warning')
+    conflicts = {p: paths for p, paths in index.get('conflicts', {}).items() if p in platforms}
+    if conflicts:
+        raise ValueError('以下平台在多个 package 目录中都有安装包，无法确定使用哪一个: '
+                         + '；'.join(f'{p}: {", ".join(paths)}' for p, paths in conflicts.items()))
+    pkg_dirs = index['pkg_dirs']
     _log(f'发现 pkg 文件夹: {pkg_dirs}', 'info')
+    fingerprints = default_fingerprint_cache()
     if not pkg_dirs:
         # 无 pkg 文件夹无法继续
         raise FileNotFoundError(f'未在 {pkgpath} 发现任何 pkg-* 文件夹')
     _progress(5, '扫描完成')
 
+    if dry_run:
+        # dry-run 只做规划：一次算出完整的操作计划（大小、复制/硬链接、空间检查、预计耗时）并一次性输出，不读写任何文件；
+        # 输出文件夹已存在（且未选择删除）或空间不足时与实际发布一样报错
+        plan_start = time.perf_counter()
+        if not platforms:
+            raise ValueError('没有选择任何平台')
+        plan = plan_release(index, version, date, platforms, helppath, uppath, output_base, editions)
+        # 与实际发布一致：delete_existing 删除当前目录下的旧发布文件夹与输出文件夹，clear_upgrade 清空 uppath
+        removed = []
+        if delete_existing:
+            removed += matching_release_dirs('.', r'^灵犀·晓伴_.* --.*') + [plan['out_dir']]
+        if clear_upgrade:
+            removed.append(uppath)
+        details = plan_details(plan, link_copies, [d for d in removed if os.path.isdir(d)])
+        notes = []
+        if delete_existing:
+            notes.append('删除当前目录下已存在的“灵犀·晓伴_* --*”发布文件夹')
+        if clear_upgrade:
+            notes.append(f'清空 {uppath}')
+        if verify_sources:
+            notes.append('复制的同时并行校验源 zip 的完整性（逐条目 CRC）')
+        if make_deltas:
+            notes.append(f'按 releases.json 中的上一版本生成差分（{delta_format}，基准目录 {delta_base_path or uppath}）'
+                         '并写入 upgrade_manifest.json')
+        if make_bundles:
+            notes.append(f'为各平台子文件夹生成分发压缩包（{bundle_dir or plan["out_dir"]}）')
+        if plan['releases']:
+            notes.append('releases.json 以紧凑副本 + 预压缩 + ETag 的形式发布')
+        notes.append(f'落盘策略 {durability}')
+        _log(format_plan(plan, notes), 'info')
+        _log(f'规划耗时 {(time.perf_counter() - plan_start) * 1000:.0f} ms', 'info')
+
+        if plan['out_dir'] in details['existing']:
+            raise FileExistsError(f'输出文件夹已存在: {plan["out_dir"]}')
+        if details['short']:
+            detail = '；'.join(f'{d} 需要 {need / 2 ** 20:.0f} MiB，可用 {free / 2 ** 20:.0f} MiB'
+                              for d, need, free in details['short'])
+            raise ValueError(f'目标磁盘空间不足：{detail}')
+        _progress(100, '完成')
+        _log('发布计划生成完成（dry-run，未修改磁盘）', 'success')
+        return {
+            'out_dir': plan['out_dir'],
+            'platforms': list(platforms),
+            'dry_run': True,
+            'deltas': [],
+            'verified': [],
+            'bundles': [],
+            'memory': {},
+            'durability': dict(sync.stats),
+            'editions': [ed['slug'] for ed in editions],
+            'plan': plan,
+        }
+
     # 如果用户勾选了删除已存在的发布主文件夹，则在当前工作目录下删除匹配的文件夹
     if delete_existing:
         try:
@@ -273,6 +908,9 @@ def create_release(version: str,
         return {'status': 'stopped'}
 
     # ========== 处理 upgrade_package（可选清空） ==========
+    delta_base = delta_base_path or uppath
+    if make_deltas and clear_upgrade and os.path.abspath(delta_base) == os.path.abspath(uppath):
+        _log(f'清空 {uppath} 会删除上一版本升级包，差分将无法生成；请通过 delta_base_path 指定其他目录', 'warning')
     # 注意：在 Windows 上清空文件夹可能会因为文件被占用或权限问题失败
     if clear_upgrade:
         _log(f'将清空 {uppath}' if not dry_run else f'[DRY] 将清空 {uppath}', 'warning')
@@ -346,8 +984,11 @@ def create_release(version: str,
     _progress(15, '准备输出目录')
 
     # ========== 输出目录与子文件夹 ==========
-    new_dir_name = f"灵犀·晓伴_{version} --{date}"
-    out_main = os.path.join(output_base, new_dir_name)
+    # 一次算出全部输出路径（与 GUI 预览共用 plan_release）
+    plan = plan_release(index, version, date, platforms, helppath, uppath, output_base, editions)
+    out_main = plan['out_dir']
+    releases_dst = plan['releases']['dst'] if plan['releases'] else None
+    sources.update((os.path.abspath(dst), src) for dst, src, _ in plan_outputs(plan) if dst != releases_dst)
     if os.path.exists(out_main):
         _log(f'已存在输出文件夹: {out_main}', 'warning')
         if not delete_existing:
@@ -358,13 +999,9 @@ def create_release(version: str,
             if not dry_run:
                 shutil.rmtree(out_main)
 
-    mac_dir_name = f"灵犀·晓伴 {version} mac"
-    win_dir_name = f"灵犀·晓伴 {version} win"
-    linux_dir_name = f"灵犀·晓伴 {version} 统信+麒麟"
-
     # 创建平台子文件夹（或在 dry-run 中记录）
-    targets = [os.path.join(out_main, mac_dir_name), os.path.join(out_main, win_dir_name), os.path.join(out_main, linux_dir_name)]
-    for t in targets:
+    subdirs = plan['subdirs']
+    for t in (subdirs['mac'], subdirs['win'], subdirs['linux']):
         if dry_run:
             _log(f'[DRY] MKDIR {t}', 'info')
         else:
@@ -386,95 +1023,221 @@ def create_release(version: str,
     # 分配进度区间（30% - 80%）给平台处理
     start_pct = 30
     end_pct = 80
-
-    for i, platform in enumerate(selected_platforms, start=1):
-        if _should_stop():
-            _log('被中止（平台复制中）', 'warning')
+    # 记录本次生成的主版次升级包 (upgrade_arch, version, path)，供差分与升级元数据使用
+    upgrades = []
+    # 全部复制操作 (src, [dst...], [主版次升级包记录或 None...])，每个源文件一项，按设备并发执行
+    copies = []
+    # 源 zip 完整性校验：复制前提交到进程池，与复制并行进行；记录每个源复制出的文件，校验失败时删除
+    verifier = ZipVerifier() if verify_sources else None
+    produced = {}
+
+    def _verify(src: str, *dsts: str):
+        if verifier is not None:
+            verifier.submit(src)
+            produced.setdefault(src, []).extend(dsts)
+
+    for item in plan['platforms']:
+        _log(f'处理平台: {item["platform"]}', 'info')
+        if item['warning']:
+            _log(item['warning'], 'warning')
+        if item['src']:
+            _verify(item['src'], *item['dsts'])
+            copies.append((item['src'], item['dsts'], item['records']))
+
+    # 开始复制前按目标设备检查剩余空间，避免复制到一半才因空间不足失败
+    if not dry_run:
+        pairs = []
+        for src, dsts, _ in copies:
+            # 硬链接的目标不占用额外空间：每个设备只计一份
+            devices = set()
+            for dst in dsts:
+                if link_copies:
+                    dev = device_of(dst)
+                    if dev in devices:
+                        continue
+                    devices.add(dev)
+                pairs.append((src, dst))
+        short = check_free_space(pairs)
+        if short:
+            if verifier is not None:
+                verifier.shutdown(wait=False)
+            detail = '；'.join(f'{d} 需要 {need / 2 ** 20:.0f} MiB，可用 {free / 2 ** 20:.0f} MiB' for d, need, free in short)
+            raise ValueError(f'目标磁盘空间不足：{detail}')
+
+    # 按设备分组限制并发：同一机械盘上逐个复制，SSD 上多路并行；dry-run 逐个记录以保持日志顺序
+    scheduler = CopyScheduler(limits=io_limits, probe=io_probe and not dry_run,
+                              max_workers=1 if dry_run else copy_workers, log=_log)
+    finished = [0]
+    finished_lock = threading.Lock()
+
+    def _copy(src: str, dsts: list) -> list:
+        return safe_copy_many(src, dsts, dry_run, log_callback, fingerprints, drop_cache, sync, link_copies)
+
+    def _copied(i: int, ok):
+        with finished_lock:
+            finished[0] += 1
+            pct = int(start_pct + finished[0] / len(copies) * (end_pct - start_pct))
+        _progress(pct, f'复制 {finished[0]}/{len(copies)}')
+
+    copy_results = scheduler.run([(src, dsts, _copy) for src, dsts, _ in copies], _should_stop, _copied)
+    if _should_stop():
+        _log('被中止（平台复制中）', 'warning')
+        if verifier is not None:
+            verifier.shutdown(wait=False)
+        # batch 落盘时已完成的复制还停留在临时文件中，替换到位后再返回
+        _flush('中止前')
+        return {'status': 'stopped'}
+    for (_, _, records), oks in zip(copies, copy_results):
+        if not isinstance(oks, list):
+            # 复制函数本身抛出异常（结果为异常对象）
+            _log(f'复制失败: {oks}', 'error')
+            continue
+        for record, ok in zip(records, oks):
+            if ok and record is not None:
+                upgrades.append(record)
+    lost = _flush('平台复制')
+    # 落盘时替换失败（重试也失败）的升级包不参与差分与升级元数据
+    upgrades = [u for u in upgrades if os.path.abspath(u[2]) not in lost]
+
+    _progress(82, '平台复制完成')
+
+    # ========== 收集源 zip 校验结果（可选），损坏则在发布前中止 ==========
+    verified = []
+    if verifier is not None:
+        _log('等待源 zip 完整性校验结果...', 'info')
+        results = verifier.wait(_should_stop)
+        verifier.shutdown()
+        if results is None:
+            _log('被中止（校验源 zip 时）', 'warning')
             return {'status': 'stopped'}
-
-        frac = (i - 1) / total_plats
-        pct = int(start_pct + frac * (end_pct - start_pct))
-        _progress(pct, f'处理平台 {platform}...')
-        _log(f'处理平台: {platform}', 'info')
-
-        # Windows 特殊处理：使用 suxiaoban 的安装包
-        if platform == 'win-x64':
-            wins = get_suxiaoban_setup_files(pkgpath)
-            if wins:
-                win_file = wins[0]
-                m = re.findall(r'\d+\.\d+\.\d+', win_file)
-                win_version = m[0] if m else version
-                new_win_x64 = f"灵犀·晓伴-{win_version}-标准版-{date[-4:]}-win-x64.zip"
-                src = os.path.join(pkgpath, win_file)
-                dst = os.path.join(out_main, win_dir_name, new_win_x64)
-                safe_copy(src, dst, dry_run, log_callback)
-                # 同时生成升级包放到 uppath
-                upgrade_name = f"gerenzhushou-{win_version}-standard-win32-x64.zip"
-                safe_copy(src, os.path.join(uppath, upgrade_name), dry_run, log_callback)
-            else:
-                _log('未找到 Windows 安装包', 'warning')
+        bad = [r for r in results if not r['ok']]
+        for r in results:
+            if r['ok']:
+                verified.append(r['path'])
+                _log(f'校验通过: {r["path"]}（{r["entries"]} 个条目, {r["bytes"]} 字节）', 'success')
+        if bad:
+            for r in bad:
+                _log(f'源 zip 校验失败: {r["path"]}: {r["error"]}', 'error')
+                for dst in produced.get(r['path'], []):
+                    if dry_run:
+                        _log(f'[DRY] 删除 {dst}', 'warning')
+                    elif os.path.exists(dst):
+                        os.remove(dst)
+                        _log(f'已删除由损坏源复制出的文件: {dst}', 'warning')
+            raise ValueError(f'{len(bad)} 个源 zip 未通过完整性校验，已中止发布（未更新 releases.json）: '
+                             + ', '.join(r['path'] for r in bad))
+
+    _progress(85, '源文件就绪')
+
+    # ========== 生成差分升级包与升级元数据（可选） ==========
+    deltas = []
+    releases_src = os.path.join(helppath, 'releases.json')
+    if make_deltas:
+        if not os.path.exists(releases_src):
+            _log(f'未找到 {releases_src}，无法确定上一版本，跳过差分', 'warning')
         else:
-            # 非 Windows 平台，查找 pkg-<arch> 目录
-            arch_map = {
-                'linux-arm64': ('linux', 'linux-arm64', linux_dir_name),
-                'linux-x64': ('linux', 'linux-x64', linux_dir_name),
-                'mac-arm64': ('mac', 'mac-arm64', mac_dir_name),
-                'mac-x64': ('mac', 'mac-intel-x64', mac_dir_name),
-            }
-            if platform not in arch_map:
-                _log(f'未知平台: {platform}', 'warning')
-                continue
-            _, arch, target_dir = arch_map[platform]
-            # 在 pkgpath 下查找匹配的目录并复制 "灵犀·晓伴.zip"
-            for d in os.listdir(pkgpath):
-                if os.path.isdir(os.path.join(pkgpath, d)) and re.match(fr'^pkg-{arch}.*', d):
-                    src = os.path.join(pkgpath, d, '灵犀·晓伴.zip')
-                    if os.path.exists(src):
-                        new_filename = f"灵犀·晓伴-{version}-标准版-{date[-4:]}-{arch}.zip"
-                        dst = os.path.join(out_main, target_dir, new_filename)
-                        safe_copy(src, dst, dry_run, log_callback)
-                        # 生成并复制升级包到 uppath
-                        upgrade_arch = arch
-                        if arch.startswith('mac'):
-                            upgrade_arch = arch.replace('mac-', 'darwin-')
-                        upgrade_name = f"gerenzhushou-{version}-standard-{upgrade_arch}.zip"
-                        safe_copy(src, os.path.join(uppath, upgrade_name), dry_run, log_callback)
-                    else:
-                        _log(f'源文件不存在: {src}', 'warning')
-                    break
-
-    _progress(85, '平台复制完成')
+            _progress(86, '生成差分升级包...')
+            versions = load_release_versions(releases_src)
+            # 上一份升级元数据中仍在保留期内的差分（需在生成新清单前读取）
+            kept = retained_deltas(load_manifest(delta_base), versions, delta_keep, delta_base)
+            deltas = build_deltas(upgrades, versions, delta_base, uppath, dry_run, _log, _should_stop,
+                                  fmt=delta_format, edition=editions[0]['slug'])
+            if not dry_run:
+                for d in deltas:
+                    sync.written(os.path.join(uppath, d['file']))
+            new_files = set(d['file'] for d in deltas)
+            for d in kept:
+                if d['file'] in new_files:
+                    continue
+                src = os.path.join(delta_base, d['file'])
+                dst = os.path.join(uppath, d['file'])
+                if os.path.abspath(src) != os.path.abspath(dst):
+                    sources[os.path.abspath(dst)] = src
+                    if not safe_copy(src, dst, dry_run, log_callback, drop_cache=drop_cache, durability=sync):
+                        continue
+                deltas.append(d)
+            if not dry_run:
+                # 各平台升级包并行计算 SHA-256（进程池，按路径/大小/mtime 缓存）
+                digests = shared_hash_pool().hash_files([path for _, _, path in upgrades], _should_stop)
+                if digests is None:
+                    _log('被中止（计算升级包校验和时）', 'warning')
+                    _flush('中止前')
+                    return {'status': 'stopped'}
+                packages = [{
+                    'platform': arch,
+                    'version': ver,
+                    'file': os.path.basename(path),
+                    'size': os.path.getsize(path),
+                    'sha256': digests[path],
+                } for arch, ver, path in upgrades]
+                paths = plan_upgrade_paths(versions, packages, deltas)
+                for plat, route_plan in paths.items():
+                    for v, route in route_plan['from'].items():
+                        _log(f'升级路径 {plat} {v} -> {route_plan["target"]}: {route["method"]} '
+                             f'{len(route["steps"])} 个文件, {route["bytes"]} 字节', 'info')
+                manifest_path = write_manifest(uppath, {
+                    'version': version,
+                    'generated': datetime.now().isoformat(timespec='seconds'),
+                    'packages': packages,
+                    'deltas': deltas,
+                    'paths': paths,
+                }, sync)
+                _log(f'写入升级元数据: {manifest_path}', 'success')
 
     # ========== 复制帮助文档 ==========
-    help_items = [
-        ("苏晓伴桌面版帮助说明.docx", [mac_dir_name, win_dir_name, linux_dir_name]),
-        ("苏晓伴 mac 版安装说明.docx", [mac_dir_name]),
-        ("国产电脑使用苏晓伴说明.docx", [linux_dir_name]),
-    ]
-    for hf, targets in help_items:
-        src = os.path.join(helppath, hf)
-        if os.path.exists(src):
-            for t in targets:
-                dst = os.path.join(out_main, t, hf)
-                safe_copy(src, dst, dry_run, log_callback)
-        else:
-            _log(f'帮助文档不存在: {hf}', 'warning')
+    for h in plan['help']:
+        for dst in h['dsts']:
+            safe_copy(h['src'], dst, dry_run, log_callback, drop_cache=drop_cache, durability=sync)
+    for name in plan['missing_help']:
+        _log(f'帮助文档不存在: {name}', 'warning')
 
-    # ========== 复制 releases.json 到 upgrade_package ==========
-    releases_src = os.path.join(helppath, 'releases.json')
+    # releases.json 引用的升级包、差分与元数据必须先于 releases.json 落盘
+    _flush('升级包与帮助文档')
+
+    # ========== 发布 releases.json 到 upgrade_package（紧凑副本 + 预压缩 + ETag） ==========
     if os.path.exists(releases_src):
-        safe_copy(releases_src, os.path.join(uppath, 'releases.json'), dry_run, log_callback)
+        # 源文件不是合法 JSON 时 publish_releases_json 抛出 ValueError，中止发布以免客户端拿到坏文件
+        try:
+            publish_releases_json(releases_src, uppath, dry_run, _log, sync)
+        except OSError as e:
+            _log(f'发布 releases.json 失败: {e}', 'error')
 
     _progress(95, '复制帮助完成')
 
+    # ========== 生成各平台分发压缩包（可选） ==========
+    bundles = []
+    if make_bundles:
+        _progress(96, '生成分发压缩包...')
+        bundle_dirs = [os.path.basename(subdirs[k]) for k in ('mac', 'win', 'linux')]
+        bundles = build_bundles(out_main, bundle_dirs, bundle_dir, dry_run, _log, _should_stop)
+        if _should_stop():
+            _flush('中止前')
+            return {'status': 'stopped'}
+        for b in bundles:
+            sync.written(b['file'])
+    _flush('发布')
+
     # ========== 完成 ==========
     _progress(100, '完成')
     _log('发布流程完成', 'success')
 
+    buffers = shared_buffer_pool()
+    memory = {'buffer_capacity': buffers.capacity, 'buffer_peak': buffers.peak_bytes, 'peak_rss': peak_rss()}
+    if not dry_run:
+        rss = f'，进程峰值内存 {memory["peak_rss"] / 2 ** 20:.0f} MiB' if memory['peak_rss'] else ''
+        _log(f'复制缓冲区峰值 {memory["buffer_peak"] / 2 ** 20:.0f} MiB'
+             f'（上限 {memory["buffer_capacity"] / 2 ** 20:.0f} MiB）{rss}', 'info')
+
     summary = {
         'out_dir': out_main,
         'platforms': list(selected_platforms),
-        'dry_run': bool(dry_run)
+        'dry_run': bool(dry_run),
+        'deltas': deltas,
+        'verified': verified,
+        'bundles': bundles,
+        'memory': memory,
+        'durability': dict(sync.stats),
+        'editions': [ed['slug'] for ed in editions],
     }
     return summary
 
@@ -489,7 +1252,13 @@ class ReleaseGUI:
         self.root.minsize(1000, 700)
         self.stop_event = None
         self.worker = None
+        self.prefetcher = SourcePrefetcher(on_update=self._on_prefetch_update)
+        # package 索引缓存：检查 pkg 与预取共用，在后台线程中查询
+        self.index_cache = PackageIndexCache()
         self.create_widgets()
+        self.root.protocol('WM_DELETE_WINDOW', self.on_close)
+        # 操作人员填写表单期间在后台预取源文件；窗口首次绘制后再启动，不影响启动耗时
+        self.root.after_idle(self.start_prefetch)
 
     def create_widgets(self):
         # 构建主界面布局：顶部 header、操作行、主内容（左输入、右日志）
@@ -599,14 +1368,23 @@ class ReleaseGUI:
         tk.Checkbutton(left_inner, text='是否清空upgrade_package文件夹', variable=self.clear_upgrade_var, bg='white').grid(row=12, column=0, columnspan=2, sticky='w', padx=20)
         self.dry_run_var = tk.BooleanVar(value=True)
         tk.Checkbutton(left_inner, text='模拟运行（dry-run，不做实际拷贝）', variable=self.dry_run_var, bg='white').grid(row=13, column=0, columnspan=2, sticky='w', padx=20)
-
-        tk.Label(left_inner, text='路径（可选，留空使用默认）', font=lbl_font, bg='white').grid(row=14, column=0, sticky='w', padx=12, pady=(12,6))
-        tk.Button(left_inner, text='选择 package 路径', command=self.choose_pkg).grid(row=15, column=0, padx=12, sticky='w')
+        # 选项：复制的同时校验源 zip 完整性（损坏则中止发布）
+        self.verify_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(left_inner, text='发布前校验源 zip 完整性（CRC）', variable=self.verify_var, bg='white').grid(row=14, column=0, columnspan=2, sticky='w', padx=20)
+        # 选项：为每个平台子文件夹生成分发压缩包
+        self.bundle_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(left_inner, text='生成各平台分发压缩包（mac / win / 统信+麒麟）', variable=self.bundle_var, bg='white').grid(row=15, column=0, columnspan=2, sticky='w', padx=20)
+
+        tk.Label(left_inner, text='路径（可选，留空使用默认）', font=lbl_font, bg='white').grid(row=16, column=0, sticky='w', padx=12, pady=(12,6))
+        tk.Button(left_inner, text='选择 package 路径', command=self.choose_pkg).grid(row=17, column=0, padx=12, sticky='w')
         self.pkg_label = tk.Label(left_inner, text='', bg='white')
-        self.pkg_label.grid(row=15, column=1, sticky='w')
-        tk.Button(left_inner, text='选择 help_documentation 路径', command=self.choose_help).grid(row=16, column=0, padx=12, sticky='w')
+        self.pkg_label.grid(row=17, column=1, sticky='w')
+        tk.Button(left_inner, text='选择 help_documentation 路径', command=self.choose_help).grid(row=18, column=0, padx=12, sticky='w')
         self.help_label = tk.Label(left_inner, text='', bg='white')
-        self.help_label.grid(row=16, column=1, sticky='w')
+        self.help_label.grid(row=18, column=1, sticky='w')
+        tk.Label(left_inner, text='源文件预取', bg='white').grid(row=19, column=0, padx=12, pady=(8, 0), sticky='w')
+        self.prefetch_label = tk.Label(left_inner, text='未开始', bg='white', fg='#7f8c8d')
+        self.prefetch_label.grid(row=19, column=1, sticky='w', pady=(8, 0))
 
         # 右侧日志与进度（right 已由 PanedWindow 包含）
         right.rowconfigure(0, weight=1)
@@ -635,6 +1413,45 @@ class ReleaseGUI:
         p = filedialog.askdirectory(title='选择 package 文件夹')
         if p:
             self.pkg_label.config(text=p)
+            self.start_prefetch()
+
+    def start_prefetch(self):
+        # 列出源文件也放在后台线程：package 可能位于很慢的网络共享盘上
+        pkgpath = self.pkg_label.cget('text') or './package'
+
+        def _list_sources():
+            index = self.index_cache.get(pkgpath)
+            return [e['path'] for e in index['sources'].values() if e and e['exists']]
+
+        self.prefetcher.start(pkgpath, _list_sources)
+
+    def _on_prefetch_update(self, status: dict):
+        # 在预取线程中回调，转到主线程更新标签
+        state = status['state']
+        mb = status['bytes'] / 1024 / 1024
+        if state == 'scanning':
+            text, color = '正在扫描 package 目录...', '#7f8c8d'
+        elif state == 'running':
+            text, color = f'{status["done"]}/{status["total"]} 个文件，{mb:.0f} MB', '#2980b9'
+        elif state == 'done':
+            text, color = f'已完成：{status["total"]} 个文件，{mb:.0f} MB，新计算指纹 {status["hashed"]} 个', '#27ae60'
+        elif state == 'cancelled':
+            text, color = '已取消', '#7f8c8d'
+        else:
+            text, color = f'失败: {status["error"]}', '#e74c3c'
+
+        def _update():
+            try:
+                self.prefetch_label.config(text=text, fg=color)
+            except tk.TclError:
+                pass
+        self.root.after(0, _update)
+
+    def on_close(self):
+        self.prefetcher.cancel()
+        if self.stop_event:
+            self.stop_event.set()
+        self.root.destroy()
 
     def choose_help(self):
         p = filedialog.askdirectory(title='选择 help_documentation 文件夹')
@@ -642,10 +1459,34 @@ class ReleaseGUI:
             self.help_label.config(text=p)
 
     def on_check_pkg(self):
+        # 扫描放到后台线程（package 可能在慢速共享盘上），期间按钮显示为检查中
         path = self.pkg_label.cget('text') or './package'
-        dirs = get_pkg_dirs(path)
+        self.check_btn.config(state=tk.DISABLED, text='检查中...')
+
+        def _work():
+            try:
+                index, error = self.index_cache.get(path), None
+            except Exception as e:
+                index, error = None, e
+            self.root.after(0, lambda: self._show_pkg_check(index, error))
+        threading.Thread(target=_work, name='check-pkg', daemon=True).start()
+
+    def _show_pkg_check(self, index: Optional[dict], error: Optional[Exception]):
+        self.check_btn.config(state=tk.NORMAL, text='检查pkg')
+        if error is not None:
+            messagebox.showerror('检查结果', f'扫描 package 失败: {error}')
+            return
+        dirs = index['pkg_dirs']
         if dirs:
-            messagebox.showinfo('检查结果', f'找到 {len(dirs)} 个 pkg 文件夹:\n{dirs}')
+            # 列出各平台源文件；指纹来自共享的持久化缓存（未计算过的显示为“未缓存”）
+            lines = []
+            for platform, entry in index['sources'].items():
+                if entry is None or not entry['exists']:
+                    lines.append(f'{platform}: 未找到')
+                else:
+                    digest = entry['sha256'][:12] if entry['sha256'] else '未缓存'
+                    lines.append(f'{platform}: {entry["size"] / 1024 / 1024:.1f} MB, sha256 {digest}')
+            messagebox.showinfo('检查结果', f'找到 {len(dirs)} 个 pkg 文件夹:\n{dirs}\n\n' + '\n'.join(lines))
         else:
             messagebox.showwarning('检查结果', '未找到 pkg 开头的文件夹')
 
@@ -693,10 +1534,15 @@ class ReleaseGUI:
         delete_existing = self.delete_existing_var.get()
         clear_upgrade = self.clear_upgrade_var.get()
         dry_run = self.dry_run_var.get()
+        verify_sources = self.verify_var.get()
+        make_bundles = self.bundle_var.get()
 
         if not messagebox.askyesno('确认', f'开始发布?\n版本: {version}\n日期: {date}\n平台: {platforms}\nDry-run: {dry_run}'):
             return
 
+        # 发布本身会读取源文件，停止预取以免争用磁盘/网络（已计算的指纹已写入缓存）
+        self.prefetcher.cancel()
+
         # disable
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
@@ -717,7 +1563,7 @@ class ReleaseGUI:
 
         def _target():
             try:
-                res = create_release(version, wps, date, platforms=platforms, pkgpath=pkgpath, helppath=helppath, uppath='./upgrade_package', output_base='./', delete_existing=delete_existing, clear_upgrade=clear_upgrade, dry_run=dry_run, log_callback=_log_cb, progress_callback=_progress_cb, stop_event=self.stop_event)
+                res = create_release(version, wps, date, platforms=platforms, pkgpath=pkgpath, helppath=helppath, uppath='./upgrade_package', output_base='./', delete_existing=delete_existing, clear_upgrade=clear_upgrade, dry_run=dry_run, verify_sources=verify_sources, make_bundles=make_bundles, log_callback=_log_cb, progress_callback=_progress_cb, stop_event=self.stop_event)
                 # Prepare a fixed message string and schedule it on the main thread
                 done_msg = f'发布完成: {res.get("out_dir")}'
                 self.root.after(0, lambda m=done_msg: messagebox.showinfo('完成', m))
@@ -1050,6 +1896,17 @@ def find_and_kill_handles(path: str, log: Optional[Callable[[str, str], None]] =
     return killed_any
 
 
+def matching_release_dirs(base_dir: str, pattern: str) -> List[str]:
+    """返回 base_dir 下名称匹配正则 pattern 的目录路径列表（base_dir 无法列出时为空）。"""
+    try:
+        names = sorted(os.listdir(base_dir))
+    except OSError:
+        return []
+    regex = re.compile(pattern)
+    return [os.path.join(base_dir, name) for name in names
+            if regex.match(name) and os.path.isdir(os.path.join(base_dir, name))]
+
+
 def delete_matching_release_dirs(base_dir: str, pattern: str, dry_run: bool, log: Optional[Callable[[str, str], None]] = None) -> int:
     """删除 base_dir 下名称匹配正则 pattern 的目录。
 
@@ -1147,6 +2004,8 @@ def delete_matching_release_dirs(base_dir: str, pattern: str, dry_run: bool, log
 
 
 if __name__ == '__main__':
+    # 打包为 exe 后，进程池的子进程需要由此识别并进入工作模式
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ReleaseGUI(root)
 
@@ -1159,4 +2018,14 @@ if __name__ == '__main__':
     except Exception:
         pass
 
+    # 启动耗时探针（供 startup_bench.py 使用）：窗口首次绘制完成后写入时间戳并退出
+    probe_file = os.environ.get('RENAME_TOOL_STARTUP_PROBE')
+    if probe_file:
+        def _write_probe():
+            root.update_idletasks()
+            with open(probe_file, 'w', encoding='utf-8') as f:
+                f.write(repr(time.time()))
+            root.destroy()
+        root.after_idle(_write_probe)
+
     root.mainloop()
@@ -0,0 +1,51 @@
+# -*- mode: python ; coding: utf-8 -*-
+# 快速启动版：rename_tool.py（GUI）的单目录（onedir）打包，不使用 UPX，并裁剪用不到的标准库模块。
+# 构建：pyinstaller rename_tool_onedir.spec  ->  dist/rename_tool_onedir/rename_tool.exe
+# 启动耗时对比：python startup_bench.py --gui dist/rename_tool.exe dist/rename_tool_onedir/rename_tool.exe
+
+
+a = Analysis(
+    ['rename_tool.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        'unittest', 'doctest', 'pydoc', 'pdb', 'lib2to3', 'distutils',
+        'setuptools', 'pip', 'xmlrpc',
+    ],
+    noarchive=False,
+    optimize=1,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='rename_tool',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='rename_tool_onedir',
+)
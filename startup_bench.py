@@ -0,0 +1,157 @@
+"""
+Startup benchmark for the frozen release tools.
+- Console targets (Rename_v4): time from launch to the first byte on stdout (time-to-first-prompt)
+- GUI targets (rename_tool): time from launch to the first drawn window (time-to-GUI-visible)
+
+Run:
+  python startup_bench.py --console dist/Rename_v4.exe dist/Rename_v4_onedir/Rename_v4.exe
+  python startup_bench.py --gui dist/rename_tool.exe dist/rename_tool_onedir/rename_tool.exe --runs 10
+
+说明（中文）:
+用于比较单文件（onefile + UPX）与单目录（onedir，见 *_onedir.spec）两种打包方式的启动耗时，
+以便把更快的一种交付给操作人员。
+ - 控制台程序：从启动进程到 stdout 输出第一个字节的时间（即首个提示出现的时间）。
+   Rename_v4 在等待 input() 前已经打印了 pkg 列表，因此首字节即可视为“首个提示”。
+ - GUI 程序：通过环境变量 RENAME_TOOL_STARTUP_PROBE 让 rename_tool 在窗口首次绘制完成后
+   写入时间戳并退出，从而测得“窗口可见”时间（GUI 版本没有控制台，无法通过 stdout 计时）。
+ - 目标也可以是 .py 文件，此时使用当前解释器运行，便于和未打包的源码对比。
+ - 每个目标运行多次，报告最小/中位/最大耗时，并给出中位数最快的目标。
+
+注意：第一次运行 onefile 版本时杀毒软件扫描临时目录会显著拖慢启动，建议 --runs 不少于 5 并关注中位数。
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+
+def _command(target: str) -> List[str]:
+    """把目标转换为命令行：.py 文件用当前解释器运行，其余视为可执行文件。"""
+    if target.lower().endswith('.py'):
+        return [sys.executable, target]
+    return [target]
+
+
+def measure_first_prompt(target: str, cwd: Optional[str] = None, timeout: float = 60.0) -> Optional[float]:
+    """启动控制台程序，返回从启动到 stdout 出现第一个字节的秒数；超时返回 None。
+
+    stdin 使用管道且不写入任何内容，程序会停在第一个 input() 处，测量结束后直接结束进程。
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    first_byte = threading.Event()
+    start = time.perf_counter()
+    proc = subprocess.Popen(_command(target), cwd=cwd, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    elapsed = [None]
+
+    def _reader():
+        if proc.stdout.read(1):
+            elapsed[0] = time.perf_counter() - start
+        first_byte.set()
+
+    threading.Thread(target=_reader, daemon=True).start()
+    first_byte.wait(timeout)
+    try:
+        proc.kill()
+    except Exception:
+        pass
+    proc.wait()
+    return elapsed[0]
+
+
+def measure_gui_visible(target: str, cwd: Optional[str] = None, timeout: float = 60.0) -> Optional[float]:
+    """启动 GUI 程序，返回从启动到窗口首次绘制完成的秒数；超时返回 None。
+
+    探针文件中保存的是 GUI 进程内的 time.time()，与本进程的启动时间戳相减即为可见耗时。
+    """
+    fd, probe = tempfile.mkstemp(prefix='startup_probe_')
+    os.close(fd)
+    os.remove(probe)
+    env = dict(os.environ, RENAME_TOOL_STARTUP_PROBE=probe)
+    start = time.time()
+    proc = subprocess.Popen(_command(target), cwd=cwd, env=env,
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = None
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            if os.path.exists(probe):
+                try:
+                    with open(probe, 'r', encoding='utf-8') as f:
+                        content = f.read().strip()
+                    if content:
+                        result = float(content) - start
+                        break
+                except (OSError, ValueError):
+                    pass
+            if proc.poll() is not None and not os.path.exists(probe):
+                break
+            time.sleep(0.005)
+    finally:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if os.path.exists(probe):
+            os.remove(probe)
+    return result
+
+
+def run_benchmark(targets: List[str], mode: str, runs: int, cwd: Optional[str] = None, timeout: float = 60.0) -> dict:
+    """对每个目标重复测量 runs 次，返回 {target: [seconds or None, ...]}。"""
+    measure = measure_first_prompt if mode == 'console' else measure_gui_visible
+    results = {}
+    for target in targets:
+        samples = []
+        for _ in range(runs):
+            samples.append(measure(target, cwd=cwd, timeout=timeout))
+        results[target] = samples
+    return results
+
+
+def format_report(results: dict, mode: str) -> str:
+    """生成文本报告，并指出中位数最快的目标。"""
+    metric = 'time-to-first-prompt' if mode == 'console' else 'time-to-GUI-visible'
+    lines = [f'{metric} (seconds)', f'{"target":<60} {"min":>8} {"median":>8} {"max":>8} {"fail":>5}']
+    best = None
+    for target, samples in results.items():
+        ok = [s for s in samples if s is not None]
+        fails = len(samples) - len(ok)
+        if not ok:
+            lines.append(f'{target:<60} {"-":>8} {"-":>8} {"-":>8} {fails:>5}')
+            continue
+        med = statistics.median(ok)
+        lines.append(f'{target:<60} {min(ok):>8.3f} {med:>8.3f} {max(ok):>8.3f} {fails:>5}')
+        if best is None or med < best[1]:
+            best = (target, med)
+    if best:
+        lines.append(f'fastest: {best[0]} (median {best[1]:.3f}s)')
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='比较不同打包方式的启动耗时')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--console', nargs='+', metavar='TARGET', help='控制台程序（测量首个提示出现时间）')
+    group.add_argument('--gui', nargs='+', metavar='TARGET', help='GUI 程序（测量窗口可见时间）')
+    parser.add_argument('--runs', type=int, default=5, help='每个目标的运行次数（默认 5）')
+    parser.add_argument('--cwd', default=None, help='运行目标时的工作目录（默认当前目录）')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单次测量超时秒数')
+    args = parser.parse_args(argv)
+
+    mode = 'console' if args.console else 'gui'
+    targets = args.console or args.gui
+    results = run_benchmark(targets, mode, args.runs, cwd=args.cwd, timeout=args.timeout)
+    print(format_report(results, mode))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
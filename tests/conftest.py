@@ -0,0 +1,66 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 测试不能读写用户目录下共享的指纹缓存（模块级单例，需在导入被测模块前设置）
+os.environ.setdefault('GERENZHUSHOU_FINGERPRINT_CACHE',
+                      os.path.join(tempfile.mkdtemp(prefix='gerenzhushou_test_'), 'fingerprints.sqlite3'))
+
+HELP_DOCS = ['苏晓伴桌面版帮助说明.docx', '苏晓伴 mac 版安装说明.docx', '国产电脑使用苏晓伴说明.docx']
+
+
+def make_zip(path: str, version: str, entries: int = 12, seed: int = 0):
+    """生成内容可复现的 zip：大部分条目各版本相同，只有一个条目随版本变化。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rnd = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for i in range(entries):
+            data = bytes(rnd.getrandbits(8) for _ in range(4000))
+            if i == 3:
+                data += version.encode()
+            z.writestr(f'app/f{i}.bin', data)
+
+
+def corrupt_zip(path: str):
+    """翻转 zip 中间（条目数据区）的一个字节，使该条目解压失败或 CRC 不一致。"""
+    with open(path, 'r+b') as f:
+        f.seek(os.fstat(f.fileno()).st_size // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+
+@pytest.fixture
+def release_tree(tmp_path):
+    """package/、help_documentation/ 与带上一版本（1.3.1）升级包的 upgrade_package/。"""
+    pkg = tmp_path / 'package'
+    make_zip(str(pkg / 'pkg-linux-x64' / '灵犀·晓伴.zip'), '1.3.2', seed=1)
+    make_zip(str(pkg / 'pkg-mac-arm64' / '灵犀·晓伴.zip'), '1.3.2', seed=2)
+    make_zip(str(pkg / 'suxiaoban-1.3.2-setup.exe.zip'), '1.3.2', seed=3)
+
+    help_dir = tmp_path / 'help_documentation'
+    help_dir.mkdir()
+    for name in HELP_DOCS:
+        (help_dir / name).write_bytes(b'doc ' + name.encode())
+    releases = {'currentRelease': '1.3.2',
+                'releases': [{'version': v, 'updateTo': {'version': v, 'name': v}} for v in ('1.3.1', '1.3.2')]}
+    (help_dir / 'releases.json').write_text(json.dumps(releases), encoding='utf-8')
+
+    up = tmp_path / 'upgrade_package'
+    make_zip(str(up / 'gerenzhushou-1.3.1-standard-linux-x64.zip'), '1.3.1', seed=1)
+    make_zip(str(up / 'gerenzhushou-1.3.1-standard-darwin-arm64.zip'), '1.3.1', seed=2)
+    make_zip(str(up / 'gerenzhushou-1.3.1-standard-win32-x64.zip'), '1.3.1', seed=3)
+
+    out = tmp_path / 'out'
+    out.mkdir()
+    return {'root': str(tmp_path), 'pkgpath': str(pkg), 'helppath': str(help_dir), 'uppath': str(up),
+            'output_base': str(out)}
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+import artifacts
+from artifacts import FingerprintCache, HashPool, SourcePrefetcher, ZipVerifier, verify_zip
+from conftest import corrupt_zip, make_zip
+
+
+@pytest.fixture
+def zips(tmp_path):
+    good, bad, short = (str(tmp_path / f'{name}.zip') for name in ('good', 'bad', 'short'))
+    for path in (good, bad, short):
+        make_zip(path, '1.3.2')
+    corrupt_zip(bad)
+    with open(short, 'r+b') as f:
+        f.truncate(os.path.getsize(short) // 2)
+    return good, bad, short
+
+
+def test_zip_verifier_rejects_corrupt_and_truncated_archives(zips):
+    good, bad, short = zips
+
+    with ZipVerifier(workers=2) as verifier:
+        for path in zips + (good,):
+            verifier.submit(path)
+        results = {r['path']: r for r in verifier.wait()}
+
+    # 同一路径只校验一次
+    assert len(results) == 3
+    assert results[good]['ok'] and results[good]['entries'] == 12 and results[good]['error'] == ''
+    assert not results[bad]['ok'] and results[bad]['error']
+    assert not results[short]['ok'] and 'BadZipFile' in results[short]['error']
+
+
+def test_verify_zip_reports_instead_of_raising(tmp_path):
+    result = verify_zip(str(tmp_path / 'missing.zip'))
+    assert not result['ok'] and result['error'].startswith('FileNotFoundError')
+
+
+def _files(tmp_path, n=4, size=64 * 1024):
+    """生成 n 个文件，mtime 调到一小时前（FingerprintCache 不缓存刚写入的文件）。"""
+    paths = []
+    past = time.time() - 3600
+    for i in range(n):
+        path = tmp_path / f'f{i}.bin'
+        path.write_bytes(os.urandom(size + i))
+        os.utime(path, (past, past))
+        paths.append(str(path))
+    return paths
+
+
+def _sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _no_hashing(monkeypatch):
+    def fail(path, algorithm='sha256'):
+        raise AssertionError(f'不应重新计算: {path}')
+
+    monkeypatch.setattr(artifacts, 'hash_file', fail)
+
+
+def test_hash_pool_reuses_cached_digests(tmp_path, monkeypatch):
+    paths = _files(tmp_path)
+    with HashPool(workers=2) as pool:
+        assert pool.hash_files(paths) == {p: _sha256(p) for p in paths}
+
+        _no_hashing(monkeypatch)
+        assert pool.hash_files(paths) == {p: _sha256(p) for p in paths}
+
+        # 大小或 mtime 变化后缓存不再适用
+        monkeypatch.undo()
+        with open(paths[0], 'ab') as f:
+            f.write(b'x')
+        assert pool.hash_file(paths[0]) == _sha256(paths[0])
+
+
+def test_hash_pool_shares_digests_through_the_fingerprint_cache(tmp_path, monkeypatch):
+    paths = _files(tmp_path)
+    cache = FingerprintCache(str(tmp_path / 'fp.sqlite3'))
+    with HashPool(workers=2, fingerprints=cache) as pool:
+        digests = pool.hash_files(paths)
+
+    # 新的 HashPool（例如下一次启动的工具）直接从持久化缓存取得摘要
+    _no_hashing(monkeypatch)
+    with HashPool(workers=2, fingerprints=FingerprintCache(cache.path)) as pool:
+        assert pool.hash_files(paths) == digests
+
+
+
+def test_fingerprint_cache_invalidates_on_size_or_mtime_change(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'fp.sqlite3'))
+    path = _files(tmp_path, n=1)[0]
+    assert cache.put(path, 'digest-a')
+    assert cache.get(path) == 'digest-a'
+
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert cache.get(path) is None
+    # 失效的条目已被删除，恢复原 mtime 也不会再命中
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.get(path) is None
+
+    assert cache.put(path, 'digest-b')
+    with open(path, 'r+b') as f:
+        f.truncate(10)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.get(path) is None
+
+
+def test_fingerprint_cache_skips_recent_files_and_prunes(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'fp.sqlite3'), max_entries=2)
+    fresh = tmp_path / 'fresh.bin'
+    fresh.write_bytes(b'still being written')
+    # mtime 距今不足 SETTLE_NS 的文件可能仍在写入，不缓存
+    assert not cache.put(str(fresh), 'digest')
+
+    paths = _files(tmp_path, n=3)
+    for i, path in enumerate(paths):
+        assert cache.put(path, f'digest-{i}')
+    with cache._conn() as conn:
+        conn.execute('UPDATE fingerprints SET last_used = last_used - 100 WHERE path = ?', (paths[0],))
+    cache.prune()
+    # 超出容量时先删除最久未使用的条目
+    assert [cache.get(p) for p in paths] == [None, 'digest-1', 'digest-2']
+
+
+class _Updates:
+    """收集 SourcePrefetcher 的状态回调，wait(key) 等待该轮结束。"""
+
+    def __init__(self):
+        self.statuses = []
+        self._cond = threading.Condition()
+
+    def __call__(self, status):
+        with self._cond:
+            self.statuses.append(status)
+            self._cond.notify_all()
+
+    def wait(self, key, timeout=5):
+        def _final():
+            return [s for s in self.statuses if s['key'] == key and s['state'] in ('done', 'cancelled', 'failed')]
+        with self._cond:
+            assert self._cond.wait_for(_final, timeout)
+            return _final()[-1]
+
+
+def test_prefetcher_fingerprints_sources_once(tmp_path):
+    paths = _files(tmp_path, n=3)
+    cache = FingerprintCache(str(tmp_path / 'fp.sqlite3'))
+    updates = _Updates()
+    prefetcher = SourcePrefetcher(cache, on_update=updates, chunk_size=16 * 1024)
+
+    prefetcher.start('first', lambda: paths)
+    final = updates.wait('first')
+    assert (final['done'], final['total'], final['hashed']) == (3, 3, 3)
+    assert final['bytes'] == sum(os.path.getsize(p) for p in paths)
+    assert [cache.get(p) for p in paths] == [_sha256(p) for p in paths]
+
+    # 已有指纹的文件只预读，不再计算
+    prefetcher.start('again', lambda: paths)
+    assert updates.wait('again')['hashed'] == 0
+
+
+def test_prefetcher_restart_cancels_the_previous_round(tmp_path):
+    paths = _files(tmp_path, n=2)
+    cache = FingerprintCache(str(tmp_path / 'fp.sqlite3'))
+    updates = _Updates()
+    prefetcher = SourcePrefetcher(cache, on_update=updates)
+    listed = threading.Event()
+    gate = threading.Event()
+
+    def slow_listing():
+        listed.set()
+        gate.wait(5)
+        return paths
+
+    prefetcher.start('old', slow_listing)
+    assert listed.wait(5)
+    # 例如更换了 package 路径：上一轮被取消，不写入任何指纹
+    prefetcher.start('new', lambda: [])
+    gate.set()
+
+    assert updates.wait('old')['state'] == 'cancelled'
+    assert updates.wait('new')['state'] == 'done'
+    assert [cache.get(p) for p in paths] == [None, None]
+
@@ -0,0 +1,280 @@
+import errno
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+import copy_engine
+from copy_engine import BufferPool, CopyScheduler, Durability, InsufficientSpaceError, check_free_space, copy_file
+from rename_tool import safe_copy
+
+
+@pytest.fixture
+def fs_calls(monkeypatch):
+    """记录 os.fsync / os.replace 的调用顺序：('fsync-file' / 'fsync-dir' / 'replace', inode)。"""
+    calls = []
+    real_fsync, real_replace = os.fsync, os.replace
+
+    def fsync(fd):
+        st = os.fstat(fd)
+        if stat.S_ISDIR(st.st_mode):
+            calls.append(('fsync-dir', st.st_ino))
+        else:
+            calls.append(('fsync-file', st.st_ino))
+        real_fsync(fd)
+
+    def replace(src, dst):
+        calls.append(('replace', os.stat(src).st_ino))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'fsync', fsync)
+    monkeypatch.setattr(os, 'replace', replace)
+    return calls
+
+
+def _copy_all(tmp_path, durability):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(64 * 1024))
+    dsts = [str(tmp_path / d / f'f{i}.bin') for d in ('a', 'b') for i in range(3)]
+    for dst in dsts:
+        assert safe_copy(str(src), dst, False, durability=durability)
+    return src, dsts
+
+
+def test_batch_fsyncs_temps_before_replacing_and_each_dir_once(tmp_path, fs_calls):
+    durability = Durability('batch')
+    src, dsts = _copy_all(tmp_path, durability)
+    # 替换推迟到 flush()，此前目标尚不存在
+    assert fs_calls == [] and not any(os.path.exists(d) for d in dsts)
+
+    assert durability.flush() == (6, 2, [])
+
+    kinds = [kind for kind, _ in fs_calls]
+    assert kinds == ['fsync-file'] * 6 + ['replace'] * 6 + ['fsync-dir'] * 2
+    # fsync 的正是随后被替换的临时文件
+    assert sorted(ino for kind, ino in fs_calls if kind == 'fsync-file') == \
+        sorted(ino for kind, ino in fs_calls if kind == 'replace')
+    dir_inodes = {os.stat(tmp_path / d).st_ino for d in ('a', 'b')}
+    assert {ino for kind, ino in fs_calls if kind == 'fsync-dir'} == dir_inodes
+    for dst in dsts:
+        with open(dst, 'rb') as f:
+            assert f.read() == src.read_bytes()
+    assert not [n for d in ('a', 'b') for n in os.listdir(tmp_path / d) if n.startswith('.tmp')]
+
+
+def test_file_mode_fsyncs_each_file_before_its_replace(tmp_path, fs_calls):
+    _copy_all(tmp_path, Durability('file'))
+
+    kinds = [kind for kind, _ in fs_calls]
+    assert kinds == ['fsync-file', 'replace', 'fsync-dir'] * 6
+
+
+def test_batch_flush_survives_a_failed_replace(tmp_path):
+    durability = Durability('batch')
+    src = tmp_path / 'src.bin'
+    src.write_bytes(b'data')
+    good, bad = tmp_path / 'out' / 'good.bin', tmp_path / 'out' / 'bad.bin'
+    bad.mkdir(parents=True)
+    for dst in (bad, good):
+        assert safe_copy(str(src), str(dst), False, durability=durability)
+
+    files, _, failed = durability.flush()
+
+    # 目标是目录，替换失败：只影响这一个文件，临时文件被删除，失败交给调用方处理
+    assert files == 1
+    assert [(dst, type(err)) for dst, err in failed] == [(str(bad), IsADirectoryError)]
+    assert good.read_bytes() == b'data' and bad.is_dir()
+    assert not [n for n in os.listdir(tmp_path / 'out') if n.startswith('.tmp')]
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fadvise'), reason='需要 posix_fadvise')
+@pytest.mark.parametrize('drop_cache', [True, False])
+def test_copy_drops_page_cache_chunk_by_chunk(tmp_path, monkeypatch, drop_cache):
+    chunk = 64 * 1024
+    src, dst = tmp_path / 'src.bin', tmp_path / 'dst.bin'
+    src.write_bytes(os.urandom(3 * chunk + 100))
+    calls = []
+    real_fadvise = os.posix_fadvise
+
+    def fadvise(fd, offset, length, advice):
+        calls.append((os.fstat(fd).st_ino, offset, length, advice))
+        real_fadvise(fd, offset, length, advice)
+
+    monkeypatch.setattr(os, 'posix_fadvise', fadvise)
+
+    copy_file(str(src), str(dst), drop_cache=drop_cache, pool=BufferPool(chunk, chunk))
+
+    assert dst.read_bytes() == src.read_bytes()
+    if not drop_cache:
+        assert calls == []
+        return
+    src_ino, dst_ino = src.stat().st_ino, dst.stat().st_ino
+    assert (src_ino, 0, 0, os.POSIX_FADV_SEQUENTIAL) in calls
+    chunks = [(0, chunk), (chunk, chunk), (2 * chunk, chunk), (3 * chunk, 100)]
+    # 源文件读完一块即丢弃；目标文件每块回写完成后丢弃，最后一块在 finish() 中处理
+    assert [(o, n) for ino, o, n, adv in calls if ino == src_ino and adv == os.POSIX_FADV_DONTNEED] == chunks
+    assert [(o, n) for ino, o, n, adv in calls if ino == dst_ino and adv == os.POSIX_FADV_DONTNEED] == chunks
+
+
+def test_buffer_pool_blocks_when_all_buffers_are_lent():
+    pool = BufferPool(max_bytes=2 * 1024 + 100, buffer_size=1024)
+    assert pool.capacity == 2048
+    first, second = pool.acquire(), pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.2)
+    # 第三次借用在归还之前一直阻塞，并拿到被归还的同一个缓冲区
+    assert waiter.is_alive() and got == []
+    pool.release(first)
+    waiter.join(5)
+    assert got[0] is first
+    pool.release(second)
+    pool.release(got[0])
+    assert pool.peak_bytes == 2048
+
+
+def test_parallel_copies_stay_within_the_pool(tmp_path):
+    pool = BufferPool(max_bytes=2 * 64 * 1024, buffer_size=64 * 1024)
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(512 * 1024))
+    threads = [threading.Thread(target=copy_file, args=(str(src), str(tmp_path / f'dst{i}.bin')),
+                                kwargs={'pool': pool}) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert pool.peak_bytes <= pool.capacity
+    for i in range(6):
+        assert (tmp_path / f'dst{i}.bin').read_bytes() == src.read_bytes()
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fallocate'), reason='需要 posix_fallocate')
+def test_preallocation_reports_enospc_and_ignores_unsupported_filesystems(tmp_path, monkeypatch):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(4096))
+
+    def fallocate(code):
+        def _fallocate(fd, offset, length):
+            raise OSError(code, os.strerror(code))
+        return _fallocate
+
+    monkeypatch.setattr(os, 'posix_fallocate', fallocate(errno.ENOSPC))
+    with pytest.raises(InsufficientSpaceError) as info:
+        copy_file(str(src), str(tmp_path / 'full.bin'))
+    assert info.value.errno == errno.ENOSPC and '4096' in str(info.value)
+
+    # 文件系统不支持预分配时按普通方式写入
+    monkeypatch.setattr(os, 'posix_fallocate', fallocate(errno.EOPNOTSUPP))
+    assert copy_file(str(src), str(tmp_path / 'ok.bin')) == 4096
+    assert (tmp_path / 'ok.bin').read_bytes() == src.read_bytes()
+
+
+def test_enospc_while_writing_becomes_insufficient_space(tmp_path, monkeypatch):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(4096))
+
+    def write_all(fd, view):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(copy_engine, '_write_all', write_all)
+    with pytest.raises(InsufficientSpaceError):
+        copy_file(str(src), str(tmp_path / 'dst.bin'))
+
+
+def test_check_free_space_sums_copies_per_device(tmp_path, monkeypatch):
+    srcs = []
+    for i in range(3):
+        path = tmp_path / f'src{i}.bin'
+        path.write_bytes(b'x' * 600)
+        srcs.append(str(path))
+    monkeypatch.setattr(copy_engine, '_free_bytes', lambda path: 1500)
+    pairs = [(src, str(tmp_path / 'out' / f'dst{i}.bin')) for i, src in enumerate(srcs)]
+
+    # 三个 600 字节的文件写入同一设备，合计 1800 字节超过可用的 1500 字节
+    assert check_free_space(pairs) == [(str(tmp_path / 'out'), 1800, 1500)]
+    assert check_free_space(pairs[:2]) == []
+    # 不存在的源文件不计入
+    assert check_free_space([(str(tmp_path / 'missing'), str(tmp_path / 'out' / 'x'))]) == []
+
+
+DEVICES = {'hdd': (1, 'hdd'), 'ssd': (2, 'ssd'), 'ssd2': (3, 'ssd')}
+
+
+@pytest.fixture
+def fake_devices(monkeypatch):
+    """路径的第一段决定设备：/hdd/... 为机械盘，/ssd/... 与 /ssd2/... 为两块 SSD。"""
+    import copy_engine
+
+    def _dev(path):
+        return DEVICES[os.path.abspath(path).strip(os.sep).split(os.sep)[0]]
+
+    monkeypatch.setattr(copy_engine, 'device_of', lambda path: _dev(path)[0])
+    monkeypatch.setattr(copy_engine, 'classify_device', lambda path: _dev(path)[1])
+
+
+class _Recorder:
+    """记录每个设备上的最大并发数与操作开始顺序。"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+        self.started = []
+
+    def __call__(self, src, dst):
+        devs = {p.strip(os.sep).split(os.sep)[0] for p in [src] + ([dst] if isinstance(dst, str) else dst)}
+        with self.lock:
+            self.started.append((src, dst))
+            for d in devs:
+                self.active[d] = self.active.get(d, 0) + 1
+                self.peak[d] = max(self.peak.get(d, 0), self.active[d])
+        time.sleep(self.delay)
+        with self.lock:
+            for d in devs:
+                self.active[d] -= 1
+        if dst.endswith('fail'):
+            raise OSError('boom')
+        return dst
+
+
+def test_scheduler_respects_per_device_limits(fake_devices):
+    record = _Recorder()
+    ops = [(f'/ssd/src{i}', f'/ssd2/dst{i}', record) for i in range(8)]
+    ops += [(f'/hdd/src{i}', f'/hdd/dst{i}', record) for i in range(3)]
+
+    results = CopyScheduler(limits={'ssd': 3, 'hdd': 1}, max_workers=16).run(ops)
+
+    assert results == [dst for _, dst, _ in ops]
+    assert record.peak == {'ssd': 3, 'ssd2': 3, 'hdd': 1}
+
+
+def test_scheduler_keeps_submission_order_per_device(fake_devices):
+    record = _Recorder(delay=0.02)
+    ops = [('/hdd/a', '/ssd/a', record), ('/ssd2/b', '/ssd/b', record), ('/hdd/c', '/ssd/c', record),
+           ('/ssd2/d', '/ssd2/d2', record), ('/hdd/e', '/ssd/e', record)]
+
+    CopyScheduler(limits={'ssd': 1, 'hdd': 1}, max_workers=4).run(ops)
+
+    on_hdd = [src for src, _ in record.started if src.startswith('/hdd')]
+    on_ssd = [dst for _, dst in record.started if dst.startswith('/ssd/')]
+    assert on_hdd == ['/hdd/a', '/hdd/c', '/hdd/e']
+    assert on_ssd == ['/ssd/a', '/ssd/b', '/ssd/c', '/ssd/e']
+
+
+def test_scheduler_reports_errors_and_stops(fake_devices):
+    record = _Recorder(delay=0.01)
+    ops = [('/hdd/a', '/ssd/fail', record)] + [(f'/hdd/s{i}', f'/ssd/d{i}', record) for i in range(5)]
+    done = []
+
+    results = CopyScheduler(limits={'hdd': 1}).run(ops, should_stop=lambda: len(done) >= 2,
+                                                   on_done=lambda i, r: done.append(i))
+
+    assert isinstance(results[0], OSError)
+    assert results[1] == '/ssd/d0'
+    # 中止后尚未派发的操作结果为 None
+    assert results[-1] is None and len(record.started) < len(ops)
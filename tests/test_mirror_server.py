@@ -0,0 +1,186 @@
+import gzip
+import http.client
+import socket
+import time
+
+import pytest
+
+from mirror_server import cache_control, start_server
+
+
+@pytest.mark.parametrize('name, expected', [
+    # 带版本号的文件：同一版本可能重新发布，只能短暂缓存
+    ('gerenzhushou-1.3.2-standard-linux-x64.zip', 'max-age=300'),
+    ('gerenzhushou-1.3.1-to-1.3.2-standard-linux-x64.bdiff', 'max-age=300'),
+    ('releases.json', 'no-cache'),
+    ('upgrade_manifest.json', 'no-cache'),
+])
+def test_cache_control(name, expected):
+    assert expected in cache_control(name)
+    assert 'immutable' not in cache_control(name)
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    (tmp_path / 'releases.json').write_bytes(b'{"versions": []}')
+    server, _ = start_server(str(tmp_path), workers=2, idle_timeout=1.0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get(conn, path='/di-assistant/releases.json') -> int:
+    conn.request('GET', path)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def _request(server, path, **headers):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+    conn.request('GET', path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+PACKAGE = bytes(range(256)) * 40
+PACKAGE_URL = '/di-assistant/releases/1.3.2/gerenzhushou-1.3.2-standard-linux-x64.zip'
+
+
+@pytest.fixture
+def package(mirror, tmp_path):
+    (tmp_path / 'gerenzhushou-1.3.2-standard-linux-x64.zip').write_bytes(PACKAGE)
+    return mirror
+
+
+def test_range_requests(package):
+    full, _ = _request(package, PACKAGE_URL)
+    etag = full.getheader('ETag')
+
+    response, body = _request(package, PACKAGE_URL, Range='bytes=100-199')
+    assert response.status == 206 and body == PACKAGE[100:200]
+    assert response.getheader('Content-Range') == f'bytes 100-199/{len(PACKAGE)}'
+    response, body = _request(package, PACKAGE_URL, Range='bytes=-10')
+    assert response.status == 206 and body == PACKAGE[-10:]
+    response, body = _request(package, PACKAGE_URL, Range=f'bytes={len(PACKAGE) - 5}-')
+    assert response.status == 206 and body == PACKAGE[-5:]
+
+    response, body = _request(package, PACKAGE_URL, Range=f'bytes={len(PACKAGE)}-')
+    assert response.status == 416 and body == b''
+    assert response.getheader('Content-Range') == f'bytes */{len(PACKAGE)}'
+
+    # If-Range 与当前 ETag 一致时续传，不一致（文件已重新发布）时返回完整内容
+    response, body = _request(package, PACKAGE_URL, Range='bytes=0-9', **{'If-Range': etag})
+    assert response.status == 206 and body == PACKAGE[:10]
+    response, body = _request(package, PACKAGE_URL, Range='bytes=0-9', **{'If-Range': '"stale"'})
+    assert response.status == 200 and body == PACKAGE
+
+
+def test_conditional_get_returns_304(package):
+    full, _ = _request(package, PACKAGE_URL)
+    etag, last_modified = full.getheader('ETag'), full.getheader('Last-Modified')
+
+    for headers in ({'If-None-Match': etag}, {'If-None-Match': f'"other", W/{etag}'},
+                    {'If-Modified-Since': last_modified}):
+        response, body = _request(package, PACKAGE_URL, **headers)
+        assert response.status == 304 and body == b''
+        assert response.getheader('ETag') == etag
+    # If-None-Match 存在时忽略 If-Modified-Since
+    response, body = _request(package, PACKAGE_URL,
+                              **{'If-None-Match': '"other"', 'If-Modified-Since': last_modified})
+    assert response.status == 200 and body == PACKAGE
+
+
+def test_precompressed_variant(mirror, tmp_path):
+    compressed = gzip.compress(b'{"versions": []}')
+    (tmp_path / 'releases.json.gz').write_bytes(compressed)
+    (tmp_path / 'releases.json.etag').write_text('"abc"', encoding='ascii')
+
+    response, body = _request(mirror, '/di-assistant/releases.json', **{'Accept-Encoding': 'br;q=1, gzip'})
+    assert response.status == 200 and body == compressed
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('ETag') == '"abc-gz"'
+    assert response.getheader('Vary') == 'Accept-Encoding'
+    response, _ = _request(mirror, '/di-assistant/releases.json',
+                           **{'Accept-Encoding': 'gzip', 'If-None-Match': '"abc-gz"'})
+    assert response.status == 304
+
+    # 不接受 gzip（q=0）或带 Range 时返回原始字节
+    for headers in ({'Accept-Encoding': 'gzip;q=0'}, {'Accept-Encoding': 'gzip', 'Range': 'bytes=0-'}):
+        response, body = _request(mirror, '/di-assistant/releases.json', **headers)
+        assert body == b'{"versions": []}' and response.getheader('Content-Encoding') is None
+        assert response.getheader('ETag') == '"abc"'
+
+
+def test_idle_keep_alive_connections_do_not_hold_workers(mirror):
+    port = mirror.server_address[1]
+    idle = [http.client.HTTPConnection('127.0.0.1', port, timeout=5) for _ in range(8)]
+    for conn in idle:
+        assert _get(conn) == 200
+
+    # 8 个空闲的 keep-alive 连接，线程池只有 2 个线程：新连接仍应立即得到响应
+    start = time.monotonic()
+    assert _get(http.client.HTTPConnection('127.0.0.1', port, timeout=5)) == 200
+    assert time.monotonic() - start < 0.5
+    # 空闲连接上的下一个请求照常处理
+    assert _get(idle[0]) == 200
+
+    # 超过 idle_timeout 后服务器关闭空闲连接
+    time.sleep(1.5)
+    sock = idle[1].sock
+    sock.settimeout(2)
+    assert sock.recv(1) == b''
+    for conn in idle:
+        conn.close()
+
+
+def test_pipelined_requests_on_one_connection(mirror):
+    with socket.create_connection(mirror.server_address, timeout=5) as sock:
+        request = b'GET /di-assistant/releases.json HTTP/1.1\r\nHost: x\r\n\r\n'
+        sock.sendall(request * 2 + request.replace(b'Host: x', b'Host: x\r\nConnection: close'))
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    assert data.count(b'HTTP/1.1 200') == 3
+
+
+def test_loadtest_serves_from_a_subprocess(tmp_path, capsys):
+    import mirror_loadtest
+
+    (tmp_path / 'releases.json').write_text('{"currentRelease": "1.3.2", "releases": [{"version": "1.3.2"}]}')
+    proc, base_url = mirror_loadtest.spawn_server(str(tmp_path), workers=2)
+    try:
+        assert proc.poll() is None
+        conn = http.client.HTTPConnection(base_url.split('/')[2], timeout=5)
+        assert _get(conn) == 200
+        conn.close()
+    finally:
+        mirror_loadtest.stop_server(proc)
+    assert proc.poll() is not None
+
+    assert mirror_loadtest.main(['--serve', str(tmp_path), '--clients', '10', '--ramp', '0.1', '--poll-only']) == 0
+    out = capsys.readouterr().out
+    assert '子进程' in out and 'errors: 0 /' in out
+
+
+def test_loadtest_exits_non_zero_on_errors(tmp_path, capsys):
+    import mirror_loadtest
+
+    # currentRelease 的升级包不存在：需要升级的客户端下载得到 404
+    (tmp_path / 'releases.json').write_text(
+        '{"currentRelease": "1.3.2", "releases": [{"version": "1.3.1"}, {"version": "1.3.2"}]}')
+    assert mirror_loadtest.main(['--serve', str(tmp_path), '--in-process', '--clients', '10', '--ramp', '0.1']) == 1
+    captured = capsys.readouterr()
+    assert 'download: RuntimeError' in captured.out and '个错误' in captured.err
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    assert mirror_loadtest.main(['--url', f'http://127.0.0.1:{port}/di-assistant', '--clients', '1',
+                                 '--timeout', '2']) == 1
+    assert '无法开始压测' in capsys.readouterr().err
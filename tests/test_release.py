@@ -0,0 +1,305 @@
+import json
+import os
+
+import pytest
+
+import rename_tool
+from conftest import corrupt_zip, make_zip
+from rename_tool import create_release, format_plan, plan_details, plan_outputs, plan_release, scan_package_index
+
+PLATFORMS = ['linux-x64', 'mac-arm64', 'win-x64']
+
+
+def _release(tree, **kwargs):
+    logs = []
+    kwargs.setdefault('platforms', PLATFORMS)
+    summary = create_release('1.3.2', '', '20261018', pkgpath=tree['pkgpath'],
+                             helppath=tree['helppath'], uppath=tree['uppath'], output_base=tree['output_base'],
+                             log_callback=lambda msg, level='info': logs.append((level, msg)), **kwargs)
+    return summary, logs
+
+
+def _files(directory):
+    return sorted(os.path.relpath(os.path.join(d, f), directory) for d, _, files in os.walk(directory) for f in files)
+
+
+def test_make_deltas_runs_to_the_end(release_tree):
+    summary, logs = _release(release_tree, make_deltas=True)
+
+    assert not [m for level, m in logs if level == 'error']
+    assert len(summary['deltas']) == 3
+    with open(os.path.join(release_tree['uppath'], 'upgrade_manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert {p['platform'] for p in manifest['packages']} == {'linux-x64', 'darwin-arm64', 'win32-x64'}
+    # 写完升级元数据之后的步骤（帮助文档、releases.json）也必须执行
+    assert os.path.exists(os.path.join(release_tree['uppath'], 'releases.json'))
+    out_files = _files(summary['out_dir'])
+    assert sum(1 for f in out_files if f.endswith('.docx')) == 5
+
+
+def test_plan_matches_release_output(release_tree):
+    plan = plan_release(scan_package_index(release_tree['pkgpath']), '1.3.2', '20261018', PLATFORMS,
+                        release_tree['helppath'], release_tree['uppath'], release_tree['output_base'])
+    before = set(_files(release_tree['uppath']))
+
+    summary, _ = _release(release_tree)
+
+    assert summary['out_dir'] == plan['out_dir']
+    planned = {os.path.abspath(dst) for dst, _, _ in plan_outputs(plan)}
+    written = {os.path.abspath(os.path.join(summary['out_dir'], f)) for f in _files(summary['out_dir'])}
+    written |= {os.path.abspath(os.path.join(release_tree['uppath'], f))
+                for f in set(_files(release_tree['uppath'])) - before if f.endswith('.zip')}
+    written.add(os.path.abspath(os.path.join(release_tree['uppath'], 'releases.json')))
+    assert planned == written
+    for dst, src, size in plan_outputs(plan):
+        if not dst.endswith('releases.json'):
+            assert os.path.getsize(dst) == size
+
+
+def test_format_plan_always_prints_the_total(release_tree, tmp_path):
+    index = scan_package_index(release_tree['pkgpath'])
+    empty_help = tmp_path / 'no_help'
+    empty_help.mkdir()
+    for platforms, helppath in ((PLATFORMS, release_tree['helppath']), ([], str(empty_help))):
+        plan = plan_release(index, '1.3.2', '20261018', platforms, helppath,
+                            release_tree['uppath'], release_tree['output_base'])
+        plan_details(plan)
+        # 没有任何复制步骤（也就没有设备吞吐量可列）时，合计行仍然要输出
+        assert '[DRY] 合计:' in format_plan(plan).splitlines()[-1]
+
+
+def test_plan_details_accounts_for_removed_and_renamed_dirs(release_tree, monkeypatch):
+    _release(release_tree)
+    index = scan_package_index(release_tree['pkgpath'])
+    free = 10 * 2 ** 30
+    monkeypatch.setattr(rename_tool, 'free_space',
+                        lambda writes: [(release_tree['root'], sum(size for _, size in writes), free)])
+
+    def _details(**kwargs):
+        plan = plan_release(index, '1.3.2', '20261018', PLATFORMS, release_tree['helppath'],
+                            release_tree['uppath'], release_tree['output_base'])
+        return plan, plan_details(plan, **kwargs)
+
+    plan, kept = _details()
+    assert plan['out_dir'] in kept['existing']
+    upgrade_zips = [p for p in kept['existing'] if p.startswith(release_tree['uppath'])]
+    assert upgrade_zips
+
+    # 重命名旧主文件夹：其中的文件不再算覆盖，upgrade_package 中的仍然算，可用空间不变
+    _, renamed = _details(renamed=[plan['out_dir']])
+    assert sorted(renamed['existing']) == sorted(upgrade_zips)
+    assert renamed['space'] == kept['space']
+
+    # 删除主文件夹并清空 upgrade_package：没有任何覆盖，删除的字节计入可用空间
+    _, removed = _details(removed=[plan['out_dir'], release_tree['uppath']])
+    assert removed['existing'] == []
+    freed = sum(os.path.getsize(os.path.join(d, f)) for top in (plan['out_dir'], release_tree['uppath'])
+                for d, _, files in os.walk(top) for f in files)
+    assert removed['space'] == [(release_tree['root'], kept['space'][0][1], free + freed)]
+
+    # dry-run 选择删除已存在的输出时不再报“已存在”
+    summary, _ = _release(release_tree, dry_run=True, delete_existing=True)
+    assert summary['dry_run']
+
+
+def test_failed_batch_replace_does_not_abort_the_release(release_tree):
+    # 目标位置被目录占用：替换失败，safe_copy 重试也失败，但发布继续且不留下临时文件
+    blocked = os.path.join(release_tree['uppath'], 'gerenzhushou-1.3.2-standard-linux-x64.zip')
+    os.mkdir(blocked)
+
+    summary, logs = _release(release_tree, make_deltas=True)
+
+    assert summary['out_dir']
+    assert any(blocked in m for level, m in logs if level == 'error')
+    assert {d['platform'] for d in summary['deltas']} == {'darwin-arm64', 'win32-x64'}
+    leftovers = [n for d, _, files in os.walk(release_tree['root']) for n in files if n.startswith('.tmp')]
+    assert leftovers == []
+
+
+EDITIONS = [{'label': '内测版', 'slug': 'beta'}, {'label': '标准版', 'slug': 'standard'}]
+
+
+def _primary_edition_bases(tree, slug):
+    for name in os.listdir(tree['uppath']):
+        os.rename(os.path.join(tree['uppath'], name),
+                  os.path.join(tree['uppath'], name.replace('-standard-', f'-{slug}-')))
+
+
+def test_editions_share_one_read_and_deltas_follow_the_primary_edition(release_tree):
+    _primary_edition_bases(release_tree, 'beta')
+
+    summary, logs = _release(release_tree, editions=EDITIONS, make_deltas=True, link_copies=True)
+
+    assert not [m for level, m in logs if level in ('error', 'warning')]
+    for arch in ('linux-x64', 'darwin-arm64', 'win32-x64'):
+        packages = [os.path.join(release_tree['uppath'], f'gerenzhushou-1.3.2-{slug}-{arch}.zip')
+                    for slug in ('beta', 'standard')]
+        # 同一设备上的各版次目标硬链接到同一份数据
+        assert len({os.stat(p).st_ino for p in packages}) == 1
+    # 差分以主版次（第一个）的上一版本升级包为基准，文件名也使用主版次 slug
+    assert sorted(d['file'] for d in summary['deltas']) == [
+        f'gerenzhushou-1.3.1-to-1.3.2-beta-{arch}.bdiff' for arch in ('darwin-arm64', 'linux-x64', 'win32-x64')]
+    out_files = _files(summary['out_dir'])
+    assert sum(1 for f in out_files if '内测版' in f) == sum(1 for f in out_files if '标准版' in f) == 3
+
+
+def test_failed_hardlink_falls_back_to_copy(release_tree, monkeypatch):
+    def no_link(existing, dst, durability=None):
+        raise OSError('跨设备')
+
+    monkeypatch.setattr(rename_tool, 'link_file', no_link)
+
+    summary, logs = _release(release_tree, editions=EDITIONS, link_copies=True)
+
+    assert any('无法创建硬链接' in m for level, m in logs if level == 'warning')
+    packages = [os.path.join(release_tree['uppath'], f'gerenzhushou-1.3.2-{slug}-linux-x64.zip')
+                for slug in ('beta', 'standard')]
+    assert len({os.stat(p).st_ino for p in packages}) == 2
+    with open(packages[0], 'rb') as a, open(packages[1], 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_failed_multi_target_commit_leaves_no_temp_files(tmp_path, monkeypatch):
+    src = tmp_path / 'src.bin'
+    src.write_bytes(os.urandom(32 * 1024))
+    dsts = [str(tmp_path / 'out' / f'f{i}.bin') for i in range(3)]
+    real_commit = rename_tool.commit_file
+    calls = []
+
+    def flaky_commit(tmp, dst, durability):
+        calls.append(dst)
+        if len(calls) == 2:
+            raise OSError('replace failed')
+        real_commit(tmp, dst, durability)
+
+    monkeypatch.setattr(rename_tool, 'commit_file', flaky_commit)
+
+    assert rename_tool.safe_copy_many(str(src), dsts, False, durability=rename_tool.Durability('none')) == [True] * 3
+
+    for dst in dsts:
+        with open(dst, 'rb') as f:
+            assert f.read() == src.read_bytes()
+    assert not [n for n in os.listdir(tmp_path / 'out') if n.startswith('.tmp')]
+
+
+def test_corrupt_source_zip_aborts_release_and_removes_its_copies(release_tree):
+    corrupt_zip(os.path.join(release_tree['pkgpath'], 'pkg-mac-arm64', '灵犀·晓伴.zip'))
+    logs = []
+
+    with pytest.raises(ValueError, match='完整性校验'):
+        create_release('1.3.2', '', '20261018', platforms=PLATFORMS, pkgpath=release_tree['pkgpath'],
+                       helppath=release_tree['helppath'], uppath=release_tree['uppath'],
+                       output_base=release_tree['output_base'], verify_sources=True,
+                       log_callback=lambda msg, level='info': logs.append((level, msg)))
+
+    assert not os.path.exists(os.path.join(release_tree['uppath'], 'gerenzhushou-1.3.2-standard-darwin-arm64.zip'))
+    assert os.path.exists(os.path.join(release_tree['uppath'], 'gerenzhushou-1.3.2-standard-linux-x64.zip'))
+    # 中止发生在发布 releases.json 之前
+    assert not os.path.exists(os.path.join(release_tree['uppath'], 'releases.json'))
+    assert any('源 zip 校验失败' in m for level, m in logs if level == 'error')
+
+
+def test_release_fails_early_when_the_target_disk_is_too_small(release_tree, monkeypatch):
+    import copy_engine
+
+    monkeypatch.setattr(copy_engine, '_free_bytes', lambda path: 1024)
+
+    with pytest.raises(ValueError, match='目标磁盘空间不足'):
+        _release(release_tree)
+
+    # 在复制任何文件之前中止（只创建了空的输出文件夹）
+    assert _files(release_tree['output_base']) == []
+    assert not [f for f in os.listdir(release_tree['uppath']) if '1.3.2' in f]
+
+
+
+@pytest.fixture
+def two_roots(release_tree, tmp_path):
+    """第二个 package 目录：mac-x64 只在这里，linux-x64 两边都有，mac-arm64 的目录存在但没有安装包。"""
+    other = tmp_path / 'package_b'
+    make_zip(str(other / 'pkg-mac-intel-x64' / '灵犀·晓伴.zip'), '1.3.2', seed=4)
+    make_zip(str(other / 'pkg-linux-x64' / '灵犀·晓伴.zip'), '1.3.2', seed=5)
+    (other / 'pkg-mac-arm64').mkdir()
+    return [release_tree['pkgpath'], str(other)]
+
+
+def test_multiple_package_roots_are_merged_and_conflicts_reported(two_roots):
+    index = scan_package_index(two_roots)
+
+    first, second = two_roots
+    assert index['conflicts'] == {'linux-x64': [os.path.join(first, 'pkg-linux-x64', '灵犀·晓伴.zip'),
+                                                os.path.join(second, 'pkg-linux-x64', '灵犀·晓伴.zip')]}
+    assert index['sources']['mac-x64']['path'].startswith(second)
+    # 第二个目录中空的 pkg-mac-arm64 不算冲突，使用第一个目录中的安装包
+    assert index['sources']['mac-arm64']['path'].startswith(first) and index['sources']['mac-arm64']['exists']
+    assert os.path.join(second, 'pkg-mac-intel-x64') in index['pkg_dirs']
+
+
+def test_release_refuses_platforms_found_in_several_roots(release_tree, two_roots):
+    with pytest.raises(ValueError, match='linux-x64'):
+        _release(dict(release_tree, pkgpath=two_roots))
+
+    summary, _ = _release(dict(release_tree, pkgpath=two_roots), platforms=['mac-arm64', 'mac-x64'])
+    ups = [f for f in os.listdir(release_tree['uppath']) if f.startswith('gerenzhushou-1.3.2-')]
+    assert sorted(ups) == ['gerenzhushou-1.3.2-standard-darwin-arm64.zip', 'gerenzhushou-1.3.2-standard-darwin-intel-x64.zip']
+    # mac-x64 的安装包取自第二个目录
+    with open(os.path.join(two_roots[1], 'pkg-mac-intel-x64', '灵犀·晓伴.zip'), 'rb') as a, \
+            open(os.path.join(release_tree['uppath'], 'gerenzhushou-1.3.2-standard-darwin-intel-x64.zip'), 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_package_index_cache_rescans_only_after_changes(release_tree, monkeypatch):
+    scans = []
+    real_scan = rename_tool.scan_package_index
+    monkeypatch.setattr(rename_tool, 'scan_package_index', lambda *a, **k: scans.append(a) or real_scan(*a, **k))
+    cache = rename_tool.PackageIndexCache()
+    pkgpath = release_tree['pkgpath']
+
+    first = cache.get(pkgpath)
+    assert cache.get(pkgpath) is first and len(scans) == 1
+
+    # 源文件被重新写入（大小变化）
+    with open(os.path.join(pkgpath, 'pkg-linux-x64', '灵犀·晓伴.zip'), 'ab') as f:
+        f.write(b'more')
+    second = cache.get(pkgpath)
+    assert second is not first and len(scans) == 2
+
+    # 新的构建目录出现（package 目录的 mtime 变化）
+    make_zip(os.path.join(pkgpath, 'pkg-linux-arm64', '灵犀·晓伴.zip'), '1.3.2', seed=6)
+    assert cache.get(pkgpath)['sources']['linux-arm64']['exists'] and len(scans) == 3
+
+    cache.get(pkgpath, refresh=True)
+    cache.invalidate()
+    cache.get(pkgpath)
+    assert len(scans) == 5
+
+
+def test_format_plan_lists_every_step(release_tree, monkeypatch):
+    monkeypatch.setattr(rename_tool, 'free_space',
+                        lambda writes: [(release_tree['root'], sum(size for _, size in writes), 2 ** 30)])
+    index = rename_tool.PackageIndexCache().get(release_tree['pkgpath'])
+    plan = plan_release(index, '1.3.2', '20261018', PLATFORMS + ['linux-riscv'], release_tree['helppath'],
+                        release_tree['uppath'], release_tree['output_base'])
+    details = plan_details(plan, link_copies=True)
+
+    lines = format_plan(plan, notes=['生成差分升级包']).splitlines()
+
+    assert lines[0] == f'[DRY] 发布计划: {plan["out_dir"]}'
+    assert [line for line in lines if line.startswith('[DRY] MKDIR')] == \
+        [f'[DRY] MKDIR {plan["subdirs"][k]}' for k in ('mac', 'win', 'linux')]
+    # 每个平台一次复制、一个硬链接（同一设备上的升级包），帮助文档与 releases.json 逐个复制
+    links = [line for line in lines if line.startswith('[DRY] LINK')]
+    copies = [line for line in lines if line.startswith('[DRY] COPY')]
+    assert len(links) == details['linked'] == 3
+    assert len(copies) == len(details['steps']) - 3 and all(line.endswith(' MiB') for line in copies)
+    assert '[DRY] 警告: 未知平台: linux-riscv' in lines
+    assert '[DRY] 附加步骤: 生成差分升级包' in lines
+    assert any(line.startswith('[DRY] 空间: ') and line.endswith('（足够）') for line in lines)
+    assert lines[-1].startswith(f'[DRY] 合计: {len(details["steps"])} 个文件（复制 {len(copies)} 个，硬链接 3 个）')
+
+    # 已存在的输出标记为覆盖
+    _release(release_tree)
+    plan_details(plan, link_copies=True)
+    lines = format_plan(plan).splitlines()
+    assert lines[0].endswith('（已存在）')
+    assert any(line.endswith('[覆盖已有文件]') for line in lines)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import release_batch
+from release_batch import _ConflictScheduler, normalize_job, run_batch
+
+
+def _job(version, date='20261018', **kwargs):
+    # 不经过 normalize_job：它按 create_release 的签名校验字段，而测试中 create_release 被替换
+    return dict({'version': version, 'date': date, 'wps_version': ''}, **kwargs)
+
+
+@pytest.fixture
+def fake_release(monkeypatch):
+    """create_release 替身：记录每个任务的开始/结束顺序。"""
+    events = []
+    lock = threading.Lock()
+
+    def create_release(version, wps_version, date, index=None, log_callback=None, stop_event=None, **kwargs):
+        label = f'{version}/{date}'
+        with lock:
+            events.append(('start', label))
+        time.sleep(0.1)
+        with lock:
+            events.append(('end', label))
+        return {'out_dir': label}
+
+    monkeypatch.setattr(release_batch, 'create_release', create_release)
+    monkeypatch.setattr(release_batch, 'scan_package_index', lambda *a, **k: {'sources': {}})
+    return events
+
+
+def test_conflicting_jobs_run_in_file_order(tmp_path, fake_release):
+    up_a, up_b = str(tmp_path / 'up_a'), str(tmp_path / 'up_b')
+    jobs = [
+        _job('1.3.0', uppath=up_a, output_base=str(tmp_path)),
+        _job('1.3.1', uppath=up_a, output_base=str(tmp_path)),          # 与第 1 个任务共用 uppath
+        _job('1.3.2', uppath=up_b, output_base=str(tmp_path)),          # 独立
+        _job('1.3.2', '20261019', uppath=up_b, delete_existing=True),   # 独占
+        _job('1.3.3', uppath=str(tmp_path / 'up_c')),
+    ]
+
+    results = run_batch(jobs, workers=4, log=lambda msg, level: None)
+
+    assert [r['status'] for r in results] == ['ok'] * 5
+    order = [f'{kind} {label}' for kind, label in fake_release]
+    assert order.index('start 1.3.1/20261018') > order.index('end 1.3.0/20261018')
+    assert order.index('start 1.3.2/20261018') < order.index('end 1.3.0/20261018')
+    # 独占任务等待前面的全部任务，后面的任务也要等它结束
+    exclusive = order.index('start 1.3.2/20261019')
+    assert all(order.index(f'end {label}') < exclusive
+               for label in ('1.3.0/20261018', '1.3.1/20261018', '1.3.2/20261018'))
+    assert order.index('start 1.3.3/20261018') > order.index('end 1.3.2/20261019')
+
+
+def test_scheduler_blocks_on_earlier_unfinished_jobs(tmp_path):
+    out = str(tmp_path)
+    scheduler = _ConflictScheduler([_job('1.3.0', output_base=out, uppath='a'),
+                                    _job('1.3.0', output_base=out, uppath='b'),
+                                    _job('1.3.1', output_base=out, uppath='c')])
+
+    # 任务 1 与尚未开始的任务 0 写同一个主文件夹：即使任务 0 还没运行也要等待
+    assert scheduler._blocked(1) and not scheduler._blocked(2)
+    scheduler.acquire(0)
+    assert scheduler._blocked(1)
+    scheduler.release(0)
+    assert not scheduler._blocked(1)
+
+
+def test_normalize_job_rejects_unknown_and_reserved_fields():
+    with pytest.raises(ValueError, match='未知字段'):
+        normalize_job({'version': '1.3.2', 'date': '20261018', 'verison': 'typo'})
+    with pytest.raises(ValueError, match='未知字段'):
+        normalize_job({'version': '1.3.2', 'date': '20261018', 'stop_event': None})
+    with pytest.raises(ValueError, match='缺少'):
+        normalize_job({'version': '1.3.2'})
+    assert normalize_job({'date': '20261018'}, {'version': '1.3.2'})['wps_version'] == ''
@@ -0,0 +1,44 @@
+import os
+import zipfile
+
+from release_bundle import build_bundles
+
+
+def _release_folder(root, folders=3, files=300, size=64 * 1024):
+    out_main = root / 'release'
+    for i in range(folders):
+        d = out_main / f'platform{i}'
+        d.mkdir(parents=True)
+        for j in range(files):
+            (d / f'f{j}.bin').write_bytes(os.urandom(size))
+    return str(out_main)
+
+
+def test_bundles_are_built_for_each_folder(tmp_path):
+    out_main = _release_folder(tmp_path, files=3, size=1024)
+
+    results = build_bundles(out_main, workers=2)
+
+    assert [os.path.basename(r['file']) for r in results] == ['platform0.zip', 'platform1.zip', 'platform2.zip']
+    with zipfile.ZipFile(results[0]['file']) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == ['platform0/f0.bin', 'platform0/f1.bin', 'platform0/f2.bin']
+
+
+def test_stop_cancels_running_bundles_and_removes_partial_output(tmp_path):
+    out_main = _release_folder(tmp_path)
+    bundle_dir = tmp_path / 'bundles'
+    bundle_dir.mkdir()
+    logs = []
+
+    def started():
+        # 任一工作进程开始写临时文件后立即要求停止
+        return any(n.startswith('.tmp_bundle_') for n in os.listdir(bundle_dir))
+
+    results = build_bundles(out_main, bundle_dir=str(bundle_dir), workers=3, should_stop=started,
+                            log=lambda msg, level: logs.append((level, msg)))
+
+    assert ('warning', '打包被中止') in logs
+    # 正在压缩的任务被中止：没有残留的临时文件，也没有未计入结果的压缩包
+    assert sorted(os.listdir(bundle_dir)) == sorted(os.path.basename(r['file']) for r in results)
+    assert len(results) < 3
@@ -0,0 +1,189 @@
+import os
+import random
+import struct
+import zipfile
+
+import pytest
+
+from release_delta import (MIN_LITERAL_BUDGET, DeltaNotWorthwhile, apply_binary_delta, apply_zip_patch,
+                           build_deltas, create_binary_delta, create_zip_patch, file_sha256, verify_binary_delta,
+                           verify_zip_patch)
+
+
+def _write(path, data: bytes) -> str:
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def _random_bytes(n: int, seed: int) -> bytes:
+    return random.Random(seed).getrandbits(8 * n).to_bytes(n, 'little')
+
+
+@pytest.mark.parametrize('edit', ['same', 'insert', 'delete', 'replace', 'append', 'truncate'])
+def test_binary_delta_round_trip(tmp_path, edit):
+    base = _random_bytes(300_001, seed=1)
+    target = {
+        'same': base,
+        'insert': base[:123_457] + b'new bytes' + base[123_457:],
+        'delete': base[:50_000] + base[50_777:],
+        'replace': base[:200_000] + _random_bytes(5_000, seed=2) + base[205_000:],
+        'append': base + _random_bytes(10_000, seed=3),
+        'truncate': base[:1000],
+    }[edit]
+    base_path = _write(tmp_path / 'base', base)
+    target_path = _write(tmp_path / 'target', target)
+    delta_path = str(tmp_path / 'delta.bdiff')
+
+    info = create_binary_delta(base_path, target_path, delta_path)
+
+    out = str(tmp_path / 'out')
+    assert apply_binary_delta(base_path, delta_path, out) == info['target_sha256'] == file_sha256(target_path)
+    with open(out, 'rb') as f:
+        assert f.read() == target
+    assert verify_binary_delta(base_path, delta_path, target_path)
+
+
+def test_binary_delta_stays_small_after_insertion(tmp_path):
+    # 插入一个字节后其后的全部数据相对基准都错位了，滚动校验和仍应找到这些块
+    base = _random_bytes(2_000_001, seed=4)
+    base_path = _write(tmp_path / 'base', base)
+    target_path = _write(tmp_path / 'target', base[:1_000_000] + b'X' + base[1_000_000:])
+
+    info = create_binary_delta(base_path, target_path, str(tmp_path / 'delta.bdiff'))
+
+    assert info['size'] < 64 * 1024
+
+
+def test_binary_delta_empty_files(tmp_path):
+    empty = _write(tmp_path / 'empty', b'')
+    data = _write(tmp_path / 'data', b'abc' * 10)
+    for base, target in ((empty, data), (data, empty), (empty, empty)):
+        delta = str(tmp_path / 'delta.bdiff')
+        create_binary_delta(base, target, delta)
+        assert verify_binary_delta(base, delta, target)
+
+
+def _delta(tmp_path):
+    base = _random_bytes(100_000, seed=5)
+    target = base[:40_000] + _random_bytes(3_000, seed=6) + base[40_000:]
+    base_path = _write(tmp_path / 'base', base)
+    target_path = _write(tmp_path / 'target', target)
+    delta_path = str(tmp_path / 'delta.bdiff')
+    create_binary_delta(base_path, target_path, delta_path)
+    with open(delta_path, 'rb') as f:
+        return base_path, target_path, delta_path, f.read()
+
+
+def _first_data_op(data: bytes) -> int:
+    """跳过头部与 COPY 操作，返回第一个 DATA 操作码的偏移。"""
+    pos = struct.calcsize('>8sQ32sQ32sI')
+    while data[pos] == 1:
+        pos += 17
+    assert data[pos] == 2
+    return pos
+
+
+def _leftovers(directory):
+    return [n for n in os.listdir(directory) if n.startswith('.tmp')]
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'zlib', 'length'])
+def test_corrupt_delta_raises_value_error_and_leaves_no_output(tmp_path, damage):
+    base_path, target_path, delta_path, data = _delta(tmp_path)
+    data_op = _first_data_op(data)
+    if damage == 'truncate':
+        data = data[:-20]
+    elif damage == 'zlib':
+        # 破坏 DATA 块的 zlib 头部
+        data = data[:data_op + 9] + b'\xff\xff' + data[data_op + 11:]
+    else:
+        # 操作码之后只剩半个 COPY 参数：struct.error
+        data = data[:data_op] + bytes([1]) + b'\x00' * 4
+    _write(delta_path, data)
+    out = tmp_path / 'out'
+
+    with pytest.raises(ValueError):
+        apply_binary_delta(base_path, delta_path, str(out))
+
+    assert not out.exists() and _leftovers(tmp_path) == []
+    assert not verify_binary_delta(base_path, delta_path, target_path)
+
+
+def test_apply_rejects_base_with_different_content(tmp_path):
+    base_path, _, delta_path, _ = _delta(tmp_path)
+    other = _write(tmp_path / 'other', _random_bytes(os.path.getsize(base_path), seed=7))
+    out = tmp_path / 'out'
+    out.write_bytes(b'previous')
+
+    with pytest.raises(ValueError, match='基准文件内容'):
+        apply_binary_delta(other, delta_path, str(out))
+
+    # 失败时不覆盖已有的输出
+    assert out.read_bytes() == b'previous' and _leftovers(tmp_path) == []
+
+
+def test_unrelated_target_is_skipped(tmp_path):
+    base = _write(tmp_path / 'base.zip', _random_bytes(2 * MIN_LITERAL_BUDGET, seed=8))
+    target = _write(tmp_path / 'target.zip', _random_bytes(2 * MIN_LITERAL_BUDGET, seed=9))
+
+    with pytest.raises(DeltaNotWorthwhile):
+        create_binary_delta(base, target, str(tmp_path / 'delta.bdiff'))
+    assert sorted(os.listdir(tmp_path)) == ['base.zip', 'target.zip']
+
+    os.rename(base, tmp_path / 'gerenzhushou-1.3.1-standard-linux-x64.zip')
+    logs = []
+    entries = build_deltas([('linux-x64', '1.3.2', target)], ['1.3.1', '1.3.2'], str(tmp_path), str(tmp_path),
+                           False, lambda msg, level: logs.append((level, msg)))
+    assert entries == []
+    assert [level for level, msg in logs if '差分收益过低' in msg] == ['warning']
+
+
+
+_OLD = (2026, 1, 1, 0, 0, 0)
+_NEW = (2026, 10, 18, 12, 0, 0)
+
+
+def _zip(path, changes=None) -> str:
+    """写入 8 个 deflate 条目的 zip；changes 把第 3 个条目的 data / date_time / extra 替换掉。"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(8):
+            fields = {'data': _random_bytes(20_000, seed=i), 'date_time': _OLD, 'extra': b''}
+            if i == 3:
+                fields.update(changes or {})
+            info = zipfile.ZipInfo(f'lib/m{i}.py', date_time=fields['date_time'])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.extra = fields['extra']
+            zf.writestr(info, fields['data'])
+    return str(path)
+
+
+@pytest.mark.parametrize('changes', [
+    {'data': b'changed'},
+    {'date_time': _NEW},
+    {'extra': b'\xfe\xca\x04\x00abcd'},
+], ids=['data', 'mtime', 'extra'])
+def test_zip_patch_rebuilds_identical_bytes(tmp_path, changes):
+    base = _zip(tmp_path / 'base.zip')
+    target = _zip(tmp_path / 'target.zip', changes)
+    patch = str(tmp_path / 'p.zpatch')
+
+    info = create_zip_patch(base, target, patch)
+
+    # 只改修改时间或 extra 的条目内容（CRC/大小）不变，也必须进入补丁
+    assert info['changed'] == 1 and info['unchanged'] == 7
+    out = str(tmp_path / 'out.zip')
+    apply_zip_patch(base, patch, out)
+    assert file_sha256(out) == file_sha256(target)
+    assert verify_zip_patch(base, patch, target)
+
+
+def test_verify_zip_patch_rejects_header_only_mismatch(tmp_path):
+    base = _zip(tmp_path / 'base.zip')
+    patch = str(tmp_path / 'p.zpatch')
+    create_zip_patch(base, base, patch)
+    # 与基准包条目的 CRC/大小完全相同，只有修改时间不同
+    other = _zip(tmp_path / 'other.zip', {'date_time': _NEW})
+
+    assert verify_zip_patch(base, patch, base)
+    assert not verify_zip_patch(base, patch, other)
@@ -0,0 +1,143 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import release_service
+from release_service import JobStore, ReleaseService, ServiceHTTPServer
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def _job(version, **kwargs):
+    return dict({'version': version, 'date': '20261018', 'wps_version': ''}, **kwargs)
+
+
+def test_add_event_numbers_events_without_gaps_across_threads(store):
+    job_id = store.add(_job('1.3.2'))
+    errors = []
+
+    def _log():
+        for i in range(200):
+            try:
+                store.add_event(job_id, 'log', f'{i}', level='info')
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=_log) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert [ev['seq'] for ev in store.events(job_id)] == list(range(1, 801))
+
+
+def test_claim_cancel_and_recover(store):
+    first, second, third = (store.add(_job(v)) for v in ('1.3.0', '1.3.1', '1.3.2'))
+
+    assert [j['id'] for j in store.queued()] == [first, second, third]
+    assert store.claim(first)
+    # 已被其他线程领取或已取消的任务不能再领取
+    assert not store.claim(first)
+    assert store.cancel_queued(second)
+    assert not store.claim(second)
+    assert [j['id'] for j in store.queued()] == [third]
+
+    # 服务重启：上次运行中的任务标记为失败
+    assert store.recover() == 1
+    assert store.get(first)['status'] == 'failed'
+
+
+def test_pick_skips_jobs_that_conflict_with_running_or_earlier_jobs(store, tmp_path):
+    out_a, out_b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    up_a, up_b = str(tmp_path / 'up_a'), str(tmp_path / 'up_b')
+    running = store.add(_job('1.3.0', output_base=out_a, uppath=up_a))
+    same_up = store.add(_job('1.3.1', output_base=out_b, uppath=up_a))
+    independent = store.add(_job('1.3.2', output_base=out_b, uppath=up_b))
+    # 与更早排队的 same_up 写同一个主文件夹，必须排在它后面
+    after_same_up = store.add(_job('1.3.1', output_base=out_b, uppath=str(tmp_path / 'up_c')))
+    service = ReleaseService(store)
+    store.claim(running)
+    service._running[running] = (release_service.conflict_keys(store.get(running)['params']), threading.Event())
+
+    assert service._pick()['id'] == independent
+    store.claim(independent)
+    service._running[independent] = (release_service.conflict_keys(store.get(independent)['params']),
+                                      threading.Event())
+    assert service._pick() is None
+
+    del service._running[running]
+    assert service._pick()['id'] == same_up
+    store.claim(same_up)
+    service._running[same_up] = (release_service.conflict_keys(store.get(same_up)['params']), threading.Event())
+    assert service._pick() is None
+
+    del service._running[same_up]
+    assert service._pick()['id'] == after_same_up
+
+
+def test_stop_waits_for_running_jobs(store, monkeypatch):
+    finished = threading.Event()
+
+    def fake_release(log_callback, progress_callback, stop_event, **params):
+        log_callback('开始', 'info')
+        stop_event.wait(10)
+        time.sleep(0.2)  # 模拟收到停止信号后收尾写盘
+        finished.set()
+        return {'status': 'stopped'}
+
+    monkeypatch.setattr(release_service, 'create_release', fake_release)
+    service = ReleaseService(store, workers=1)
+    service.start()
+    job_id = service.submit(_job('1.3.2'))
+    deadline = time.monotonic() + 5
+    while store.get(job_id)['status'] != 'running' and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert service.stop(timeout=5)
+    assert finished.is_set()
+    assert store.get(job_id)['status'] == 'stopped'
+
+
+def _read_sse(port, job_id, last_event_id=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', f'/jobs/{job_id}/events', headers={'Last-Event-ID': last_event_id} if last_event_id else {})
+    resp = conn.getresponse()
+    events, current = [], {}
+    for raw in resp:
+        line = raw.decode('utf-8').rstrip('\n')
+        if line.startswith('id: '):
+            current['id'] = int(line[4:])
+        elif line.startswith('data: '):
+            current['message'] = json.loads(line[6:])['message']
+        elif not line and current:
+            events.append(current)
+            current = {}
+    conn.close()
+    return events
+
+
+def test_event_stream_resumes_after_last_event_id(store):
+    service = ReleaseService(store)
+    server = ServiceHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        job_id = store.add(_job('1.3.2'))
+        for msg in ('queued', 'running', 'a', 'b', 'done'):
+            store.add_event(job_id, 'log', msg)
+        store.finish(job_id, 'done', {})
+        port = server.server_address[1]
+
+        assert [ev['message'] for ev in _read_sse(port, job_id)] == ['queued', 'running', 'a', 'b', 'done']
+        resumed = _read_sse(port, job_id, last_event_id='3')
+        assert [(ev['id'], ev['message']) for ev in resumed] == [(4, 'b'), (5, 'done')]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import release_watcher
+from release_watcher import ReleaseWatcher
+
+PLATFORMS = ['linux-x64', 'mac-arm64', 'win-x64']
+
+
+def _watcher(tree, **kwargs):
+    logs = []
+    kwargs.setdefault('settle', 10.0)
+    watcher = ReleaseWatcher(tree['pkgpath'], tree['helppath'], PLATFORMS, use_inotify=False,
+                             log=lambda msg, level='info': logs.append((level, msg)), **kwargs)
+    return watcher, logs
+
+
+def test_artifacts_must_stay_unchanged_for_the_settle_period(release_tree):
+    watcher, _ = _watcher(release_tree)
+    linux = os.path.join(release_tree['pkgpath'], 'pkg-linux-x64', '灵犀·晓伴.zip')
+
+    status = watcher.check(now=100.0)
+    assert not status['ready'] and status['settling'] == PLATFORMS and status['next_check'] == 10.0
+    status = watcher.check(now=109.0)
+    assert status['settling'] == PLATFORMS and status['next_check'] == 1.0
+
+    # 稳定期内文件仍在写入：该平台重新开始计时，其余平台不受影响
+    with open(linux, 'ab') as f:
+        f.write(b'more')
+    status = watcher.check(now=111.0)
+    assert status['settling'] == ['linux-x64'] and status['next_check'] == 10.0
+    status = watcher.check(now=121.0)
+    assert status['ready'] and status['settling'] == []
+    assert dict((p, size) for p, _, size, _ in status['signature'])['linux-x64'] == os.path.getsize(linux)
+
+
+def test_missing_platform_blocks_release(release_tree):
+    watcher, _ = _watcher(release_tree, settle=0)
+    os.remove(os.path.join(release_tree['pkgpath'], 'pkg-mac-arm64', '灵犀·晓伴.zip'))
+
+    status = watcher.check(now=0.0)
+
+    assert not status['ready'] and status['missing'] == ['mac-arm64']
+
+
+def _run(watcher, seconds):
+    stop = threading.Event()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(watcher.run(stop)))
+    thread.start()
+    thread.join(seconds)
+    stop.set()
+    thread.join(5)
+    return result[0]
+
+
+def test_failed_release_is_retried_and_success_is_not_repeated(release_tree, monkeypatch):
+    calls = []
+
+    def fake_release(version, wps_version, date, **kwargs):
+        calls.append(version)
+        if len(calls) == 1:
+            raise RuntimeError('源文件校验失败')
+        return {'out_dir': 'out'}
+
+    monkeypatch.setattr(release_watcher, 'create_release', fake_release)
+    watcher, logs = _watcher(release_tree, settle=0, poll=0.02, retry=0.1)
+
+    # 第一次失败不记为已发布，retry 后重试成功；之后同一组源文件不再触发
+    assert _run(watcher, 0.6) == 1
+    assert calls == ['1.3.2', '1.3.2']
+    assert any('发布失败' in m for level, m in logs if level == 'error')
+
+
+def test_unknown_version_is_not_marked_released(release_tree, monkeypatch):
+    calls = []
+    monkeypatch.setattr(release_watcher, 'create_release', lambda *a, **k: calls.append(a) or {'out_dir': 'out'})
+    releases = os.path.join(release_tree['helppath'], 'releases.json')
+    content = open(releases, encoding='utf-8').read()
+    os.remove(releases)
+    watcher, _ = _watcher(release_tree, settle=0, poll=0.02, retry=0.05, once=True)
+    status = watcher.check()
+    assert not watcher._trigger(status['signature'], threading.Event())
+
+    # releases.json 补上之后同一组源文件仍会发布
+    with open(releases, 'w', encoding='utf-8') as f:
+        f.write(content)
+    assert _run(watcher, 2.0) == 1
+    assert len(calls) == 1
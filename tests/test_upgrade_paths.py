@@ -0,0 +1,51 @@
+from release_delta import plan_upgrade_paths
+
+VERSIONS = ['1.2.0', '1.3.0', '1.3.1', '1.3.2']
+FULL = {'platform': 'linux-x64', 'version': '1.3.2', 'file': 'full.zip', 'size': 1000}
+
+
+def _delta(src, dst, size, platform='linux-x64'):
+    return {'platform': platform, 'from': src, 'to': dst, 'file': f'{src}-to-{dst}', 'size': size}
+
+
+def _routes(deltas, packages=(FULL,)):
+    return plan_upgrade_paths(VERSIONS, list(packages), deltas)['linux-x64']['from']
+
+
+def test_chains_deltas_along_the_cheapest_path():
+    routes = _routes([
+        _delta('1.2.0', '1.3.0', 100), _delta('1.3.0', '1.3.1', 100), _delta('1.3.1', '1.3.2', 100),
+        # 直达差分比串联的三段更大，不应被选中
+        _delta('1.2.0', '1.3.2', 400),
+        # 跳过 1.3.1 的差分比两段串联更小
+        _delta('1.3.0', '1.3.2', 150),
+    ])
+
+    assert routes['1.2.0'] == {'method': 'delta', 'steps': ['1.2.0-to-1.3.0', '1.3.0-to-1.3.2'], 'bytes': 250}
+    assert routes['1.3.0'] == {'method': 'delta', 'steps': ['1.3.0-to-1.3.2'], 'bytes': 150}
+    assert routes['1.3.1'] == {'method': 'delta', 'steps': ['1.3.1-to-1.3.2'], 'bytes': 100}
+    assert '1.3.2' not in routes
+
+
+def test_falls_back_to_the_full_package():
+    routes = _routes([
+        _delta('1.2.0', '1.3.0', 600), _delta('1.3.0', '1.3.2', 500),
+        # 与完整包一样大时选完整包
+        _delta('1.3.1', '1.3.2', 1000),
+        # 其他平台的差分不参与
+        _delta('1.2.0', '1.3.2', 1, platform='win32-x64'),
+    ])
+
+    full = {'method': 'full', 'steps': ['full.zip'], 'bytes': 1000}
+    assert routes['1.2.0'] == full
+    assert routes['1.3.0'] == {'method': 'delta', 'steps': ['1.3.0-to-1.3.2'], 'bytes': 500}
+    assert routes['1.3.1'] == full
+
+
+def test_versions_without_deltas_download_the_full_package():
+    plans = plan_upgrade_paths(VERSIONS, [FULL, dict(FULL, platform='win32-x64', file='win.zip')], [])
+
+    assert set(plans) == {'linux-x64', 'win32-x64'}
+    assert plans['win32-x64']['target'] == '1.3.2'
+    assert all(r['method'] == 'full' for p in plans.values() for r in p['from'].values())
+    assert set(plans['linux-x64']['from']) == {'1.2.0', '1.3.0', '1.3.1'}